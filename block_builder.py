@@ -0,0 +1,255 @@
+# block_builder.py - Mempool + block builder: pending transfers sealed into hashed, linked blocks
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# ─── CONFIG ────────────────────────────────────────
+BLOCK_MAX_TXS     = int(os.getenv("BLOCK_MAX_TXS", os.getenv("TRANSFER_MAX_BATCH", 256)))
+BLOCK_MAX_LATENCY = float(os.getenv("BLOCK_MAX_LATENCY_MS", os.getenv("TRANSFER_MAX_WAIT_MS", 2))) / 1000
+ZERO_HASH         = "0" * 64   # previous_hash του πρώτου block, όπως στο thronos_blockchain.json
+
+
+class TransferRejected(Exception):
+    """Transfer did not pass validation (e.g. insufficient balance)."""
+
+
+# ─── HASHING ───────────────────────────────────────
+def _digest(obj):
+    # ίδια σειριοποίηση με τα hash του thronos_blockchain.json (sort_keys, default separators)
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+def tx_id(tx):
+    """sha256 of the canonical JSON of a transfer, without its own ``txid``."""
+    return _digest({k: v for k, v in tx.items() if k != "txid"})
+
+def stamp_tx(tx):
+    """
+    Give a transfer its id, once: a random ``nonce`` (two identical
+    transfers in the same second must not share a txid) and then ``txid``.
+    """
+    if "txid" not in tx:
+        tx.setdefault("nonce", uuid.uuid4().hex)
+        tx["txid"] = tx_id(tx)
+    return tx["txid"]
+
+def merkle_root(txids):
+    """Pairwise sha256 over the txids, duplicating the last one on odd levels (as in Bitcoin)."""
+    if not txids:
+        return ZERO_HASH
+    level = [bytes.fromhex(t) for t in txids]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+def header_hash(record):
+    """
+    Hash of a chain record's header: every field except ``hash`` itself and
+    the ``transactions`` list, which the header commits to via ``merkle_root``.
+    """
+    if not isinstance(record, dict):
+        return _digest(record)
+    return _digest({k: v for k, v in record.items() if k not in ("hash", "transactions")})
+
+def record_hash(record):
+    """What the next block's ``previous_hash`` points at; legacy records without ``hash`` are hashed on the fly."""
+    if record is None:
+        return ZERO_HASH
+    if isinstance(record, dict) and record.get("hash"):
+        return record["hash"]
+    return header_hash(record)
+
+def link_record(record, previous):
+    """Stamp ``previous_hash`` and ``hash`` onto a record about to be appended after ``previous``."""
+    record["previous_hash"] = record_hash(previous)
+    record["hash"] = header_hash(record)
+    return record
+
+def seal_block(height, previous, txs, timestamp=None):
+    """Block record holding ``txs`` at ``height``, linked to the ``previous`` chain record."""
+    for tx in txs:
+        stamp_tx(tx)
+    block = {
+        "type":        "block",
+        "index":       height,
+        "timestamp":   timestamp or time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
+        "merkle_root": merkle_root([tx["txid"] for tx in txs]),
+        "tx_count":    len(txs),
+        "transactions": txs
+    }
+    return link_record(block, previous)
+
+
+# ─── MEMPOOL ───────────────────────────────────────
+class Mempool:
+    """
+    Pending transfers in arrival order.
+
+    ``add`` stamps the txid and returns a Future that the block builder
+    resolves once the transfer is in a committed block (or rejected).
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+
+    def add(self, tx):
+        stamp_tx(tx)
+        fut = Future()
+        with self._cond:
+            self._pending.append((tx, fut))
+            self._cond.notify()
+        return fut
+
+    def take(self, max_txs, max_wait):
+        """
+        Block until something is pending, then wait up to ``max_wait`` for
+        ``max_txs`` transfers to pile up and return at most that many.
+        """
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + max_wait
+            while len(self._pending) < max_txs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(max_txs, len(self._pending))
+            return [self._pending.popleft() for _ in range(n)]
+
+    def pending(self):
+        """Snapshot of the transfers waiting for a block."""
+        with self._cond:
+            return [tx for tx, _ in self._pending]
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+
+# ─── BLOCK BUILDER ─────────────────────────────────
+class BlockBuilder:
+    """
+    Seals mempool transfers into blocks.
+
+    A single worker takes up to ``max_txs`` pending transfers, waiting at
+    most ``max_latency`` seconds after the first one arrives. Inside the
+    storage write transaction (``Storage.extend`` prepare hook) each
+    transfer is checked against current balances plus the earlier ones in
+    the same block, and the accepted ones are sealed into one block with a
+    Merkle root, linked to the chain tip by ``previous_hash``. One block is
+    one record and one durable commit, however many transfers it carries.
+    """
+
+    def __init__(self, store, mempool, max_txs=BLOCK_MAX_TXS, max_latency=BLOCK_MAX_LATENCY):
+        self.store = store
+        self.mempool = mempool
+        self.max_txs = max_txs
+        self.max_latency = max_latency
+        self.stats = {"blocks": 0, "accepted": 0, "rejected": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self.mempool.take(self.max_txs, self.max_latency)
+            try:
+                self._commit(batch)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _commit(self, batch):
+        rejected = {}
+
+        def build(height, records):
+            accepted = []
+            delta = {}  # μεταβολές από προηγούμενα tx του ίδιου block
+            for i, tx in enumerate(records):
+                frm, to_ = tx["from"], tx["to"]
+                total = round(tx["amount"] + tx.get("fee", 0), 6)
+                available = round(self.store.balance(frm) + delta.get(frm, 0.0), 6)
+                if available < total:
+                    rejected[i] = "Insufficient balance"
+                    continue
+                delta[frm] = delta.get(frm, 0.0) - total
+                delta[to_] = delta.get(to_, 0.0) + tx["amount"]
+                accepted.append(tx)
+            if not accepted:
+                return []
+            return [seal_block(height, self.store.tip(), accepted)]
+
+        self.store.extend([tx for tx, _ in batch], prepare=build)
+
+        if len(rejected) < len(batch):
+            self.stats["blocks"] += 1
+        self.stats["rejected"] += len(rejected)
+        self.stats["accepted"] += len(batch) - len(rejected)
+        for i, (tx, fut) in enumerate(batch):
+            if i in rejected:
+                fut.set_exception(TransferRejected(rejected[i]))
+            else:
+                fut.set_result(tx)
+
+
+def benchmark(backend="json", clients=32, per_client=300, configs=((1, 0), (64, 0.002), (256, 0.002), (1024, 0.01))):
+    """Throughput and submit→commit latency for a few (max_txs, max_latency) settings."""
+    import tempfile
+    from storage import JsonStorage, SqliteStorage
+
+    print(f"[{backend}] {clients} clients × {per_client} transfers")
+    for max_txs, max_latency in configs:
+        with tempfile.TemporaryDirectory() as tmp:
+            if backend == "sqlite":
+                store = SqliteStorage(os.path.join(tmp, "thronos.db"))
+            else:
+                p = lambda name: os.path.join(tmp, name)
+                store = JsonStorage(p("chain.json"), p("ledger.json"), p("chain.idx"), p("pledges.json"))
+                store.chain.compact_every = 10 ** 9
+            senders = [f"THR{i:06d}" for i in range(clients)]
+            store.extend([{"thr_address": a, "reward_to_miner": 1000.0} for a in senders])
+            builder = BlockBuilder(store, Mempool(), max_txs, max_latency)
+            latencies = []
+            lock = threading.Lock()
+
+            def client(frm):
+                mine = []
+                for i in range(per_client):
+                    t0 = time.perf_counter()
+                    builder.mempool.add({"from": frm, "to": "THRSINK", "amount": 0.01,
+                                         "fee": 0.0015, "nonce": i}).result(30)
+                    mine.append(time.perf_counter() - t0)
+                with lock:
+                    latencies.extend(mine)
+
+            t0 = time.perf_counter()
+            threads = [threading.Thread(target=client, args=(a,)) for a in senders]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+
+            latencies.sort()
+            n = len(latencies)
+            p50, p99 = latencies[n // 2] * 1000, latencies[int(n * 0.99)] * 1000
+            blocks = builder.stats["blocks"]
+            print(f"max_txs={max_txs:>5} max_latency={max_latency * 1000:>4.0f}ms: {n / elapsed:>8,.0f} tx/s | "
+                  f"p50 {p50:6.1f}ms p99 {p99:6.1f}ms | {blocks} blocks, {n / max(blocks, 1):.1f} tx/block")
+            store.close()
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(sys.argv[2] if len(sys.argv) > 2 else "json")
+    else:
+        print("Usage: python block_builder.py bench [json|sqlite]")
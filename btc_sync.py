@@ -0,0 +1,209 @@
+# btc_sync.py - Incremental per-address BTC sync with watermarks and a processed-txid set
+import os
+import json
+import threading
+
+from phantom_gateway_mainnet import esplora_get
+
+# ─── CONFIG ────────────────────────────────────────
+SYNC_STATE     = os.getenv("BTC_SYNC_STATE", "btc_sync_state.json")          # watermarks
+SYNC_PROCESSED = os.getenv("BTC_SYNC_PROCESSED", "btc_sync_processed.txt")   # ένα txid ανά γραμμή
+CHAIN_PAGE     = 25          # confirmed txs ανά σελίδα του Esplora
+MAX_PAGES      = int(os.getenv("BTC_SYNC_MAX_PAGES", 40))   # όριο σελίδων ανά poll (πρώτο sync / μεγάλο κενό)
+
+
+class AddressSync:
+    """
+    Pulls only the transactions an address received since the last poll.
+
+    Each address has a watermark: the txid and block height of the newest
+    confirmed tx already synced. A poll reads ``/address/<a>/txs``
+    (mempool + newest confirmed page) and walks older pages only until it
+    meets the watermark, so a steady-state poll is one request however long
+    the history is. Processed ``address:txid`` keys are kept in an
+    append-only file, so a tx is handed to the handler once per address
+    even across restarts, mempool → confirmed transitions and overlapping
+    pages (a tx touching two watched addresses reaches both).
+
+    A first poll (no watermark yet) only takes the first page; older
+    history is not replayed. A poll reads at most ``max_pages`` pages: if
+    the watermark is further behind, the unread stretch is kept with it as
+    a gap (resume cursor = oldest txid read, plus where the gap ends) and
+    later polls page through it before anything else moves — nothing
+    between the old watermark and the newest page is skipped.
+    """
+
+    def __init__(self, state_path=SYNC_STATE, processed_path=SYNC_PROCESSED, max_pages=MAX_PAGES):
+        self.state_path = state_path
+        self.processed_path = processed_path
+        self.max_pages = max_pages
+        self.watermarks = {}
+        self.processed = set()
+        self.stats = {"polls": 0, "requests": 0, "new": 0}
+        self._lock = threading.RLock()
+        self._addr_locks = {}
+        self._load()
+
+    # ─── STATE ─────────────────────────────────────
+    def _load(self):
+        try:
+            with open(self.state_path, "r") as f:
+                self.watermarks = json.load(f).get("watermarks", {})
+        except (FileNotFoundError, ValueError):
+            self.watermarks = {}
+        try:
+            with open(self.processed_path, "r") as f:
+                self.processed = {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            self.processed = set()
+
+    def _save_watermarks(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"watermarks": self.watermarks}, f, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def mark_processed(self, key):
+        with self._lock:
+            if key in self.processed:
+                return
+            self.processed.add(key)
+            with open(self.processed_path, "a") as f:
+                f.write(key + "\n")
+
+    def is_processed(self, key):
+        with self._lock:
+            return key in self.processed
+
+    def save(self):
+        with self._lock:
+            self._save_watermarks()
+
+    def watermark(self, address):
+        with self._lock:
+            return self.watermarks.get(address)
+
+    # ─── SYNC ──────────────────────────────────────
+    def _get(self, path):
+        self.stats["requests"] += 1
+        return esplora_get(path)
+
+    def _walk(self, address, confirmed, stop, budget):
+        """
+        Confirmed txs from page ``confirmed`` back to ``stop`` (exclusive),
+        newest first, reading at most ``budget`` pages in all. Returns
+        ``(txs, cursor, pages)``; ``cursor`` is the oldest txid read when
+        the budget ran out before ``stop``, else None.
+        """
+        new, pages = [], 1
+        while True:
+            for tx in confirmed:
+                if stop and (tx["txid"] == stop["txid"] or tx["status"].get("block_height", 0) < stop["height"]):
+                    return new, None, pages
+                new.append(tx)
+            if stop is None or len(confirmed) < CHAIN_PAGE:
+                return new, None, pages
+            if pages >= budget:
+                return new, confirmed[-1]["txid"], pages
+            # το stop δεν ήρθε ακόμη: μία σελίδα πιο πίσω
+            confirmed = self._get(f"/address/{address}/txs/chain/{confirmed[-1]['txid']}")
+            pages += 1
+
+    def fetch_new(self, address, include_mempool=True):
+        """
+        Transactions newer than the watermark or inside one of its gaps,
+        oldest first, plus the new watermark (None if nothing is confirmed
+        yet). The watermark is ``{"txid", "height"}`` of the newest synced
+        tx, with ``"gaps"`` — ``{"cursor", "until"}`` stretches still to
+        read, newest first — when a poll ran out of pages.
+        """
+        wm = self.watermark(address)
+        top = {"txid": wm["txid"], "height": wm["height"]} if wm else None
+        gaps = list(wm.get("gaps", [])) if wm else []
+        page = self._get(f"/address/{address}/txs")
+        mempool = [tx for tx in page if not tx.get("status", {}).get("confirmed")]
+        confirmed = [tx for tx in page if tx.get("status", {}).get("confirmed")]
+
+        new, cursor, pages = self._walk(address, confirmed, top, self.max_pages)
+        if cursor:
+            # πάνω από max_pages σελίδες πίσω: το υπόλοιπο μένει gap, δεν προσπερνιέται
+            gaps.insert(0, {"cursor": cursor, "until": top})
+            print(f"⚠️ {address}: more than {self.max_pages} pages behind, resuming from {cursor} next poll")
+        if new:
+            top = {"txid": new[0]["txid"], "height": new[0]["status"].get("block_height", 0)}
+        budget, left = self.max_pages - pages, []
+        for gap in gaps:
+            if budget < 1:
+                left.append(gap)
+                continue
+            page = self._get(f"/address/{address}/txs/chain/{gap['cursor']}")
+            older, gap_cursor, pages = self._walk(address, page, gap["until"], budget)
+            budget -= pages
+            new += older
+            if gap_cursor:
+                left.append({"cursor": gap_cursor, "until": gap["until"]})
+
+        new_wm = dict(top, gaps=left) if top and left else top
+        txs = (mempool if include_mempool else []) + new
+        txs.reverse()   # παλαιότερα πρώτα
+        return txs, new_wm
+
+    def _address_lock(self, address):
+        with self._lock:
+            return self._addr_locks.setdefault(address, threading.Lock())
+
+    def sync(self, address, handler, include_mempool=True, save=True):
+        """
+        Feed ``handler(tx)`` every not-yet-processed tx since the watermark,
+        oldest first, then advance the watermark. Returns how many were new.
+
+        Different addresses can sync concurrently; the HTTP part runs
+        without the shared lock. With ``save=False`` the watermark file is
+        only written by a later ``save()`` (many addresses: one write per
+        round instead of one per address; a lost write only means pages
+        are re-read and filtered by the processed set).
+        """
+        with self._address_lock(address):
+            txs, new_wm = self.fetch_new(address, include_mempool)
+            return self._process(address, txs, new_wm, handler, save)
+
+    def _process(self, address, txs, new_wm, handler, save):
+        with self._lock:
+            self.stats["polls"] += 1
+            count = 0
+            for tx in txs:
+                key = f"{address}:{tx['txid']}"
+                if key in self.processed or tx["txid"] in self.processed:   # σκέτο txid: παλιά αρχεία
+                    continue
+                handler(tx)
+                self.mark_processed(key)
+                count += 1
+            if new_wm and new_wm != self.watermarks.get(address):
+                self.watermarks[address] = new_wm
+                if save:
+                    self._save_watermarks()
+            self.stats["new"] += count
+            return count
+
+
+_syncs = {}
+_syncs_lock = threading.Lock()
+
+def open_sync(state_path=SYNC_STATE, processed_path=SYNC_PROCESSED):
+    """Shared AddressSync per state file."""
+    key = os.path.abspath(state_path)
+    with _syncs_lock:
+        if key not in _syncs:
+            _syncs[key] = AddressSync(state_path, processed_path)
+        return _syncs[key]
+
+
+if __name__ == "__main__":
+    import sys
+    # python btc_sync.py <btc_address>   → ένα poll, τυπώνει τα νέα tx
+    if len(sys.argv) < 2:
+        print("Usage: python btc_sync.py <btc_address>")
+        sys.exit(1)
+    sync = open_sync()
+    n = sync.sync(sys.argv[1], lambda tx: print(f"→ {tx['txid']}"))
+    print(f"{n} new tx(s), watermark {sync.watermark(sys.argv[1])}, {sync.stats['requests']} request(s)")
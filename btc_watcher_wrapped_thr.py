@@ -1,48 +1,403 @@
-
-import requests
+# btc_watcher_wrapped_thr.py - Multi-address BTC watcher → append-only wrapped-THR ledger (NDJSON)
+import os
 import json
-from datetime import datetime
+import time
+import heapq
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from btc_sync import AddressSync
+
+# ─── CONFIG ────────────────────────────────────────
+WATCH_CONFIG  = os.getenv("WRAPPED_WATCH_CONFIG", "wrapped_watch_addresses.txt")   # μία διεύθυνση ανά γραμμή ή JSON λίστα
+LEDGER_FILE   = os.getenv("WRAPPED_LEDGER", "wrapped_thr_ledger.ndjson")
+LEGACY_LEDGER = os.getenv("WRAPPED_LEGACY_LEDGER", "wrapped_thr_ledger.json")   # JSON λίστα του παλιού script
+STATUS_FILE   = os.getenv("WRAPPED_STATUS", "wrapped_watch_status.json")
+SYNC_STATE    = os.getenv("WRAPPED_SYNC_STATE", "wrapped_sync_state.json")
+SYNC_SEEN     = os.getenv("WRAPPED_SYNC_PROCESSED", "wrapped_sync_processed.txt")
+THRESHOLD_BTC = float(os.getenv("WRAPPED_THRESHOLD_BTC", 0.001))   # κατώφλι μικροσυναλλαγής
+THR_PER_BTC   = 100000                                             # conversion rate
+MIN_INTERVAL  = float(os.getenv("WRAPPED_MIN_INTERVAL", 60))       # ενεργές διευθύνσεις
+MAX_INTERVAL  = float(os.getenv("WRAPPED_MAX_INTERVAL", 3600))     # αδρανείς διευθύνσεις
+WORKERS       = int(os.getenv("WRAPPED_WORKERS", 8))
+BUDGET_SHARE  = float(os.getenv("WRAPPED_BUDGET_SHARE", 0.8))    # μέρος του Esplora rate limit για τον watcher
+STATUS_EVERY  = 30                                                 # δευτερόλεπτα
+
+
+def load_addresses(path=WATCH_CONFIG):
+    """Addresses from a JSON list / {"addresses": [...]} or a text file (one per line, # comments)."""
+    with open(path, "r") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        addrs = data.get("addresses", []) if isinstance(data, dict) else data
+    except ValueError:
+        addrs = [line.split("#", 1)[0].strip() for line in text.splitlines()]
+    return list(dict.fromkeys(a for a in addrs if a))
+
+
+def wrap_outputs(tx, address, threshold=THRESHOLD_BTC):
+    """Wrapped-THR entries for the outputs of ``tx`` paying ``address`` less than ``threshold`` BTC."""
+    status = tx.get("status", {})
+    received = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(status.get("block_time", 0)))
+    entries = []
+    for n, out in enumerate(tx.get("vout", [])):
+        value_btc = out.get("value", 0) / 1e8
+        if out.get("scriptpubkey_address") == address and value_btc < threshold:
+            entries.append({
+                "address":        address,
+                "source_txid":    tx["txid"],
+                "vout":           n,
+                "amount_btc":     value_btc,
+                "block_height":   status.get("block_height"),
+                "received_time":  received,
+                "wrapped_as":     "wTHR",
+                "equivalent_thr": round(value_btc * THR_PER_BTC, 4)
+            })
+    return entries
+
+
+def _key(e):
+    # τα legacy entries δεν έχουν vout: κλειδί η σειρά τους μέσα στο ίδιο tx
+    return (e["source_txid"], e["vout"] if e.get("vout") is not None else f"legacy:{e.get('legacy', 0)}")
+
+
+class WrappedLedger:
+    """
+    wrapped_thr_ledger.ndjson: one wrapped entry per line, only ever appended.
+    ``(source_txid, vout)`` is unique; the keys are loaded once at start.
+
+    Entries of the old one-shot script's ``wrapped_thr_ledger.json`` are
+    imported once (``"vout": null``, ``"legacy": n``), and their txids
+    are never wrapped again: that script wrapped every qualifying output
+    of a tx in one go, but did not record which ones.
+    """
+
+    def __init__(self, path=LEDGER_FILE, legacy_path=LEGACY_LEDGER):
+        self.path = path
+        self.keys = set()
+        self.legacy_txids = set()
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue    # μισογραμμένη τελευταία γραμμή
+                    self._index(e)
+        except FileNotFoundError:
+            pass
+        if legacy_path and not self.legacy_txids and os.path.exists(legacy_path):
+            n = self.import_legacy(legacy_path)
+            if n:
+                print(f"📥 Imported {n} wrapped entries from {legacy_path}")
+
+    def _index(self, e):
+        self.keys.add(_key(e))
+        if e.get("vout") is None:
+            self.legacy_txids.add(e["source_txid"])
+
+    def import_legacy(self, path):
+        """Append the entries of a legacy JSON ledger not imported yet; returns how many."""
+        with open(path, "r") as f:
+            old = json.load(f)
+        fresh, seen = [], {}
+        with self._lock:
+            for e in old if isinstance(old, list) else []:
+                if not isinstance(e, dict) or "source_txid" not in e:
+                    continue
+                txid = e["source_txid"]
+                n = seen[txid] = seen.get(txid, -1) + 1
+                entry = dict(e, address=e.get("address"), vout=None, legacy=n)
+                if _key(entry) not in self.keys:
+                    self._index(entry)
+                    fresh.append(entry)
+            if fresh:
+                with open(self.path, "a") as f:
+                    f.write("".join(json.dumps(e) + "\n" for e in fresh))
+        return len(fresh)
+
+    def append(self, entries):
+        """Append the entries not already in the ledger; returns how many were written."""
+        with self._lock:
+            fresh = []
+            for e in entries:
+                key = _key(e)
+                if key not in self.keys and e["source_txid"] not in self.legacy_txids:
+                    self.keys.add(key)
+                    fresh.append(e)
+            if fresh:
+                with open(self.path, "a") as f:
+                    f.write("".join(json.dumps(e) + "\n" for e in fresh))
+            return len(fresh)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def default_budget():
+    """BUDGET_SHARE of the request rate http_client allows towards the Esplora host."""
+    from urllib.parse import urlsplit
+    import http_client
+    import phantom_gateway_mainnet
+    rate, _ = http_client.HOST_RATES.get(urlsplit(phantom_gateway_mainnet.BASE_URL).hostname,
+                                         http_client.DEFAULT_RATE)
+    return rate * BUDGET_SHARE
+
+
+class WrappedWatcher:
+    """
+    Polls many addresses, each on its own schedule, and appends wrapped outputs to the ledger.
+
+    Every poll is one btc_sync call (one request when nothing is new), so
+    the request rate is roughly the sum of 1/interval over all addresses.
+    An address that received something is polled again after
+    ``min_interval``; each empty poll doubles its interval up to
+    ``max_interval``. When the schedule still asks for more than
+    ``budget`` requests/s (by default BUDGET_SHARE of the Esplora host's
+    limit in http_client), every delay is stretched by demand/budget, so
+    thousands of addresses share the limit evenly instead of queueing in
+    the token bucket. ``lag`` of an address is how late its last poll
+    started compared to when it was due.
+    """
+
+    def __init__(self, addresses, ledger=None, sync=None, workers=WORKERS,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, threshold=THRESHOLD_BTC,
+                 budget=None):
+        self.ledger = ledger or WrappedLedger()
+        self.sync = sync or AddressSync(SYNC_STATE, SYNC_SEEN)
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold
+        self.budget = budget or default_budget()
+        self.demand = 0.0   # Σ 1/interval, requests/s που ζητά το schedule
+        self.state = {}     # address → {"interval","due","last_poll","last_new","lag","errors","wrapped"}
+        self._heap = []     # (due, address)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.set_addresses(addresses)
+
+    def set_addresses(self, addresses):
+        """Start tracking new addresses (first polls spread over min_interval), drop removed ones."""
+        now = time.time()
+        with self._lock:
+            wanted = set(addresses)
+            for addr in list(self.state):
+                if addr not in wanted:
+                    self.demand -= 1 / self.state.pop(addr)["interval"]   # η εγγραφή στο heap αγνοείται όταν βγει
+            for addr in addresses:
+                if addr not in self.state:
+                    self.demand += 1 / self.min_interval
+                    due = now + random.uniform(0, self.min_interval) * self.stretch()
+                    self.state[addr] = {"interval": self.min_interval, "due": due, "last_poll": None,
+                                        "last_new": None, "lag": 0.0, "errors": 0, "wrapped": 0}
+                    heapq.heappush(self._heap, (due, addr))
+
+    # ─── POLLING ───────────────────────────────────
+    def poll(self, address, scheduled=True):
+        """One sync of ``address``; returns how many ledger entries it added."""
+        added = []
+        handler = lambda tx: added.append(self.ledger.append(wrap_outputs(tx, address, self.threshold)))
+        started = time.time()
+        try:
+            new = self.sync.sync(address, handler, include_mempool=False, save=False)
+            error = None
+        except Exception as e:
+            new, error = 0, e
+        with self._lock:
+            st = self.state.get(address)
+            if st is None:
+                return 0
+            if scheduled:
+                st["lag"] = round(max(0.0, started - st["due"]), 3)
+            st["last_poll"] = started
+            old = st["interval"]
+            if error is not None:
+                st["errors"] += 1
+                st["interval"] = min(self.max_interval, old * 2)
+            elif new:
+                st["last_new"] = started
+                st["interval"] = self.min_interval
+            else:
+                st["interval"] = min(self.max_interval, old * 2)
+            self.demand += 1 / st["interval"] - 1 / old
+            st["wrapped"] += sum(added)
+            st["due"] = time.time() + st["interval"] * self.stretch()
+            heapq.heappush(self._heap, (st["due"], address))
+        if error is not None:
+            print(f"⚠️ {address}: {error}")
+        return sum(added)
+
+    def stretch(self):
+        """Factor (≥ 1) by which delays are scaled to keep the schedule within the budget."""
+        return max(1.0, self.demand / self.budget)
+
+    def _take_due(self, now, limit):
+        with self._lock:
+            due = []
+            while self._heap and self._heap[0][0] <= now and len(due) < limit:
+                when, addr = heapq.heappop(self._heap)
+                st = self.state.get(addr)
+                if st is not None and st["due"] == when:    # αλλιώς παλιά εγγραφή
+                    due.append(addr)
+            return due
+
+    def next_due(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def run_once(self):
+        """Poll every address once, regardless of schedule (the old one-shot mode)."""
+        with self._lock:
+            addrs = list(self.state)
+        with ThreadPoolExecutor(self.workers) as pool:
+            added = sum(pool.map(lambda a: self.poll(a, scheduled=False), addrs))
+        self.sync.save()
+        return added
+
+    def run(self, config_path=None):
+        """Scheduler loop: poll what is due on the pool, save watermarks and status every STATUS_EVERY s."""
+        try:
+            self._loop(config_path)
+        finally:
+            self.sync.save()
+            self.write_status()
 
-# ΠΡΟΣΑΡΜΟΣΕ ΑΥΤΗ ΤΗΝ ΔΙΕΥΘΥΝΣΗ BTC
-btc_address = "YOUR_BTC_ADDRESS_HERE"
+    def _loop(self, config_path):
+        mtime = os.path.getmtime(config_path) if config_path else None
+        last_status = 0.0
+        inflight = threading.Semaphore(self.workers * 2)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="wrapped") as pool:
+            while not self._stop.is_set():
+                now = time.time()
+                for addr in self._take_due(now, self.workers * 2):
+                    inflight.acquire()
+                    pool.submit(self.poll, addr).add_done_callback(lambda _: inflight.release())
+                if now - last_status >= STATUS_EVERY:
+                    last_status = now
+                    self.sync.save()
+                    self.write_status()
+                    if config_path and os.path.getmtime(config_path) != mtime:
+                        mtime = os.path.getmtime(config_path)
+                        self.set_addresses(load_addresses(config_path))
+                        print(f"🔄 Reloaded {config_path}: {len(self.state)} addresses")
+                nxt = self.next_due()
+                self._stop.wait(min(1.0, max(0.05, (nxt or now + 1) - time.time())))
 
-# Κατώφλι μικροσυναλλαγής σε BTC
-threshold_btc = 0.001
+    def stop(self):
+        self._stop.set()
 
-# Blockstream API endpoint
-url = f"https://blockstream.info/api/address/{btc_address}/txs"
+    # ─── REPORTING ─────────────────────────────────
+    def status(self):
+        """Per-address schedule and lag, plus totals and the request rate the schedule implies."""
+        now = time.time()
+        with self._lock:
+            per_addr = {a: dict(st, behind=round(max(0.0, now - st["due"]), 3)) for a, st in self.state.items()}
+        lags = sorted(st["lag"] for st in per_addr.values())
+        pct = lambda q: lags[min(len(lags) - 1, int(q * len(lags)))] if lags else 0.0
+        return {
+            "addresses":      len(per_addr),
+            "ledger_entries": len(self.ledger),
+            "requests_per_s": round(self.demand, 3),
+            "budget_per_s":   self.budget,
+            "stretch":        round(self.stretch(), 3),
+            "lag_p50":        pct(0.5),
+            "lag_p95":        pct(0.95),
+            "lag_max":        lags[-1] if lags else 0.0,
+            "overdue":        sum(st["behind"] > 0 for st in per_addr.values()),
+            "per_address":    per_addr
+        }
 
-print(f"Fetching transactions for {btc_address}...")
+    def write_status(self, path=STATUS_FILE):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp, path)
 
-try:
-    response = requests.get(url)
-    response.raise_for_status()
-    txs = response.json()
 
-    wrapped = []
+def benchmark(addresses=2000, rate=50.0, latency=0.03, seconds=20):
+    """
+    ``addresses`` synthetic addresses (5% active) against esplora_mock with an
+    upstream limit of ``rate`` req/s: first full round, then ``seconds`` of
+    scheduled polling — requests made vs the limit, and lag.
+    """
+    import shutil
+    import tempfile
+    from esplora_mock import MockEsplora, SyntheticChain
 
-    for tx in txs:
-        txid = tx["txid"]
-        received_time = datetime.utcfromtimestamp(tx.get("status", {}).get("block_time", 0)).isoformat()
-        outputs = tx.get("vout", [])
+    import http_client
+    import phantom_gateway_mainnet
+    from esplora_cache import get_cache
 
-        for out in outputs:
-            value_btc = out["value"] / 1e8
-            scriptpubkey_address = out.get("scriptpubkey_address", "")
+    tmp = tempfile.mkdtemp(prefix="wrapped_bench_")
+    mock = MockEsplora(SyntheticChain(txs=30), latency=latency)
+    server, base_url = mock.serve(port=0)
+    # ο gateway είναι ήδη imported (btc_sync): τον στρέφουμε στο mock, cache στο tmp, χωρίς TTL
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    phantom_gateway_mainnet.BASE_URL = base_url
+    http_client.HOST_RATES["127.0.0.1"] = (rate, int(rate))
+    get_cache().lists.ttl = 0
+    try:
+        addrs = [f"bc1qwatch{i:030d}" for i in range(addresses)]
+        w = WrappedWatcher(addrs, WrappedLedger(os.path.join(tmp, "ledger.ndjson")),
+                           AddressSync(os.path.join(tmp, "s.json"), os.path.join(tmp, "p.txt")),
+                           workers=16, min_interval=5, max_interval=60)
+        t0 = time.perf_counter()
+        added = w.run_once()
+        first = time.perf_counter() - t0
+        print(f"first round: {addresses} addresses in {first:.1f}s ({mock.stats['requests'] / first:.1f} req/s, "
+              f"limit {rate:.0f}), {added} ledger entries")
 
-            if value_btc < threshold_btc and scriptpubkey_address == btc_address:
-                wrapped.append({
-                    "source_txid": txid,
-                    "amount_btc": value_btc,
-                    "received_time": received_time,
-                    "wrapped_as": "wTHR",
-                    "equivalent_thr": round(value_btc * 100000, 4),  # Conversion rate
-                })
+        active = addrs[:addresses // 20]
+        mock.stats["requests"] = 0
+        t_run = threading.Thread(target=w.run, daemon=True)
+        t_run.start()
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            # νέες πληρωμές στις ενεργές διευθύνσεις
+            for a in random.sample(active, max(1, len(active) // 10)):
+                mempool, confirmed = mock.chain.history(a)
+                height = confirmed[0]["status"]["block_height"] + 1
+                confirmed.insert(0, mock.chain._tx(a, f"n{time.time()}", a, 5000, height))
+            time.sleep(1)
+        w.stop()
+        t_run.join()
+        st = w.status()
+        print(f"scheduled: {mock.stats['requests'] / seconds:.1f} req/s over {seconds}s (limit {rate:.0f}), "
+              f"schedule demand {st['requests_per_s']} req/s (stretch ×{st['stretch']}), "
+              f"lag p50 {st['lag_p50']}s p95 {st['lag_p95']}s, "
+              f"{st['ledger_entries']} ledger entries")
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
 
-    with open("wrapped_thr_ledger.json", "w") as f:
-        json.dump(wrapped, f, indent=2)
 
-    print(f"✅ Saved {len(wrapped)} wrapped transactions to 'wrapped_thr_ledger.json'")
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Watch BTC addresses and append wrapped-THR entries")
+    ap.add_argument("command", nargs="?", default="run", choices=["run", "once", "status", "bench"])
+    ap.add_argument("--config", default=WATCH_CONFIG)
+    args = ap.parse_args()
 
-except Exception as e:
-    print(f"❌ Error fetching transactions: {e}")
+    if args.command == "bench":
+        benchmark()
+    elif args.command == "status":
+        with open(STATUS_FILE, "r") as f:
+            st = json.load(f)
+        st.pop("per_address", None)
+        print(json.dumps(st, indent=2))
+    else:
+        watcher = WrappedWatcher(load_addresses(args.config))
+        print(f"👀 Watching {len(watcher.state)} addresses → {LEDGER_FILE}")
+        if args.command == "once":
+            print(f"✅ Appended {watcher.run_once()} wrapped entries to {LEDGER_FILE}")
+        else:
+            try:
+                watcher.run(args.config)
+            except KeyboardInterrupt:
+                watcher.stop()
@@ -0,0 +1,375 @@
+# chain_store.py - Append-only storage layer for phantom_tx_chain.json
+import os
+import json
+import base64
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows (miner kit): no cross-process locking
+    fcntl = None
+
+# ─── CONFIG ────────────────────────────────────────
+CHAIN_FILE    = "phantom_tx_chain.json"
+COMPACT_EVERY = int(os.getenv("CHAIN_COMPACT_EVERY", 5000))  # log records πριν το snapshot
+CHAIN_FSYNC   = os.getenv("CHAIN_FSYNC", "1") != "0"
+PAGE_LIMIT    = 100    # default /chain page
+MAX_PAGE      = 1000
+
+
+class ChainLog:
+    """
+    Append-only view of a JSON array file such as phantom_tx_chain.json.
+
+    The JSON file itself is the snapshot. New records are appended to
+    ``<path>.log`` as one ``{"h": height, "r": record}`` line each, so an
+    append costs one short write no matter how long the chain is. Every
+    ``compact_every`` records the log is folded back into the snapshot.
+
+    On open the snapshot is loaded and the log replayed; a torn last line
+    (crash in the middle of a write) is truncated away. Records whose height
+    is already covered by the snapshot are skipped, so a crash between
+    writing the snapshot and resetting the log is harmless too.
+    """
+
+    def __init__(self, path=CHAIN_FILE, compact_every=COMPACT_EVERY, fsync=CHAIN_FSYNC):
+        self.path = path
+        self.log_path = path + ".log"
+        self.lock_path = path + ".lock"
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        self._records = []
+        self._listeners = []
+        self._lock = threading.RLock()       # in-process writers/readers
+        self._sync_lock = threading.RLock()  # group commit of fsync
+        self._log = None
+        self._log_ino = None
+        self._offset = 0                     # bytes of the log already applied
+        self._log_records = 0                # records in the log since the snapshot
+        self._written = 0
+        self._synced = 0
+        self._compacting = False
+
+        with self._lock, self._file_lock():
+            self._reload(repair=True)
+
+    # ─── FILE HELPERS ──────────────────────────────
+    def _file_lock(self):
+        return _FileLock(self.lock_path)
+
+    def _load_snapshot(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        return data if isinstance(data, list) else []
+
+    def _open_log(self):
+        old, self._log = self._log, open(self.log_path, "ab")
+        if old:
+            with self._sync_lock:  # μην κλείσει κάτω από ένα fsync σε εξέλιξη
+                old.close()
+        self._log_ino = os.fstat(self._log.fileno()).st_ino
+        self._offset = 0
+        self._log_records = 0
+
+    def _reload(self, repair=False):
+        """Re-read snapshot + log from scratch (startup or after another process compacted)."""
+        snapshot = self._load_snapshot()
+        for h in range(len(self._records), len(snapshot)):
+            self._apply(h, snapshot[h])
+        self._open_log()
+        self._read_log(repair=repair)
+
+    def _read_log(self, repair=False):
+        """Apply log lines written after ``self._offset``."""
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        pos = 0
+        while pos < len(data):
+            end = data.find(b"\n", pos)
+            if end < 0:
+                break
+            try:
+                entry = json.loads(data[pos:end])
+                h, rec = entry["h"], entry["r"]
+            except (ValueError, KeyError, TypeError):
+                break
+            if h > len(self._records):
+                break
+            self._apply(h, rec)
+            self._log_records += 1
+            pos = end + 1
+        self._offset += pos
+        if repair and pos < len(data):
+            # ό,τι έμεινε είναι μισογραμμένη εγγραφή από crash
+            with open(self.log_path, "r+b") as f:
+                f.truncate(self._offset)
+
+    def _apply(self, h, record):
+        if h != len(self._records):
+            return  # ήδη μέσα στο snapshot
+        self._records.append(record)
+        for fn in self._listeners:
+            fn(h, record)
+
+    def _refresh(self):
+        """Pick up records appended by other processes since our last look."""
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self._log_ino:
+            self._reload()
+        elif st.st_size > self._offset:
+            self._read_log()
+
+    def _sync(self, target):
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= target:
+                return  # κάποιος άλλος writer έκανε ήδη fsync για εμάς
+            upto = self._written
+            os.fsync(self._log.fileno())
+            self._synced = upto
+
+    # ─── WRITES ────────────────────────────────────
+    def extend(self, records, prepare=None):
+        """
+        Append records and return their heights.
+
+        ``prepare(height, records)`` is called under the chain lock with the
+        height the first record will get and returns the records that should
+        actually be written, so callers can derive block numbers or check
+        balances without racing other writers. All records of one call share
+        a single fsync.
+        """
+        with self._lock:
+            with self._file_lock():
+                self._refresh()
+                if os.fstat(self._log.fileno()).st_size > self._offset:
+                    self._log.truncate(self._offset)  # torn tail από άλλο process
+                start = len(self._records)
+                if prepare is not None:
+                    records = prepare(start, records)
+                records = list(records or [])
+                if not records:
+                    return []
+                lines = b"".join(
+                    json.dumps({"h": start + i, "r": rec}, separators=(",", ":")).encode() + b"\n"
+                    for i, rec in enumerate(records)
+                )
+                self._log.write(lines)
+                self._log.flush()
+                self._offset += len(lines)
+            for i, rec in enumerate(records):
+                self._apply(start + i, rec)
+            self._log_records += len(records)
+            self._written += 1
+            target = self._written
+            if self._log_records >= self.compact_every and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self.compact, daemon=True).start()
+        self._sync(target)
+        return list(range(start, start + len(records)))
+
+    def append(self, record, prepare=None):
+        """
+        Append one record and return its height.
+
+        ``prepare(height, record)`` may fill in height-dependent fields and
+        return the record to write, or ``None`` to skip it.
+        """
+        wrap = None
+        if prepare is not None:
+            def wrap(height, records):
+                rec = prepare(height, records[0])
+                return [rec] if rec is not None else []
+        heights = self.extend([record], wrap)
+        return heights[0] if heights else None
+
+    def compact(self):
+        """Rewrite the snapshot with the whole chain and start an empty log."""
+        try:
+            with self._lock, self._sync_lock, self._file_lock():
+                self._refresh()
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(self._records, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                tmp_log = self.log_path + ".tmp"
+                open(tmp_log, "wb").close()
+                os.replace(tmp_log, self.log_path)
+                self._open_log()
+                self._synced = self._written
+        finally:
+            self._compacting = False
+
+    # ─── READS ─────────────────────────────────────
+    def subscribe(self, fn, since=None):
+        """
+        Call ``fn(height, record)`` for every record appended from now on.
+
+        With ``since`` the records from that height up to the current tip are
+        fed to ``fn`` first, under the same lock, so nothing is missed or seen
+        twice between catching up and listening.
+        """
+        with self._lock:
+            if since is not None:
+                self.replay(fn, since)
+            self._listeners.append(fn)
+
+    def replay(self, fn, since=0):
+        """Feed ``fn(height, record)`` the records from ``since`` to the tip, under the chain lock."""
+        with self._lock:
+            self._refresh()
+            for h in range(since, len(self._records)):
+                fn(h, self._records[h])
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._records)
+
+    def get(self, height):
+        with self._lock:
+            self._refresh()
+            return self._records[height]
+
+    def get_many(self, heights):
+        with self._lock:
+            self._refresh()
+            return [self._records[h] for h in heights]
+
+    def range(self, start=0, stop=None):
+        with self._lock:
+            self._refresh()
+            return self._records[start:stop]
+
+    def all(self):
+        return self.range()
+
+    def tip(self):
+        with self._lock:
+            self._refresh()
+            return self._records[-1] if self._records else None
+
+    def etag(self):
+        """Strong validator for the whole chain: height + hash of the tip record."""
+        with self._lock:
+            self._refresh()
+            return chain_etag(len(self._records), self._records[-1] if self._records else None)
+
+    def page(self, from_height=None, limit=PAGE_LIMIT, latest=False, cursor=None):
+        """One page of the chain for ``GET /chain`` (see ``chain_page``)."""
+        with self._lock:
+            self._refresh()
+            return chain_page(len(self._records), lambda a, b: self._records[a:b],
+                              from_height, limit, latest, cursor)
+
+    def close(self):
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+
+
+def chain_etag(height, tip):
+    tip_hash = hashlib.sha256(json.dumps(tip, sort_keys=True).encode()).hexdigest()
+    return f"{height}-{tip_hash[:32]}"
+
+def chain_page(height, fetch, from_height=None, limit=PAGE_LIMIT, latest=False, cursor=None):
+    """
+    Build one ``GET /chain`` page over a chain of ``height`` records.
+
+    ``fetch(start, stop)`` returns the records in ``[start, stop)``. Walks
+    forward from ``from_height`` (default 0) or, with ``latest``, backwards
+    from ``from_height`` (default the tip). ``cursor`` is the opaque
+    ``next_cursor`` of a previous page and overrides both. Raises
+    ValueError on a malformed cursor or number.
+    """
+    if cursor:
+        from_height, latest = decode_cursor(cursor)
+    limit = max(1, min(int(limit or PAGE_LIMIT), MAX_PAGE))
+    if latest:
+        top = height - 1 if from_height is None else min(max(int(from_height), -1), height - 1)
+        low = max(top - limit + 1, 0)
+        blocks = fetch(low, top + 1)[::-1] if top >= 0 else []
+        start, nxt = max(top, 0), (low - 1 if low > 0 else None)
+    else:
+        start = max(int(from_height or 0), 0)
+        blocks = fetch(start, start + limit) if start < height else []
+        nxt = start + limit if start + limit < height else None
+    return {
+        "height":      height,
+        "from_height": start,
+        "order":       "latest" if latest else "oldest",
+        "blocks":      blocks,
+        "next_cursor": encode_cursor(nxt, latest) if nxt is not None else None
+    }
+
+def encode_cursor(height, latest):
+    raw = json.dumps([height, 1 if latest else 0]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        height, latest = json.loads(raw)
+        return int(height), bool(latest)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class _FileLock:
+    """flock on a side file so gunicorn workers and CLI scripts take turns appending."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+
+_chains = {}
+_chains_lock = threading.Lock()
+
+def open_chain(path=CHAIN_FILE):
+    """Shared ChainLog per path, so every module in a process appends through one writer."""
+    key = os.path.abspath(path)
+    with _chains_lock:
+        if key not in _chains:
+            _chains[key] = ChainLog(path)
+        return _chains[key]
+
+
+if __name__ == "__main__":
+    import sys
+    # python chain_store.py compact [path]
+    if len(sys.argv) >= 2 and sys.argv[1] == "compact":
+        chain = open_chain(sys.argv[2] if len(sys.argv) > 2 else CHAIN_FILE)
+        chain.compact()
+        print(f"✅ Compacted {len(chain)} records into {chain.path}")
+    else:
+        print("Usage: python chain_store.py compact [chain_file]")
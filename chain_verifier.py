@@ -0,0 +1,275 @@
+# chain_verifier.py - Parallel, incremental chain integrity checks with a persisted checkpoint
+import os
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from block_builder import header_hash, record_hash, merkle_root, tx_id, ZERO_HASH
+
+# ─── CONFIG ────────────────────────────────────────
+CHECKPOINT_FILE = "phantom_tx_chain.verified.json"
+SEGMENT_SIZE    = int(os.getenv("CHAIN_VERIFY_SEGMENT", 2000))   # records ανά εργασία του pool
+VERIFY_WORKERS  = int(os.getenv("CHAIN_VERIFY_WORKERS", os.cpu_count() or 1))
+MAX_ERRORS      = 100
+# όχι fork: ο server έχει ήδη threads και locks που ένα fork θα αντέγραφε κλειδωμένα
+MP_START        = os.getenv("THRONOS_MP_START", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+def verify_segment(start, records):
+    """
+    Check one run of consecutive records starting at height ``start``.
+
+    Recomputes ``hash``, the txids, Merkle root and tx count of sealed
+    blocks, ``index`` against the height, and every ``previous_hash``
+    inside the segment. Legacy records without ``previous_hash`` are only
+    accepted before the first linked one; after it, every record must carry
+    both ``previous_hash`` and ``hash``. The link of the first record to
+    the one before the segment is left to the caller, who gets back
+    ``(start, first_previous_hash, last_hash, errors, legacy)`` — ``legacy``
+    being the number of leading unlinked records, which are errors too if
+    the chain was already linked before ``start``.
+    """
+    errors = []
+    prev_hash = None
+    first_prev = None
+    legacy = 0
+    linked = False
+    for i, rec in enumerate(records):
+        h = start + i
+        if not isinstance(rec, dict):
+            if linked:
+                errors.append({"height": h, "error": "record is not an object"})
+            else:
+                legacy += 1
+            prev_hash = record_hash(rec)
+            continue
+        if "index" in rec and rec["index"] != h:
+            errors.append({"height": h, "error": f"index {rec['index']} out of sequence"})
+        if "previous_hash" in rec:
+            if i == 0:
+                first_prev = rec["previous_hash"]
+            elif rec["previous_hash"] != prev_hash:
+                errors.append({"height": h, "error": f"previous_hash does not match block {h - 1}"})
+            linked = True
+        elif linked:
+            # μετά το πρώτο linked record δεν δεχόμαστε records χωρίς σύνδεση
+            errors.append({"height": h, "error": "missing previous_hash"})
+        else:
+            legacy += 1
+        if rec.get("hash"):
+            if header_hash(rec) != rec["hash"]:
+                errors.append({"height": h, "error": "hash mismatch"})
+        elif linked:
+            errors.append({"height": h, "error": "missing hash"})
+        txs = rec.get("transactions")
+        if isinstance(txs, list):
+            if rec.get("tx_count", len(txs)) != len(txs):
+                errors.append({"height": h, "error": "tx_count mismatch"})
+            txids = []
+            for pos, tx in enumerate(txs):
+                if not isinstance(tx, dict):
+                    errors.append({"height": h, "error": f"transaction at position {pos} is not an object"})
+                    txids.append("")
+                    continue
+                if tx.get("txid") != tx_id(tx):
+                    errors.append({"height": h, "error": f"txid mismatch at position {pos}"})
+                txids.append(tx.get("txid", ""))
+            try:
+                root = merkle_root(txids)
+            except (ValueError, TypeError):
+                root = None
+            if root != rec.get("merkle_root"):
+                errors.append({"height": h, "error": "merkle_root mismatch"})
+        prev_hash = record_hash(rec)
+    return start, first_prev, prev_hash, errors, legacy
+
+
+class _ListChain:
+    """A list of records (e.g. thronos_blockchain.json loaded) behind the len/chain_range interface."""
+
+    def __init__(self, records):
+        self._records = records if isinstance(records, list) else []
+
+    def __len__(self):
+        return len(self._records)
+
+    def chain_range(self, start=0, stop=None):
+        return self._records[start:stop]
+
+
+class ChainVerifier:
+    """
+    Verifies a chain in segments on a process pool and remembers how far it got.
+
+    ``source`` is anything with ``len()`` and ``chain_range(start, stop)``
+    (a Storage backend, or a JSON array file). The checkpoint records the
+    verified height and the hash of the record just below it; the next run
+    re-checks that hash and, if the chain below it was not rewritten, only
+    verifies records past the checkpoint. ``start()`` runs in a background
+    thread so the node keeps serving requests; ``status`` has the last report.
+    """
+
+    def __init__(self, source, checkpoint_path=CHECKPOINT_FILE, workers=VERIFY_WORKERS,
+                 segment_size=SEGMENT_SIZE):
+        self.source = source
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.segment_size = segment_size
+        self.status = {"state": "idle"}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # ─── CHECKPOINT ────────────────────────────────
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                cp = json.load(f)
+            return int(cp["height"]), cp["tip_hash"]
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return 0, ZERO_HASH
+
+    def save_checkpoint(self, height, tip_hash):
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"height": height, "tip_hash": tip_hash, "verified_at": time.time()}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    # ─── VERIFY ────────────────────────────────────
+    def verify(self, full=False):
+        """Verify new records (or everything with ``full``) and return a report dict."""
+        t0 = time.perf_counter()
+        height = len(self.source)
+        start, boundary = (0, ZERO_HASH) if full else self.load_checkpoint()
+        note = None
+        if start > height or (start and record_hash(self.source.chain_range(start - 1, start)[0]) != boundary):
+            # το chain κάτω από το checkpoint άλλαξε: ξανά από την αρχή
+            note = f"checkpoint at height {start} no longer matches the chain; re-verified from 0"
+            start, boundary = 0, ZERO_HASH
+
+        bounds = [(s, min(s + self.segment_size, height)) for s in range(start, height, self.segment_size)]
+        if len(bounds) > 1 and self.workers > 1:
+            with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(MP_START)) as pool:
+                futs = [pool.submit(verify_segment, s, self.source.chain_range(s, e)) for s, e in bounds]
+                results = [f.result() for f in futs]
+        else:
+            results = [verify_segment(s, self.source.chain_range(s, e)) for s, e in bounds]
+
+        errors = []
+        prev = boundary
+        # ήταν ήδη linked το chain πριν από το start; (τα legacy records προηγούνται πάντα)
+        linked = bool(start) and "previous_hash" in (self.source.chain_range(start - 1, start)[0] or {})
+        for (seg_start, seg_end), (_, first_prev, last_hash, seg_errors, legacy) in zip(bounds, results):
+            # σύνδεση στα όρια των segments
+            if first_prev is not None and first_prev != prev:
+                errors.append({"height": seg_start, "error": f"previous_hash does not match block {seg_start - 1}"})
+            if linked:
+                errors.extend({"height": h, "error": "missing previous_hash"} for h in range(seg_start, seg_start + legacy))
+            errors.extend(seg_errors)
+            linked = linked or legacy < seg_end - seg_start
+            prev = last_hash
+
+        ok = not errors
+        if ok and height > start:
+            self.save_checkpoint(height, prev)
+        report = {
+            "ok":          ok,
+            "from_height": start,
+            "height":      height,
+            "verified":    height - start,
+            "tip_hash":    prev,
+            "errors":      errors[:MAX_ERRORS],
+            "error_count": len(errors),
+            "elapsed":     round(time.perf_counter() - t0, 3)
+        }
+        if note:
+            report["note"] = note
+        return report
+
+    def run(self, full=False):
+        """Blocking verify that also updates ``status``; only one run at a time."""
+        if not self._lock.acquire(blocking=False):
+            return self.status
+        try:
+            self.status = {"state": "running", "started_at": time.time()}
+            try:
+                report = self.verify(full)
+            except Exception as e:
+                report = {"ok": False, "errors": [{"error": str(e)}], "error_count": 1}
+            self.status = dict(report, state="done", finished_at=time.time())
+            if report["ok"]:
+                print(f"✅ Chain verified up to height {report.get('height')} ({report.get('verified')} new records)")
+            else:
+                print(f"❌ Chain verification found {report['error_count']} problem(s): {report['errors'][:3]}")
+            return self.status
+        finally:
+            self._lock.release()
+
+    def start(self, full=False):
+        """Run in a background thread; returns False if a run is already in progress."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self.run, args=(full,), daemon=True)
+        self._thread.start()
+        return True
+
+
+_verifiers = {}
+_verifiers_lock = threading.Lock()
+
+def open_verifier(source=None, checkpoint_path=CHECKPOINT_FILE):
+    """Shared ChainVerifier per checkpoint file (defaults to the node's storage chain)."""
+    key = os.path.abspath(checkpoint_path)
+    with _verifiers_lock:
+        if key not in _verifiers:
+            if source is None:
+                from storage import get_storage
+                source = get_storage()
+            _verifiers[key] = ChainVerifier(source, checkpoint_path)
+        return _verifiers[key]
+
+
+def benchmark(records=200_000, segment=5000):
+    """Full verification of a synthetic sealed chain: one process vs the pool."""
+    import tempfile
+    from block_builder import seal_block
+
+    chain, prev = [], None
+    for h in range(records // 10):
+        prev = seal_block(h, prev, [{"from": "THRA", "to": "THRB", "amount": 0.01, "nonce": h * 10 + i}
+                                    for i in range(10)])
+        chain.append(prev)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "chain.verified.json")
+        for workers in sorted({1, VERIFY_WORKERS}):
+            v = ChainVerifier(_ListChain(chain), checkpoint, workers=workers, segment_size=segment)
+            report = v.verify(full=True)
+            print(f"{len(chain):,} blocks ({records:,} tx), {workers} worker(s): full {report['elapsed']:.2f}s, ok={report['ok']}")
+        chain.append(seal_block(len(chain), chain[-1], [{"from": "THRA", "to": "THRB", "amount": 0.01}]))
+        report = v.verify()
+        print(f"incremental run after one new block: {report['verified']} record(s) in {report['elapsed'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Verify chain hashes, Merkle roots and previous_hash links")
+    ap.add_argument("command", nargs="?", default="verify", choices=["verify", "bench"])
+    ap.add_argument("--file", help="verify a JSON array chain file (e.g. thronos_blockchain.json) instead of the node chain")
+    ap.add_argument("--full", action="store_true", help="ignore the checkpoint and verify from height 0")
+    ap.add_argument("--workers", type=int, default=VERIFY_WORKERS)
+    args = ap.parse_args()
+
+    if args.command == "bench":
+        benchmark()
+    else:
+        if args.file:
+            with open(args.file, "r") as f:
+                records = json.load(f)
+            verifier = ChainVerifier(_ListChain(records), args.file + ".verified.json", workers=args.workers)
+        else:
+            verifier = open_verifier()
+            verifier.workers = args.workers
+        report = verifier.run(full=args.full)
+        print(json.dumps({k: v for k, v in report.items() if k != "state"}, indent=2))
+        raise SystemExit(0 if report["ok"] else 1)
@@ -0,0 +1,133 @@
+# chart_renderer.py - Debounced background rendering of the THR price chart PNG
+import os
+import time
+import threading
+
+# ─── CONFIG ────────────────────────────────────────
+CHART_DAYS      = int(os.getenv("CHART_DAYS", 7))              # παράθυρο του chart
+CHART_DEBOUNCE  = float(os.getenv("CHART_DEBOUNCE", 1.0))      # ησυχία (s) πριν το render
+CHART_MAX_DELAY = float(os.getenv("CHART_MAX_DELAY", 10.0))    # ανώτατη καθυστέρηση υπό συνεχή ticks
+
+
+class ChartRenderer:
+    """
+    Keeps the price chart PNG up to date from a background thread.
+
+    ``notify()`` only sets an event, so request handlers never plot. The
+    thread waits until notifications stop for ``debounce`` seconds (at most
+    ``max_delay`` after the first), then renders once — and only if the
+    chart key (newest tick timestamp, window) differs from the last render
+    or the file is missing. ``generate_price_chart`` writes to a temp file
+    and renames it, so the served PNG is always a complete one.
+    """
+
+    def __init__(self, token_dynamics, days=CHART_DAYS, output_file=None,
+                 debounce=CHART_DEBOUNCE, max_delay=CHART_MAX_DELAY):
+        self.token_dynamics = token_dynamics
+        self.days = days
+        self.path = output_file or os.path.join(token_dynamics.base_dir, "static", "thr_price_chart.png")
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.stats = {"notified": 0, "rendered": 0, "skipped": 0, "errors": 0, "render_ms": None}
+        self._key = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def notify(self):
+        """The price history may have changed: schedule a (debounced) re-render."""
+        self.stats["notified"] += 1
+        self._wake.set()
+
+    def render(self):
+        """Render now if the chart is stale; returns True if a new PNG was written."""
+        with self._lock:
+            key = self.token_dynamics.chart_key(self.days)
+            if key == self._key and os.path.exists(self.path):
+                self.stats["skipped"] += 1
+                return False
+            t0 = time.perf_counter()
+            written = self.token_dynamics.generate_price_chart(self.days, self.path)
+            self.stats["render_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            self._key = key
+            if written:
+                self.stats["rendered"] += 1
+            return bool(written)
+
+    def run(self):
+        self._wake.set()    # αρχικό render αν λείπει ή είναι παλιό
+        while not self._stop.is_set():
+            self._wake.wait()
+            first = time.monotonic()
+            self._wake.clear()
+            # debounce: περίμενε να σταματήσουν τα notify, όχι πάνω από max_delay
+            while (not self._stop.is_set() and time.monotonic() - first < self.max_delay
+                   and self._wake.wait(self.debounce)):
+                self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.render()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"❌ Price chart render failed: {e}")
+
+    def start(self):
+        """Run the renderer loop in a daemon thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True, name="chart-renderer")
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def benchmark(ticks=200):
+    """A burst of price ticks: a synchronous render per tick (as before) vs notify + debounced render."""
+    import shutil
+    import tempfile
+    from token_dynamics import TokenDynamics
+
+    tmp = tempfile.mkdtemp(prefix="chart_bench_")
+    try:
+        td = TokenDynamics(tmp)
+        for _ in range(50):
+            td.update_thr_value(0.001)
+
+        n = 20
+        t0 = time.perf_counter()
+        for _ in range(n):
+            td.update_thr_value(0.001)
+            td.generate_price_chart()
+        sync_ms = (time.perf_counter() - t0) / n * 1000
+
+        charts = ChartRenderer(td, debounce=0.2)
+        charts.start()
+        time.sleep(0.5)     # αρχικό render
+        t0 = time.perf_counter()
+        for _ in range(ticks):
+            td.update_thr_value(0.001)
+            charts.notify()
+        notify_us = (time.perf_counter() - t0) / ticks * 1e6
+        time.sleep(1.0)
+        charts.render()     # καμία αλλαγή από το τελευταίο render: skip
+        charts.stop()
+        st = charts.stats
+        print(f"{ticks} ticks: sync render {sync_ms:.0f}ms per tick | tick + notify {notify_us:.0f}µs | "
+              f"{st['rendered']} renders ({st['render_ms']}ms), {st['skipped']} skipped as unchanged")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+    else:
+        print("Usage: python chart_renderer.py bench")
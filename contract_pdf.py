@@ -0,0 +1,408 @@
+# contract_pdf.py - Pledge contract PDFs from a pre-built page template, importable by pdf_jobs worker processes
+import io
+import os
+import re
+import json
+import hmac
+import time
+import zlib
+import hashlib
+from functools import lru_cache
+
+# ─── CONFIG ────────────────────────────────────────
+PAGE_W, PAGE_H = 612, 792        # letter, σε points
+INCH           = 72
+WRAP           = 80              # χαρακτήρες ανά γραμμή pledge text
+FONTS          = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Helvetica-Oblique"}
+GREY           = b"0.8 0.8 0.8 RG"
+FOOTER         = "This contract is digitally signed and stored on the Thronos blockchain."
+SIGNING_KEY    = os.getenv("CONTRACT_SIGNING_KEY", "")   # HMAC key του metadata record· κενό = χωρίς υπογραφή
+RECORD_KEY     = "/ThronosContract"                      # info dictionary: JSON record + HMAC
+SIGNATURE_KEY  = "/ThronosSignature"
+RECORD_TAIL    = 4096                                    # bytes στο τέλος του αρχείου όπου γράφεται το info
+UNICODE_FONT   = os.getenv("CONTRACT_FONT", "")          # TTF για κείμενο εκτός WinAnsi· κενό = DejaVu Sans του matplotlib
+_RECORD_RE     = re.compile(rb"/ThronosContract \(((?:\\.|[^\\)])*)\) /ThronosSignature \(([0-9a-f]*)\)")
+
+
+def contract_record(btc_addr, thr_addr, pledge_hash=None):
+    """
+    The machine-readable record every contract carries in its info
+    dictionary. The pledge text stays out: it is bound by pledge_hash, and
+    a long string would make reading the record as slow as the page text.
+    """
+    return {"v": 1, "btc_address": btc_addr, "thr_address": thr_addr, "pledge_hash": pledge_hash,
+            "verification_hash": hashlib.sha256((btc_addr + thr_addr).encode()).hexdigest(),
+            "contract_id": hashlib.sha256(thr_addr.encode()).hexdigest()[:12]}
+
+
+def _canonical(record):
+    return json.dumps(record, sort_keys=True, separators=(",", ":")).encode()
+
+
+def sign_record(record, key=SIGNING_KEY):
+    """HMAC-SHA256 of the record ("" when no signing key is configured)."""
+    return hmac.new(key.encode(), _canonical(record), hashlib.sha256).hexdigest() if key else ""
+
+
+def read_record(info, key=SIGNING_KEY):
+    """
+    The contract record from a PDF info dictionary (e.g. PyPDF2's
+    ``reader.metadata``), or None for contracts made before it existed.
+    With a signing key configured, a missing or wrong signature raises
+    ValueError — the record must not be trusted, nor the text it came with.
+    A missing record is not an error here; with a key configured the
+    caller must reject it (see contract_validator.load_contract).
+    """
+    raw = (info or {}).get(RECORD_KEY)
+    if not raw:
+        return None
+    record = json.loads(raw)
+    if key and not hmac.compare_digest(str(info.get(SIGNATURE_KEY, "")), sign_record(record, key)):
+        raise ValueError("contract metadata signature mismatch")
+    return record
+
+
+def read_record_file(path, key=SIGNING_KEY):
+    """
+    read_record straight from the file tail, where ContractTemplate writes
+    the info dictionary — no PDF parser. None when it is not there (legacy
+    or re-saved PDFs), so callers fall back to a full reader.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - RECORD_TAIL))
+        return read_record_bytes(f.read(), key)
+
+
+def read_record_bytes(data, key=SIGNING_KEY):
+    """read_record_file for PDF bytes already in memory."""
+    matches = _RECORD_RE.findall(data[-RECORD_TAIL:])
+    if not matches:
+        return None
+    raw, sig = matches[-1]
+    raw = re.sub(rb"\\(.)", lambda m: {b"n": b"\n", b"r": b"\r"}.get(m[1], m[1]), raw)
+    return read_record({RECORD_KEY: raw.decode("latin-1"), SIGNATURE_KEY: sig.decode()}, key)
+
+
+def _num(v):
+    return ("%.2f" % v).rstrip("0").rstrip(".")
+
+
+def _fits(*strings):
+    """True if every string is WinAnsi (cp1252), i.e. printable with the standard PDF fonts."""
+    try:
+        for s in strings:
+            str(s).encode("cp1252")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _pdf_str(s):
+    """PDF literal string (WinAnsi, like ReportLab's standard fonts)."""
+    b = str(s).encode("cp1252", "replace")
+    return b"(" + b.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") \
+                   .replace(b"\r", b"\\r").replace(b"\n", b"\\n") + b")"
+
+
+@lru_cache(maxsize=512)
+def _op_bytes(op):
+    """
+    Content-stream operators for one layout op. Cached: the static layer
+    (title, labels, rules, footer) is formatted once per process.
+    """
+    kind = op[0]
+    y = _num(op[1] if kind == "line" else op[3]).encode()
+    if kind == "line":
+        return b"%s %d %s m %d %s l S\n" % (GREY, INCH, y, PAGE_W - INCH, y)
+    if kind == "text":
+        _, font, size, _, s = op
+        return b"BT 1 0 0 1 %d %s Tm /%s %d Tf %s Tj T* ET\n" % (INCH, y, font.encode(), size, _pdf_str(s))
+    _, font, size, _, lines, leading = op
+    ops = [b"BT 1 0 0 1 %d %s Tm /%s %d Tf %s TL" % (INCH, y, font.encode(), size, _num(leading).encode())]
+    ops += [_pdf_str(l) + b" Tj T*" for l in lines]
+    return b"\n".join(ops) + b"\nET\n"
+
+
+def _wrap(text, width=WRAP):
+    lines, line = [], ""
+    for word in text.split():
+        if len(line) + len(word) + 1 <= width:
+            line += (" " + word if line else word)
+        else:
+            lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    return tuple(l for l in lines if l)
+
+
+def _obj(num, body, stream=None):
+    if stream is None:
+        return b"%d 0 obj\n%s\nendobj\n" % (num, body)
+    return b"%d 0 obj\n%s /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (num, body, len(stream), stream)
+
+
+def _info(thr_addr, record):
+    """Info dictionary: title, date and the signed contract record."""
+    return (b"<< /Producer (Thronos contract template) /Title %s /CreationDate (D:%s+00'00') %s %s %s %s >>"
+            % (_pdf_str(f"Thronos Contract {thr_addr}"), time.strftime("%Y%m%d%H%M%S", time.gmtime()).encode(),
+               RECORD_KEY.encode(), _pdf_str(_canonical(record).decode()),
+               SIGNATURE_KEY.encode(), _pdf_str(sign_record(record))))
+
+
+def _with_info(pdf, info):
+    """
+    Append ``info`` as the document's info dictionary in an incremental
+    update, so the record sits in the file tail read_record_file reads.
+    """
+    trailer = pdf[pdf.rindex(b"trailer"):]
+    size = int(re.search(rb"/Size (\d+)", trailer)[1])
+    root = re.search(rb"/Root (\d+ \d+ R)", trailer)[1]
+    prev = int(re.findall(rb"startxref\s+(\d+)", trailer)[-1])
+    out = pdf if pdf.endswith(b"\n") else pdf + b"\n"
+    offset = len(out)
+    out += _obj(size, info)
+    xref = len(out)
+    out += b"xref\n%d 1\n%010d 00000 n \ntrailer\n<< /Size %d /Root %s /Info %d 0 R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" \
+           % (size, offset, size + 1, root, size, prev, xref)
+    return out
+
+
+_ttf = None
+
+def _unicode_fonts():
+    """
+    F1-F3 as TrueType fonts ReportLab embeds (subset) — CONTRACT_FONT, or
+    matplotlib's DejaVu Sans (Greek, Cyrillic, ...). None if neither exists.
+    """
+    global _ttf
+    if _ttf is None:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        if UNICODE_FONT:
+            files = [UNICODE_FONT] * 3
+        else:
+            try:
+                import matplotlib
+                base = os.path.join(matplotlib.get_data_path(), "fonts", "ttf", "DejaVuSans")
+                files = [base + ".ttf", base + "-Bold.ttf", base + "-Oblique.ttf"]
+            except ImportError:
+                files = []
+        if files and all(os.path.exists(f) for f in files):
+            names = ("ThronosSans", "ThronosSans-Bold", "ThronosSans-Oblique")
+            for name, path in zip(names, files):
+                pdfmetrics.registerFont(TTFont(name, path))
+            _ttf = dict(zip(FONTS, names))
+        else:
+            print("⚠️ No TrueType font for non-Latin contract text (set CONTRACT_FONT); it will print as '?'")
+            _ttf = {}
+    return _ttf or None
+
+
+def _reportlab_bytes(ops, fonts):
+    """The layout ops drawn with ReportLab in ``fonts`` (for text the standard fonts cannot encode)."""
+    from reportlab.pdfgen import canvas
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=(PAGE_W, PAGE_H))
+    c.setStrokeColorRGB(0.8, 0.8, 0.8)
+    for op in ops:
+        if op[0] == "line":
+            c.line(INCH, op[1], PAGE_W - INCH, op[1])
+        elif op[0] == "text":
+            _, font, size, y, s = op
+            c.setFont(fonts[font], size)
+            c.drawString(INCH, y, s)
+        else:
+            _, font, size, y, lines, leading = op
+            t = c.beginText(INCH, y)
+            t.setFont(fonts[font], size, leading)
+            for line in lines:
+                t.textLine(line)
+            c.drawText(t)
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+class ContractTemplate:
+    """
+    One contract layout, built once: catalog, page tree and font objects
+    as ready bytes, plus the static page layer (title, labels, divider
+    lines, footer) whose operators ``_op_bytes`` formats once. ``render``
+    only formats the per-contract fields, compresses the content stream
+    and writes the info dictionary and xref — no ReportLab canvas.
+
+    The standard fonts only print WinAnsi text: a contract with anything
+    else (Greek, Cyrillic, ...) is drawn from the same layout ops by
+    ReportLab with an embedded TrueType font (see ``_unicode_fonts``),
+    and gets the same info dictionary appended as an incremental update.
+
+    ``token=True`` is the token-dynamics layout (label and value on
+    separate lines, which is what ``contract_validator.parse_contract_text``
+    parses); ``token=False`` is the plain ``server.py`` contract.
+    """
+
+    # 1 catalog, 2 pages, 3 page, 4 contents, 5-7 fonts, 8 info
+    def __init__(self, token=False):
+        self.token = token
+        fonts = b"<< " + b" ".join(b"/%s %d 0 R" % (k.encode(), 5 + i) for i, k in enumerate(FONTS)) + b" >>"
+        objs = [
+            _obj(1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+            _obj(2, b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>"),
+            _obj(3, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R "
+                    b"/Resources << /Font %s /ProcSet [/PDF /Text] >> >>"
+                    % (PAGE_W, PAGE_H, fonts)),
+        ]
+        objs += [_obj(5 + i, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+                      % name.encode()) for i, name in enumerate(FONTS.values())]
+        self.prefix = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.offsets = {}
+        for num, o in zip((1, 2, 3, 5, 6, 7), objs):
+            self.offsets[num] = len(self.prefix)
+            self.prefix += o
+
+    def _plain(self, btc, text, thr, info):
+        return [
+            ("text", "F2", 18, PAGE_H - INCH, "THRONOS BLOCKCHAIN CONTRACT"),
+            ("text", "F1", 12, PAGE_H - 1.5 * INCH, f"BTC Address: {btc}"),
+            ("text", "F1", 12, PAGE_H - 1.8 * INCH, "Pledge Text:"),
+            ("block", "F1", 12, PAGE_H - 2.1 * INCH, _wrap(text), 14.4),
+            ("text", "F1", 12, PAGE_H - 2.1 * INCH - (len(text) // WRAP + 2) * 15, f"Generated THR Address: {thr}"),
+        ]
+
+    def _token(self, btc, text, thr, info):
+        info = info or {}
+        lines = _wrap(text)
+        y = PAGE_H - 3.6 * INCH - len(lines) * 14 - 0.5 * INCH
+        y2 = y - 1.2 * INCH
+        return [
+            ("text", "F2", 18, PAGE_H - INCH, "THRONOS BLOCKCHAIN CONTRACT"),
+            ("text", "F2", 12, PAGE_H - 1.5 * INCH, f"Contract ID: {hashlib.sha256(thr.encode()).hexdigest()[:12]}"),
+            ("text", "F2", 12, PAGE_H - 1.8 * INCH, f"Date: {time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime())}"),
+            ("line", PAGE_H - 2 * INCH),
+            ("text", "F2", 12, PAGE_H - 2.5 * INCH, "BTC Address:"),
+            ("text", "F1", 12, PAGE_H - 2.8 * INCH, btc),
+            ("text", "F2", 12, PAGE_H - 3.3 * INCH, "Pledge Text:"),
+            ("block", "F1", 12, PAGE_H - 3.6 * INCH, lines, 14.4),
+            ("line", y),
+            ("text", "F2", 12, y - 0.4 * INCH, "Generated THR Address:"),
+            ("text", "F1", 12, y - 0.7 * INCH, thr),
+            ("line", y2),
+            ("text", "F2", 12, y2 - 0.4 * INCH, "Token Dynamics Information:"),
+            ("text", "F1", 10, y2 - 0.7 * INCH, f"BTC Amount: {info.get('btc_amount', 'N/A')} BTC"),
+            ("text", "F1", 10, y2 - 0.9 * INCH, f"Current THR Value: {info.get('thr_rate', 'N/A')} BTC"),
+            ("text", "F1", 10, y2 - 1.1 * INCH, f"Equivalent THR: {info.get('thr_equivalent', 'N/A')} THR"),
+            ("text", "F1", 10, y2 - 1.3 * INCH, f"Valuation Timestamp: {info.get('timestamp', 'N/A')}"),
+            ("text", "F3", 10, INCH, FOOTER),
+            ("text", "F3", 10, 0.8 * INCH, f"Verification Hash: {hashlib.sha256((btc + thr).encode()).hexdigest()}"),
+        ]
+
+    def render_bytes(self, btc_addr, pledge_text, thr_addr, info=None, pledge_hash=None):
+        """The contract as PDF bytes, with its signed record in the info dictionary."""
+        ops = (self._token if self.token else self._plain)(btc_addr, pledge_text, thr_addr, info)
+        record = contract_record(btc_addr, thr_addr, pledge_hash)
+        fonts = None if _fits(btc_addr, pledge_text, thr_addr, *(info or {}).values()) else _unicode_fonts()
+        if fonts:
+            return _with_info(_reportlab_bytes(ops, fonts), _info(thr_addr, record))
+        out = self.prefix
+        offsets = dict(self.offsets)
+        offsets[4] = len(out)
+        out += _obj(4, b"<< /Filter /FlateDecode", zlib.compress(b"".join(map(_op_bytes, ops))))
+        offsets[8] = len(out)
+        out += _obj(8, _info(thr_addr, record))
+        xref = len(out)
+        out += b"xref\n0 9\n0000000000 65535 f \n" + b"".join(b"%010d 00000 n \n" % offsets[n] for n in range(1, 9))
+        out += b"trailer\n<< /Size 9 /Root 1 0 R /Info 8 0 R >>\nstartxref\n%d\n%%%%EOF\n" % xref
+        return out
+
+    def render(self, out, btc_addr, pledge_text, thr_addr, info=None, pledge_hash=None):
+        """Write the contract to the path ``out``."""
+        with open(out, "wb") as f:
+            f.write(self.render_bytes(btc_addr, pledge_text, thr_addr, info, pledge_hash))
+        return out
+
+
+_templates = {}
+
+def get_template(token=False):
+    """Per-process ContractTemplate (built on first use, also in pdf_jobs workers)."""
+    if token not in _templates:
+        _templates[token] = ContractTemplate(token)
+    return _templates[token]
+
+
+def render_contract(out, btc_addr, pledge_text, thr_addr, pledge_hash=None):
+    """Write the pledge contract for ``thr_addr`` to the path ``out``."""
+    return get_template().render(out, btc_addr, pledge_text, thr_addr, None, pledge_hash)
+
+
+def render_token_contract(out, btc_addr, pledge_text, thr_addr, token_value_info, pledge_hash=None):
+    """Write the token-dynamics contract (with valuation) to the path ``out``."""
+    return get_template(token=True).render(out, btc_addr, pledge_text, thr_addr, token_value_info, pledge_hash)
+
+
+def render_contracts(contracts, token=False):
+    """
+    Render many contracts in one call: ``contracts`` yields
+    ``(out, btc_addr, pledge_text, thr_addr[, token_value_info[, pledge_hash]])``.
+    Returns the written paths.
+    """
+    tpl = get_template(token)
+    return [tpl.render(*c) for c in contracts]
+
+
+def benchmark(n=300):
+    """ReportLab per contract vs the template, one by one and batched; checks parsing; times non-Latin text."""
+    import shutil
+    import tempfile
+    from contract_validator import ContractValidator
+
+    tmp = tempfile.mkdtemp(prefix="contract_bench_")
+    try:
+        text = "I pledge to keep the fire of the Thronos chain burning (and pay in BTC). " * 5
+        info = {"btc_amount": 0.001, "thr_rate": 0.0001, "thr_equivalent": 10.0, "timestamp": "2026-01-01 00:00:00"}
+        args = [(f"bc1q{i:038d}", text, f"THR{i:013d}") for i in range(n)]
+
+        tpl = get_template(token=True)
+        t0 = time.perf_counter()
+        for i, (btc, txt, thr) in enumerate(args):
+            with open(os.path.join(tmp, f"rl_{i}.pdf"), "wb") as f:
+                f.write(_reportlab_bytes(tpl._token(btc, txt, thr, info), FONTS))
+        rl = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for i, (btc, txt, thr) in enumerate(args):
+            render_token_contract(os.path.join(tmp, f"tpl_{i}.pdf"), btc, txt, thr, info)
+        single = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        render_contracts([(os.path.join(tmp, f"batch_{i}.pdf"), *a, info) for i, a in enumerate(args)], token=True)
+        batch = time.perf_counter() - t0
+
+        # το record δεν κρατά pledge_text· τα υπόλοιπα πεδία πρέπει να ταιριάζουν με το text parsing
+        keys = ("btc_address", "thr_address", "verification_hash", "contract_id")
+        same = all(
+            {k: ContractValidator(contract_path=os.path.join(tmp, f"rl_{i}.pdf")).extract_pdf_content().get(k) for k in keys} ==
+            {k: ContractValidator(contract_path=os.path.join(tmp, f"tpl_{i}.pdf")).extract_pdf_content().get(k) for k in keys}
+            for i in range(0, n, max(1, n // 10)))
+
+        greek = "Δεσμεύομαι να κρατήσω τη φωτιά της αλυσίδας Thronos αναμμένη. " * 5
+        m = max(1, n // 10)
+        t0 = time.perf_counter()
+        for i, (btc, txt, thr) in enumerate(args[:m]):
+            render_token_contract(os.path.join(tmp, f"el_{i}.pdf"), btc, greek, thr, info)
+        el = time.perf_counter() - t0
+        print(f"{n} token contracts: ReportLab {n / rl:,.0f}/s | template {n / single:,.0f}/s | "
+              f"batch {n / batch:,.0f}/s ({rl / batch:.0f}×) | extract_pdf_content identical: {same} | "
+              f"non-Latin text (ReportLab + TTF) {m / el:,.0f}/s")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+    else:
+        print("Usage: python contract_pdf.py bench")
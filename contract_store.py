@@ -0,0 +1,215 @@
+# contract_store.py - Content-addressed contract PDFs: SHA-256 blobs, NDJSON sidecar index, validation cache
+import os
+import json
+import time
+import hashlib
+import threading
+
+from contract_pdf import read_record_bytes
+
+# ─── CONFIG ────────────────────────────────────────
+CONTRACT_STORE = os.getenv("CONTRACT_STORE", "contract_store")
+INDEX_FILE     = "index.ndjson"
+MAX_AGE        = int(os.getenv("CONTRACT_MAX_AGE", 30 * 86400))   # Cache-Control για σερβιρισμένα contracts
+
+
+def digest_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ContractStore:
+    """
+    Contract PDFs stored once under the SHA-256 of their bytes
+    (``<root>/sha256/ab/abcd….pdf``), with an append-only sidecar index
+    (``index.ndjson``) of two record kinds:
+
+    - ``put``: thr_address / pledge_hash → digest, size, stored_at (and
+      the source file's mtime, for ``for_file``)
+    - ``check``: digest → valid, message, validated_at and the ``stamp``
+      of the pledge/chain state it was checked against
+
+    A blob never changes, so its digest doubles as the HTTP ETag, and a
+    validation result is keyed by digest: ``validation`` returns it while
+    the state stamp is unchanged — valid or not, since the message carries
+    the balance at check time. Other processes' appends are picked up on a
+    lookup miss.
+    """
+
+    def __init__(self, root=CONTRACT_STORE):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+        self.by_thr = {}
+        self.by_pledge = {}
+        self.by_digest = {}     # digest → τελευταίο put
+        self.checks = {}        # digest → τελευταίο check
+        self.counts = {"stored": 0, "deduplicated": 0, "hits": 0, "misses": 0}
+        self._offset = 0
+        self._lock = threading.RLock()
+        os.makedirs(os.path.join(root, "sha256"), exist_ok=True)
+        self._refresh()
+
+    def _apply(self, r):
+        if r.get("op") == "put":
+            self.by_digest[r["digest"]] = r
+            if r.get("thr_address"):
+                self.by_thr[r["thr_address"]] = r
+            if r.get("pledge_hash"):
+                self.by_pledge[r["pledge_hash"]] = r
+        elif r.get("op") == "check":
+            self.checks[r["digest"]] = r
+
+    def _refresh(self):
+        """Apply index lines appended since the last read (also by other processes)."""
+        with self._lock:
+            try:
+                with open(self.index_path, "rb") as f:
+                    f.seek(self._offset)
+                    chunk = f.read()
+            except FileNotFoundError:
+                return
+            end = chunk.rfind(b"\n") + 1    # μισογραμμένη τελευταία γραμμή: την επόμενη φορά
+            for line in chunk[:end].splitlines():
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    continue
+            self._offset += end
+
+    def _append(self, record):
+        with self._lock:
+            self._refresh()
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self._refresh()     # η δική μας γραμμή, μαζί με όσες έγραψαν άλλοι στο μεταξύ
+
+    def _lookup(self, table, key):
+        with self._lock:
+            if key not in table:
+                self._refresh()
+            return table.get(key)
+
+    # ─── BLOBS ─────────────────────────────────────
+    def blob_path(self, digest):
+        return os.path.join(self.root, "sha256", digest[:2], f"{digest}.pdf")
+
+    def put_file(self, path, thr_address=None, pledge_hash=None):
+        """
+        Store a copy of the PDF at ``path`` and index it.
+        Missing thr_address / pledge_hash come from the contract's
+        embedded record. Returns the index entry.
+        """
+        with open(path, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns   # πριν το read: μια αλλαγή στο μεταξύ φαίνεται την επόμενη φορά
+            data = f.read()
+        return self._put(data, thr_address, pledge_hash, mtime)
+
+    def put_bytes(self, data, thr_address=None, pledge_hash=None):
+        return self._put(data, thr_address, pledge_hash)
+
+    def _put(self, data, thr_address, pledge_hash, mtime=None):
+        digest = digest_bytes(data)
+        if not (thr_address and pledge_hash):
+            try:
+                record = read_record_bytes(data) or {}
+            except ValueError:
+                record = {}    # λάθος υπογραφή: αποθηκεύεται, αλλά χωρίς στοιχεία από το record
+            thr_address = thr_address or record.get("thr_address")
+            pledge_hash = pledge_hash or record.get("pledge_hash")
+
+        with self._lock:
+            known = self._lookup(self.by_digest, digest)
+            if (known and known.get("thr_address") == thr_address and known.get("pledge_hash") == pledge_hash
+                    and (mtime is None or known.get("mtime") == mtime)):
+                self.counts["deduplicated"] += 1
+                return dict(known)
+            blob = self.blob_path(digest)
+            if os.path.exists(blob):
+                self.counts["deduplicated"] += 1
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                # αντίγραφο, όχι hard link: ένα render πάνω στο αρχικό αρχείο δεν πρέπει να αλλάξει το blob
+                tmp = f"{blob}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, blob)
+                self.counts["stored"] += 1
+            entry = {"op": "put", "digest": digest, "size": len(data), "thr_address": thr_address,
+                     "pledge_hash": pledge_hash, "stored_at": time.time()}
+            if mtime is not None:
+                entry["mtime"] = mtime
+            self._append(entry)
+            return dict(entry)
+
+    def for_file(self, path, thr_address=None):
+        """
+        Index entry for a rendered contract file, storing it on first use.
+        The cached digest is only served while the file's size and mtime
+        match the entry; a re-rendered or replaced file is hashed again.
+        """
+        entry = self.get(thr_address=thr_address) if thr_address else None
+        if entry is not None:
+            st = os.stat(path)
+            if (st.st_size, st.st_mtime_ns) != (entry["size"], entry.get("mtime")) \
+                    or not os.path.exists(self.blob_path(entry["digest"])):
+                entry = None
+        if entry is None:
+            entry = self.put_file(path, thr_address=thr_address)
+        return entry
+
+    def get(self, thr_address=None, pledge_hash=None, digest=None):
+        """Latest index entry for a THR address, pledge hash or digest, or None."""
+        if digest:
+            entry = self._lookup(self.by_digest, digest)
+        elif pledge_hash:
+            entry = self._lookup(self.by_pledge, pledge_hash)
+        else:
+            entry = self._lookup(self.by_thr, thr_address)
+        if entry is None:
+            return None
+        check = self.checks.get(entry["digest"])
+        return dict(entry, valid=check["valid"] if check else None,
+                    validated_at=check["validated_at"] if check else None)
+
+    # ─── VALIDATION CACHE ──────────────────────────
+    def validation(self, digest, stamp=None):
+        """Cached (valid, message) for these bytes, or None if they must be checked again."""
+        check = self._lookup(self.checks, digest)
+        if check and check.get("stamp") == stamp:
+            self.counts["hits"] += 1
+            return check["valid"], check["message"]
+        self.counts["misses"] += 1
+        return None
+
+    def record_validation(self, digest, valid, message, stamp=None, thr_address=None):
+        self._append({"op": "check", "digest": digest, "valid": bool(valid), "message": message,
+                      "stamp": stamp, "thr_address": thr_address, "validated_at": time.time()})
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, contracts=len(self.by_digest), checked=len(self.checks))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_contract_store(root=CONTRACT_STORE):
+    """Shared ContractStore per root directory."""
+    key = os.path.abspath(root)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ContractStore(root)
+        return _stores[key]
+
+
+if __name__ == "__main__":
+    import sys
+    # python contract_store.py add <pdf...>  |  python contract_store.py show <thr_address>
+    store = open_contract_store()
+    if len(sys.argv) >= 3 and sys.argv[1] == "add":
+        for p in sys.argv[2:]:
+            e = store.put_file(p)
+            print(f"✅ {os.path.basename(p)} → {e['digest'][:16]}… ({e.get('thr_address')})")
+    elif len(sys.argv) == 3 and sys.argv[1] == "show":
+        print(json.dumps(store.get(thr_address=sys.argv[2]), indent=2))
+    else:
+        print("Usage: python contract_store.py add <pdf...> | show <thr_address>")
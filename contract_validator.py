@@ -1,4 +1,5 @@
 import os
+import io
 import json
 import hashlib
 import argparse
@@ -10,96 +11,143 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.colors import Color
 from PyPDF2 import PdfReader
 import time
+import sys
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from chain_store import open_chain
+from pledge_registry import open_registry
+from contract_pdf import read_record, read_record_bytes, SIGNING_KEY
+from contract_store import open_contract_store, digest_bytes, CONTRACT_STORE
 
-class ContractValidator:
-    def __init__(self, contract_path=None, pledge_chain_path=None, ledger_path=None, chain_file_path=None):
-        """
-        Initialize the contract validator with paths to relevant files
-        """
-        self.contract_path = contract_path
-        self.pledge_chain_path = pledge_chain_path or os.path.join(os.path.dirname(__file__), "pledge_chain.json")
-        self.ledger_path = ledger_path or os.path.join(os.path.dirname(__file__), "ledger.json")
-        self.chain_file_path = chain_file_path or os.path.join(os.path.dirname(__file__), "phantom_tx_chain.json")
+# ─── CONFIG ────────────────────────────────────────
+BATCH_WORKERS = int(os.getenv("CONTRACT_BATCH_WORKERS", os.cpu_count() or 1))
+BATCH_CHUNK   = int(os.getenv("CONTRACT_BATCH_CHUNK", 64))     # PDFs ανά εργασία του pool
+CSV_FIELDS    = ("path", "status", "btc_address", "thr_address", "contract_id", "digest", "cached", "message")
+
+
+def load_json(path):
+    """
+    Load JSON file, return empty dict if file not found
+    """
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def read_contract(path):
+    """
+    Contract fields from the signed record in the PDF info dictionary
+    (no text extraction); legacy PDFs without one fall back to parsing the
+    text, unless a signing key is configured — then they come back as
+    ``{"unsigned": True}``, which validation rejects
+    """
+    return load_contract(path)[1]
+
+
+def load_contract(path):
+    """
+    (SHA-256 of the file, contract fields) — read_contract plus the digest
+    the contract store caches validation results under
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    record = read_record_bytes(data)
+    if record is None:
+        reader = PdfReader(io.BytesIO(data))
+        record = read_record(reader.metadata)
+        if record is None:
+            if SIGNING_KEY:
+                # με κλειδί, το κείμενο της σελίδας δεν αποδεικνύει τίποτα: ένα PDF χωρίς record απορρίπτεται
+                record = {"unsigned": True}
+            else:
+                record = parse_contract_text("".join(page.extract_text() for page in reader.pages))
+    return digest_bytes(data), record
+
+
+def parse_contract_text(text_content):
+    """
+    Parse the key fields out of a contract's text
+    """
+    contract_data = {}
     
-    def load_json(self, path):
-        """
-        Load JSON file, return empty dict if file not found
-        """
-        try:
-            with open(path, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+    # Extract BTC Address
+    btc_index = text_content.find("BTC Address:")
+    if btc_index > -1:
+        btc_text = text_content[btc_index:].split("\n", 2)[1].strip()
+        contract_data["btc_address"] = btc_text
     
-    def extract_pdf_content(self):
+    # Extract THR Address
+    thr_index = text_content.find("Generated THR Address:")
+    if thr_index > -1:
+        thr_text = text_content[thr_index:].split("\n", 2)[1].strip()
+        contract_data["thr_address"] = thr_text
+    
+    # Extract Verification Hash
+    hash_index = text_content.find("Verification Hash:")
+    if hash_index > -1:
+        hash_text = text_content[hash_index:].split("\n", 1)[0].replace("Verification Hash:", "").strip()
+        contract_data["verification_hash"] = hash_text
+    
+    # Extract Contract ID
+    id_index = text_content.find("Contract ID:")
+    if id_index > -1:
+        id_text = text_content[id_index:].split("\n", 1)[0].replace("Contract ID:", "").strip()
+        contract_data["contract_id"] = id_text
+    
+    # Extract Pledge Text (more complex as it can span multiple lines)
+    pledge_index = text_content.find("Pledge Text:")
+    thr_index = text_content.find("Generated THR Address:")
+    if pledge_index > -1 and thr_index > -1:
+        # Get text between "Pledge Text:" and "Generated THR Address:"
+        pledge_text = text_content[pledge_index + len("Pledge Text:"):thr_index].strip()
+        contract_data["pledge_text"] = pledge_text
+    
+    return contract_data
+
+
+class ContractIndex:
+    """
+    The state contracts are checked against, loaded once: the pledge
+    registry (indexed by address), the set of THR addresses seen in the
+    chain and the ledger balances. ``validate`` is then dict lookups only,
+    so one index serves a whole batch. ``stamp`` identifies that state for
+    the contract store's validation cache.
+    """
+
+    def __init__(self, pledge_chain_path, ledger_path, chain_file_path):
+        self.pledges = open_registry(pledge_chain_path)
+        chain = open_chain(chain_file_path).all()
+        self.chain_addresses = {
+            block.get("thr_address")
+            for block in chain
+            if isinstance(block, dict)
+        }
+        ledger = load_json(ledger_path)
+        self.ledger = ledger if isinstance(ledger, dict) else {}
+        # και αν υπάρχει signing key: αλλάζει το τι περνά ως valid
+        self.stamp = f"{len(self.pledges)}:{len(chain)}:{'signed' if SIGNING_KEY else 'unsigned'}"
+
+    def check(self, digest, contract_data, store=None):
         """
-        Extract content from PDF contract
+        (is_valid, message, cached): ``validate`` through the store's cache,
+        so unchanged bytes whose result still holds are not checked again
         """
-        if not self.contract_path or not os.path.exists(self.contract_path):
-            print(f"Error: Contract file not found at {self.contract_path}")
-            return None
-        
-        try:
-            # Extract text content from PDF
-            pdf = PdfReader(self.contract_path)
-            text_content = ""
-            for page in pdf.pages:
-                text_content += page.extract_text()
-            
-            # Parse the content to extract key information
-            contract_data = {}
-            
-            # Extract BTC Address
-            btc_index = text_content.find("BTC Address:")
-            if btc_index > -1:
-                btc_text = text_content[btc_index:].split("\n", 2)[1].strip()
-                contract_data["btc_address"] = btc_text
-            
-            # Extract THR Address
-            thr_index = text_content.find("Generated THR Address:")
-            if thr_index > -1:
-                thr_text = text_content[thr_index:].split("\n", 2)[1].strip()
-                contract_data["thr_address"] = thr_text
-            
-            # Extract Verification Hash
-            hash_index = text_content.find("Verification Hash:")
-            if hash_index > -1:
-                hash_text = text_content[hash_index:].split("\n", 1)[0].replace("Verification Hash:", "").strip()
-                contract_data["verification_hash"] = hash_text
-            
-            # Extract Contract ID
-            id_index = text_content.find("Contract ID:")
-            if id_index > -1:
-                id_text = text_content[id_index:].split("\n", 1)[0].replace("Contract ID:", "").strip()
-                contract_data["contract_id"] = id_text
-            
-            # Extract Pledge Text (more complex as it can span multiple lines)
-            pledge_index = text_content.find("Pledge Text:")
-            thr_index = text_content.find("Generated THR Address:")
-            if pledge_index > -1 and thr_index > -1:
-                # Get text between "Pledge Text:" and "Generated THR Address:"
-                pledge_text = text_content[pledge_index + len("Pledge Text:"):thr_index].strip()
-                contract_data["pledge_text"] = pledge_text
-            
-            return contract_data
-        except Exception as e:
-            print(f"Error extracting content from PDF: {str(e)}")
-            return None
-    
-    def validate_contract(self):
+        cached = store.validation(digest, self.stamp) if store is not None else None
+        if cached:
+            return cached[0], cached[1], True
+        is_valid, message = self.validate(contract_data)
+        if store is not None:
+            store.record_validation(digest, is_valid, message, self.stamp, contract_data.get("thr_address"))
+        return is_valid, message, False
+
+    def validate(self, contract_data):
         """
-        Validate the contract against blockchain records
+        (is_valid, message) for the fields parsed out of one contract
         """
-        contract_data = self.extract_pdf_content()
-        if not contract_data:
-            return False, "Could not extract data from contract"
-        
-        # Load blockchain data
-        pledges = self.load_json(self.pledge_chain_path)
-        if isinstance(pledges, dict):
-            pledges = pledges.get("pledges", [])
-        
-        chain = self.load_json(self.chain_file_path)
+        if contract_data.get("unsigned"):
+            return False, "Contract has no signed record (unsigned or legacy PDF) and a signing key is configured"
         
         # Verify BTC and THR addresses exist in pledges
         btc_address = contract_data.get("btc_address")
@@ -108,21 +156,13 @@ class ContractValidator:
         if not btc_address or not thr_address:
             return False, "Missing BTC or THR address in contract"
         
-        # Find the pledge record
-        matching_pledge = None
-        for pledge in pledges:
-            if isinstance(pledge, dict) and pledge.get("btc_address") == btc_address and pledge.get("thr_address") == thr_address:
-                matching_pledge = pledge
-                break
+        # Find the pledge record (indexed lookup in the shared pledge registry)
+        matching_pledge = self.pledges.find(btc_address=btc_address, thr_address=thr_address)
+        address_active = thr_address in self.chain_addresses
         
         # If no matching pledge found, check if address exists in the blockchain
         if not matching_pledge:
-            address_in_chain = any(
-                block.get("thr_address") == thr_address 
-                for block in chain 
-                if isinstance(block, dict)
-            )
-            if not address_in_chain:
+            if not address_active:
                 return False, f"No record found for THR address {thr_address} in blockchain or pledge records"
             else:
                 return True, f"THR address {thr_address} exists in blockchain but not in pledge records"
@@ -134,16 +174,13 @@ class ContractValidator:
         if actual_hash != expected_hash:
             return False, f"Verification hash mismatch. Expected: {expected_hash}, Found: {actual_hash}"
         
-        # Check if THR address is active in blockchain
-        address_active = any(
-            block.get("thr_address") == thr_address 
-            for block in chain 
-            if isinstance(block, dict)
-        )
+        # The signed record also names the pledge it was issued for
+        pledge_hash = contract_data.get("pledge_hash")
+        if pledge_hash and pledge_hash != matching_pledge.get("pledge_hash"):
+            return False, f"Pledge hash mismatch. Expected: {matching_pledge.get('pledge_hash')}, Found: {pledge_hash}"
         
         # Get balance if available
-        ledger = self.load_json(self.ledger_path)
-        balance = ledger.get(thr_address, 0.0) if isinstance(ledger, dict) else 0.0
+        balance = self.ledger.get(thr_address, 0.0)
         
         # Contract is valid
         result_message = (
@@ -156,6 +193,51 @@ class ContractValidator:
         )
         
         return True, result_message
+
+class ContractValidator:
+    def __init__(self, contract_path=None, pledge_chain_path=None, ledger_path=None, chain_file_path=None,
+                 store_path=None):
+        """
+        Initialize the contract validator with paths to relevant files
+        """
+        self.contract_path = contract_path
+        self.store_path = store_path or CONTRACT_STORE
+        self.digest = None
+        self.pledge_chain_path = pledge_chain_path or os.path.join(os.path.dirname(__file__), "pledge_chain.json")
+        self.ledger_path = ledger_path or os.path.join(os.path.dirname(__file__), "ledger.json")
+        self.chain_file_path = chain_file_path or os.path.join(os.path.dirname(__file__), "phantom_tx_chain.json")
+    
+    def load_json(self, path):
+        """
+        Load JSON file, return empty dict if file not found
+        """
+        return load_json(path)
+    
+    def extract_pdf_content(self):
+        """
+        Extract content from PDF contract
+        """
+        if not self.contract_path or not os.path.exists(self.contract_path):
+            print(f"Error: Contract file not found at {self.contract_path}")
+            return None
+        
+        try:
+            self.digest, contract_data = load_contract(self.contract_path)
+            return contract_data
+        except Exception as e:
+            print(f"Error extracting content from PDF: {str(e)}")
+            return None
+    
+    def validate_contract(self):
+        """
+        Validate the contract against blockchain records
+        """
+        contract_data = self.extract_pdf_content()
+        if not contract_data:
+            return False, "Could not extract data from contract"
+        index = ContractIndex(self.pledge_chain_path, self.ledger_path, self.chain_file_path)
+        is_valid, message, _ = index.check(self.digest, contract_data, open_contract_store(self.store_path))
+        return is_valid, message
     
     def generate_validation_report(self, output_path=None):
         """
@@ -216,7 +298,7 @@ class ContractValidator:
         c.drawText(text_object)
         
         # Add footer
-        c.setFont("Helvetica-Italic", 9)
+        c.setFont("Helvetica-Oblique", 9)
         c.drawString(1*inch, 1*inch, "This is an automatically generated report by the Thronos Blockchain Contract Validator.")
         c.drawString(1*inch, 0.8*inch, f"Report ID: {hashlib.sha256(str(time.time()).encode()).hexdigest()[:16]}")
         
@@ -225,21 +307,129 @@ class ContractValidator:
         print(f"Validation report generated: {output_path}")
         return output_path, is_valid
 
+def _extract_chunk(paths):
+    """
+    Pool task: read a chunk of contracts (text extraction of legacy PDFs is the CPU-bound part)
+    """
+    results = []
+    for path in paths:
+        try:
+            results.append((path, *load_contract(path), None))
+        except Exception as e:
+            results.append((path, None, None, str(e)))
+    return results
+
+
+def _extracted(chunks, workers):
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _extract_chunk(chunk)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        for fut in as_completed([pool.submit(_extract_chunk, chunk) for chunk in chunks]):
+            yield from fut.result()
+
+
+def contract_files(directory):
+    """
+    Contract PDFs under ``directory``, skipping generated validation_*.pdf reports
+    """
+    found = []
+    for root, _, files in os.walk(directory):
+        found += [os.path.join(root, f) for f in files
+                  if f.lower().endswith(".pdf") and not f.startswith("validation_")]
+    return sorted(found)
+
+
+def validate_batch(directory, index, workers=BATCH_WORKERS, chunk=BATCH_CHUNK, store=None):
+    """
+    One result dict per contract under ``directory``, yielded as the pool
+    finishes each chunk (so not in path order when workers > 1). PDFs are
+    read and hashed in the workers; checks run here against the shared
+    ``index``, through ``store``'s validation cache when one is given.
+    """
+    paths = contract_files(directory)
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    for path, digest, data, error in _extracted(chunks, workers):
+        cached = False
+        if data:
+            is_valid, message, cached = index.check(digest, data, store)
+            status = "valid" if is_valid else "invalid"
+        else:
+            status, message = "unreadable", error or "Could not extract data from contract"
+        data = data or {}
+        yield {"path": path, "status": status, "btc_address": data.get("btc_address"),
+               "thr_address": data.get("thr_address"), "contract_id": data.get("contract_id"),
+               "digest": digest, "cached": cached, "message": message}
+
+
+def write_results(results, out, fmt="ndjson"):
+    """
+    Stream results to ``out`` as NDJSON or CSV; returns the counts per status
+    """
+    counts = {"valid": 0, "invalid": 0, "unreadable": 0}
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, CSV_FIELDS)
+        writer.writeheader()
+    for r in results:
+        counts[r["status"]] += 1
+        if writer:
+            writer.writerow(r)
+        else:
+            out.write(json.dumps(r) + "\n")
+    return counts
+
+
+def run_batch(args):
+    index = ContractIndex(
+        args.pledge_chain or os.path.join(os.path.dirname(__file__), "pledge_chain.json"),
+        args.ledger or os.path.join(os.path.dirname(__file__), "ledger.json"),
+        args.chain or os.path.join(os.path.dirname(__file__), "phantom_tx_chain.json"),
+    )
+    store = None if args.no_cache else open_contract_store(args.store)
+    t0 = time.perf_counter()
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        counts = write_results(validate_batch(args.batch, index, workers=args.workers, store=store), out, args.format)
+    finally:
+        if args.output:
+            out.close()
+    if args.summary:
+        total = sum(counts.values())
+        elapsed = time.perf_counter() - t0
+        print(json.dumps(dict(counts, contracts=total, seconds=round(elapsed, 2),
+                              per_second=round(total / elapsed, 1) if elapsed else None,
+                              cache_hits=store.counts["hits"] if store else 0)), file=sys.stderr)
+    return 0 if counts["invalid"] == counts["unreadable"] == 0 else 1
+
+
 def main():
     parser = argparse.ArgumentParser(description="Validate Thronos blockchain contracts")
-    parser.add_argument("contract_path", help="Path to the contract PDF file")
+    parser.add_argument("contract_path", nargs="?", help="Path to the contract PDF file")
+    parser.add_argument("--batch", metavar="DIR", help="Validate every contract PDF under DIR, one result per line")
     parser.add_argument("--pledge-chain", help="Path to the pledge chain file", default=None)
     parser.add_argument("--ledger", help="Path to the ledger file", default=None)
     parser.add_argument("--chain", help="Path to the blockchain file", default=None)
-    parser.add_argument("--output", help="Path for the validation report output", default=None)
+    parser.add_argument("--output", help="Path for the validation report output (--batch: results file, default stdout)", default=None)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="--batch result format")
+    parser.add_argument("--summary", action="store_true", help="--batch: print counts and throughput to stderr")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="--batch: PDF parsing processes")
+    parser.add_argument("--store", default=CONTRACT_STORE, help="Contract store whose index caches validation results")
+    parser.add_argument("--no-cache", action="store_true", help="--batch: validate every contract, record nothing")
     
     args = parser.parse_args()
+    if args.batch:
+        return run_batch(args)
+    if not args.contract_path:
+        parser.error("contract_path or --batch DIR is required")
     
     validator = ContractValidator(
         contract_path=args.contract_path,
         pledge_chain_path=args.pledge_chain,
         ledger_path=args.ledger,
-        chain_file_path=args.chain
+        chain_file_path=args.chain,
+        store_path=args.store
     )
     
     report_path, is_valid = validator.generate_validation_report(args.output)
@@ -0,0 +1,196 @@
+# esplora_cache.py - Two-tier cache for Esplora (blockstream.info) responses
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# ─── CONFIG ────────────────────────────────────────
+CACHE_DIR  = os.getenv("ESPLORA_CACHE_DIR", "esplora_cache")
+LIST_TTL   = float(os.getenv("ESPLORA_LIST_TTL", 30))       # δευτερόλεπτα για listings / mempool
+LIST_SIZE  = int(os.getenv("ESPLORA_LIST_SIZE", 1024))      # entries στο LRU
+TX_PATH_RE = re.compile(r"/tx/([0-9a-fA-F]{64})")
+
+
+class TxStore:
+    """
+    Confirmed transactions on disk, one JSON file per txid.
+
+    A txid is the hash of the transaction, so the store is content
+    addressed: once a confirmed tx is written it never has to be fetched
+    again. Files are fanned out by the first two hex digits and written
+    atomically (tmp + replace).
+    """
+
+    def __init__(self, root=os.path.join(CACHE_DIR, "tx")):
+        self.root = root
+
+    def _path(self, txid):
+        txid = txid.lower()
+        return os.path.join(self.root, txid[:2], txid + ".json")
+
+    def get(self, txid):
+        try:
+            with open(self._path(txid), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, tx):
+        path = self._path(tx["txid"])
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(tx, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def __len__(self):
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(len(files) for _, _, files in os.walk(self.root))
+
+
+class TTLCache:
+    """Small in-memory LRU whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=LIST_SIZE, ttl=LIST_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()   # key → (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class EsploraCache:
+    """
+    Sits between phantom_gateway_mainnet and the Esplora HTTP API.
+
+    ``get(path, fetch)`` answers ``/tx/<txid>`` from the TxStore when the
+    tx is confirmed, and everything else (address listings, mempool) from
+    the TTL/LRU tier. Confirmed txs that arrive inside listings are
+    written to the TxStore as well. Concurrent misses for the same path
+    share one ``fetch(path)`` call. Returned objects are shared between
+    callers and must not be mutated.
+    """
+
+    def __init__(self, store=None, lists=None):
+        self.store = store or TxStore()
+        self.lists = lists or TTLCache()
+        self.stats = {"tx_hits": 0, "tx_misses": 0, "list_hits": 0, "list_misses": 0,
+                      "coalesced": 0, "fetches": 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fetch_once(self, path, fetch):
+        """Single-flight: one fetch per path at a time, other callers wait for its result."""
+        with self._lock:
+            fut = self._inflight.get(path)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[path] = Future()
+                self.stats["fetches"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return fut.result()
+        try:
+            result = fetch(path)
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(path, None)
+
+    def _persist(self, tx):
+        if isinstance(tx, dict) and tx.get("txid") and "vout" in tx and tx.get("status", {}).get("confirmed"):
+            self.store.put(tx)
+
+    def get(self, path, fetch):
+        m = TX_PATH_RE.fullmatch(path)
+        if m:
+            tx = self.store.get(m.group(1))
+            if tx is not None:
+                self._count("tx_hits")
+                return tx
+            self._count("tx_misses")
+            tx = self._fetch_once(path, fetch)
+            self._persist(tx)
+            return tx
+
+        value = self.lists.get(path)
+        if value is not None:
+            self._count("list_hits")
+            return value
+        self._count("list_misses")
+        value = self._fetch_once(path, fetch)
+        if isinstance(value, list):
+            for tx in value:
+                self._persist(tx)   # τα confirmed tx του listing δεν αλλάζουν ποτέ
+        self.lists.put(path, value)
+        return value
+
+    def snapshot(self):
+        """Counters plus current sizes, for sizing the cache."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["list_entries"] = len(self.lists)
+        stats["list_evictions"] = self.lists.evictions
+        for tier in ("tx", "list"):
+            total = stats[f"{tier}_hits"] + stats[f"{tier}_misses"]
+            stats[f"{tier}_hit_rate"] = round(stats[f"{tier}_hits"] / total, 3) if total else None
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Process-wide EsploraCache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EsploraCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    import sys
+    # python esplora_cache.py stats
+    if len(sys.argv) >= 2 and sys.argv[1] == "stats":
+        print(f"{len(TxStore())} confirmed txs in {os.path.join(CACHE_DIR, 'tx')}")
+    else:
+        print("Usage: python esplora_cache.py stats")
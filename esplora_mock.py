@@ -0,0 +1,290 @@
+# esplora_mock.py - Local Esplora-compatible stand-in (synthetic histories, record/replay) + gateway benchmark
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+
+# ─── CONFIG ────────────────────────────────────────
+MOCK_PORT     = int(os.getenv("ESPLORA_MOCK_PORT", 3002))
+RECEIVER      = "1FQov4P8yzUU1Af4C5QNyAfQauc4maytKo"   # το BTC_RECEIVER των servers
+PAGE_SIZE     = 25      # confirmed txs ανά σελίδα, όπως το Esplora
+MEMPOOL_LIMIT = 50
+TIP_HEIGHT    = 850_000
+
+
+class SyntheticChain:
+    """
+    Deterministic address histories, generated on first request.
+
+    Every address gets ``txs`` confirmed transactions (newest first, one
+    block apart) and ``mempool`` unconfirmed ones, all spending from the
+    address. With probability ``paid_ratio`` (decided by the address hash,
+    so it is stable across runs) the newest confirmed tx pays ``amount``
+    BTC to RECEIVER; those payments also show up in RECEIVER's own history.
+    """
+
+    def __init__(self, txs=50, mempool=0, paid_ratio=1.0, amount=0.0001):
+        self.txs = txs
+        self.mempool = mempool
+        self.paid_ratio = paid_ratio
+        self.amount = amount
+        self._histories = {}     # address → (mempool, confirmed)
+        self._by_txid = {}
+        self._received = []      # πληρωμές προς τον RECEIVER, νεότερες πρώτα
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _txid(address, i):
+        return hashlib.sha256(f"{address}|{i}".encode()).hexdigest()
+
+    def _tx(self, address, i, to, sats, height):
+        status = {"confirmed": False}
+        if height is not None:
+            status = {"confirmed": True, "block_height": height,
+                      "block_hash": hashlib.sha256(str(height).encode()).hexdigest(),
+                      "block_time": 1_700_000_000 + height * 600}
+        return {
+            "txid":   self._txid(address, i),
+            "vin":    [{"txid": self._txid(address, f"in{i}"), "vout": 0,
+                        "prevout": {"scriptpubkey_address": address, "value": sats + 1000}}],
+            "vout":   [{"scriptpubkey_address": to, "value": sats}],
+            "fee":    1000,
+            "status": status
+        }
+
+    def history(self, address):
+        with self._lock:
+            if address in self._histories:
+                return self._histories[address]
+            if address == RECEIVER:
+                return [], self._received
+            seed = int(hashlib.sha256(address.encode()).hexdigest()[:8], 16)
+            paid = (seed % 10_000) / 10_000 < self.paid_ratio
+            confirmed = []
+            for i in range(self.txs):
+                to = RECEIVER if paid and i == 0 else f"bc1qsink{seed % 997:04d}"
+                sats = int(self.amount * 1e8) if to == RECEIVER else 50_000 + i
+                confirmed.append(self._tx(address, i, to, sats, TIP_HEIGHT - (seed % 50) - i))
+            mempool = [self._tx(address, f"m{i}", f"bc1qsink{i:04d}", 20_000, None)
+                       for i in range(self.mempool)]
+            for tx in mempool + confirmed:
+                self._by_txid[tx["txid"]] = tx
+            if paid:
+                self._received.insert(0, confirmed[0])
+            self._histories[address] = (mempool, confirmed)
+            return mempool, confirmed
+
+    def tx(self, txid):
+        with self._lock:
+            return self._by_txid.get(txid)
+
+    def route(self, path):
+        """(status, body) for an Esplora API path (without the /api prefix)."""
+        parts = [p for p in path.split("/") if p]
+        if len(parts) == 2 and parts[0] == "tx":
+            tx = self.tx(parts[1])
+            return (200, tx) if tx else (404, "Transaction not found")
+        if len(parts) >= 3 and parts[0] == "address" and parts[2] == "txs":
+            mempool, confirmed = self.history(parts[1])
+            rest = parts[3:]
+            if not rest:
+                return 200, mempool[:MEMPOOL_LIMIT] + confirmed[:PAGE_SIZE]
+            if rest == ["mempool"]:
+                return 200, mempool[:MEMPOOL_LIMIT]
+            if rest[0] == "chain":
+                start = 0
+                if len(rest) > 1:
+                    start = next((k + 1 for k, t in enumerate(confirmed) if t["txid"] == rest[1]), None)
+                    if start is None:
+                        return 400, "Invalid hex string"
+                return 200, confirmed[start:start + PAGE_SIZE]
+        return 404, "Not found"
+
+
+class Fixtures:
+    """Recorded responses on disk, one JSON file per request path."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _file(self, path):
+        return os.path.join(self.root, hashlib.sha1(path.encode()).hexdigest() + ".json")
+
+    def get(self, path):
+        try:
+            with open(self._file(path), "r") as f:
+                rec = json.load(f)
+            return rec["status"], rec["body"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def put(self, path, status, body):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._file(path) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"path": path, "status": status, "body": body}, f)
+        os.replace(tmp, self._file(path))
+
+
+class MockEsplora:
+    """
+    The HTTP side: serves ``/api/...`` (or the bare paths) from, in order,
+    recorded fixtures, the upstream when recording, or the synthetic chain.
+    ``latency`` (+ up to ``jitter``) seconds are slept per request.
+    """
+
+    def __init__(self, chain=None, fixtures=None, upstream=None, latency=0.0, jitter=0.0):
+        self.chain = chain if chain is not None else SyntheticChain()
+        self.fixtures = fixtures
+        self.upstream = upstream
+        self.latency = latency
+        self.jitter = jitter
+        self.stats = {"requests": 0, "replayed": 0, "recorded": 0, "synthetic": 0}
+
+    def respond(self, path):
+        self.stats["requests"] += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.fixtures:
+            hit = self.fixtures.get(path)
+            if hit is not None:
+                self.stats["replayed"] += 1
+                return hit
+            if self.upstream:
+                import http_client
+                r = http_client.get(self.upstream + path)
+                try:
+                    body = r.json()
+                except ValueError:
+                    body = r.text
+                self.fixtures.put(path, r.status_code, body)
+                self.stats["recorded"] += 1
+                return r.status_code, body
+        self.stats["synthetic"] += 1
+        return self.chain.route(path)
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"        # keep-alive, όπως το πραγματικό
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path.startswith("/api/"):
+                    path = path[4:]
+                status, body = mock.respond(path)
+                data = (json.dumps(body) if not isinstance(body, str) else body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json" if not isinstance(body, str) else "text/plain")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def serve(self, host="127.0.0.1", port=MOCK_PORT):
+        """Start serving in a daemon thread; returns ``(server, base_url)``."""
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="esplora-mock").start()
+        return server, f"http://{host}:{server.server_address[1]}/api"
+
+
+def benchmark(addresses=200, txs=100, latency=0.03, pledges=200):
+    """
+    Offline numbers for the BTC gateway: get_btc_txns cold/warm over a
+    mock with ``latency`` per request, then /pledge_submit throughput and
+    time until every submitted pledge is verified by the watcher.
+    """
+    import shutil
+    import tempfile
+    import importlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    tmp = tempfile.mkdtemp(prefix="esplora_bench_")
+    mock = MockEsplora(SyntheticChain(txs=txs, mempool=2), latency=latency)
+    server, base_url = mock.serve(port=0)
+    # όλα τα runtime αρχεία στο tmp· χωρίς rate limit προς το loopback
+    os.environ.update(ESPLORA_BASE_URL=base_url, ESPLORA_CACHE_DIR=os.path.join(tmp, "cache"),
+                      ESPLORA_LIST_SIZE=str(addresses * (txs // PAGE_SIZE + 3)),   # όλο το working set
+                      HTTP_HOST_RATES="127.0.0.1=100000:100000", PLEDGE_POLL_SECONDS="0.2")
+    import phantom_gateway_mainnet as gw
+    import logging
+    logging.getLogger("phantom_gateway").setLevel(logging.WARNING)
+
+    addrs = [f"bc1qbench{i:030d}" for i in range(addresses)]
+    for label in ("cold", "warm"):
+        mock.stats["requests"] = 0
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(16) as pool:
+            paid = sum(bool(r) for r in pool.map(lambda a: gw.get_btc_txns(a, RECEIVER), addrs))
+        dt = time.perf_counter() - t0
+        print(f"get_btc_txns {label}: {addresses} addresses × {txs} txs, {latency * 1000:.0f}ms latency → "
+              f"{addresses / dt:,.1f} lookups/s, {mock.stats['requests']} upstream requests, {paid} paid")
+
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        server_mod = importlib.import_module("server")
+        server_mod.CONTRACTS_DIR = os.path.join(tmp, "contracts")
+        os.makedirs(server_mod.CONTRACTS_DIR, exist_ok=True)
+        client = server_mod.app.test_client()
+        ids = []
+        t0 = time.perf_counter()
+        for i in range(pledges):
+            r = client.post("/pledge_submit", json={"btc_address": f"bc1qpledge{i:029d}", "pledge_text": "bench"})
+            ids.append(r.get_json()["id"])
+        submit = time.perf_counter() - t0
+        while any(server_mod.pledges.status(pid)["status"] == "pending" for pid in ids):
+            time.sleep(0.05)
+        done = time.perf_counter() - t0
+        server_mod.pdfs.wait()   # τα PDF γράφονται ακόμη
+        print(f"/pledge_submit: {pledges / submit:,.0f} req/s (202), all {pledges} verified after {done:.2f}s "
+              f"({server_mod.pledges.stats['address_checks']} address checks)")
+        server_mod.scheduler.shutdown(wait=False)
+        server_mod.pledges.stop()
+    finally:
+        os.chdir(cwd)
+        server.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Local Esplora stand-in for the BTC gateway")
+    ap.add_argument("command", nargs="?", default="serve", choices=["serve", "record", "bench"])
+    ap.add_argument("--port", type=int, default=MOCK_PORT)
+    ap.add_argument("--txs", type=int, default=50, help="confirmed txs per synthetic address")
+    ap.add_argument("--mempool", type=int, default=0, help="unconfirmed txs per synthetic address")
+    ap.add_argument("--paid-ratio", type=float, default=1.0, help="share of addresses that paid the receiver")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    ap.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    ap.add_argument("--fixtures", help="directory of recorded responses to replay (and to record into)")
+    ap.add_argument("--upstream", default="https://blockstream.info/api", help="record: where misses are fetched from")
+    args = ap.parse_args()
+
+    if args.command == "bench":
+        benchmark(latency=args.latency or 0.03)
+    else:
+        if args.command == "record" and not args.fixtures:
+            ap.error("record needs --fixtures DIR")
+        mock = MockEsplora(SyntheticChain(args.txs, args.mempool, args.paid_ratio),
+                           fixtures=Fixtures(args.fixtures) if args.fixtures else None,
+                           upstream=args.upstream if args.command == "record" else None,
+                           latency=args.latency, jitter=args.jitter)
+        server, base_url = mock.serve(port=args.port)
+        print(f"🧪 Esplora mock on {base_url} ({args.command}) — export ESPLORA_BASE_URL={base_url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,246 @@
+# http_client.py - Shared outbound HTTP: keep-alive pool, per-host rate limit, jittered retries, circuit breaker
+import os
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# ─── CONFIG ────────────────────────────────────────
+TIMEOUT       = float(os.getenv("HTTP_TIMEOUT", 10))          # default όταν ο caller δεν δίνει
+POOL_SIZE     = int(os.getenv("HTTP_POOL_SIZE", 16))          # keep-alive connections ανά host
+MAX_RETRIES   = int(os.getenv("HTTP_MAX_RETRIES", 4))
+BACKOFF_BASE  = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))    # δευτερόλεπτα, διπλασιάζεται
+BACKOFF_CAP   = float(os.getenv("HTTP_BACKOFF_CAP", 30))
+BREAKER_FAILS = int(os.getenv("HTTP_BREAKER_FAILS", 5))       # συνεχόμενα failures → open
+BREAKER_RESET = float(os.getenv("HTTP_BREAKER_RESET", 30))    # δευτερόλεπτα μέχρι half-open
+DEFAULT_RATE  = (float(os.getenv("HTTP_RATE", 10)), int(os.getenv("HTTP_BURST", 20)))
+# requests/sec και burst ανά upstream· override: HTTP_HOST_RATES="blockstream.info=4:8,host=rate:burst"
+HOST_RATES    = {"blockstream.info": (4.0, 8)}
+for _spec in filter(None, os.getenv("HTTP_HOST_RATES", "").split(",")):
+    _host, _, _rate = _spec.partition("=")
+    _r, _, _b = _rate.partition(":")
+    HOST_RATES[_host.strip()] = (float(_r), int(_b or max(1, float(_r))))
+
+RETRY_STATUS  = {429, 500, 502, 503, 504}
+SAFE_RETRY    = {429}         # για POST: μόνο ό,τι σημαίνει «δεν το επεξεργάστηκα»· τα υπόλοιπα με retry_status=
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The host's circuit breaker is open; the call was not attempted."""
+
+
+class TokenBucket:
+    """``rate`` tokens per second, at most ``burst`` saved up; ``acquire`` waits for one."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available; returns the time waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Closed → open after ``fails`` consecutive failures; after ``reset`` seconds
+    one trial call is let through (half-open), whose outcome closes or re-opens it.
+    """
+
+    def __init__(self, fails=BREAKER_FAILS, reset=BREAKER_RESET):
+        self.fails = fails
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset:
+                self.state = "half-open"
+                self._trial = False
+            if self.state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.fails:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class _Host:
+    def __init__(self, host):
+        rate, burst = HOST_RATES.get(host, DEFAULT_RATE)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0,
+                      "rejected": 0, "rate_wait": 0.0}
+
+
+class HttpClient:
+    """
+    One ``requests.Session`` (keep-alive, pooled) for every outbound call.
+
+    Per upstream host a token bucket paces requests and a circuit breaker
+    stops calling a host that keeps failing (``CircuitOpenError``, a
+    ``requests.ConnectionError``, is raised without touching the network).
+    Connection errors, 429 and 5xx are retried with full-jitter
+    exponential backoff, honouring ``Retry-After``; non-GET requests are
+    only retried when the upstream cannot have acted on them — the
+    connection was never made (connect timeout, refused, DNS) or it
+    answered 429 — plus any statuses the caller passes as
+    ``retry_status``. A 429 proves the host is up, so it does not count
+    towards the breaker. The last response is returned as is, so callers
+    keep using ``raise_for_status()``.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _Host(host)
+            return self._hosts[host]
+
+    @staticmethod
+    def _backoff(attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), BACKOFF_CAP)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def _not_sent(e):
+        """True if the request never reached the upstream (no connection was made)."""
+        if isinstance(e, requests.exceptions.ConnectTimeout):
+            return True
+        if not isinstance(e, requests.ConnectionError) or not e.args:
+            return False
+        # requests τυλίγει το MaxRetryError του urllib3· NameResolutionError είναι υποκλάση του NewConnectionError
+        return isinstance(getattr(e.args[0], "reason", e.args[0]), NewConnectionError)
+
+    def request(self, method, url, retry_status=(), **kwargs):
+        """``retry_status``: extra statuses a non-GET call may be retried on (the caller knows it is safe)."""
+        kwargs.setdefault("timeout", self.timeout)
+        method = method.upper()
+        safe_status = SAFE_RETRY | set(retry_status)
+        h = self._host(url)
+        attempt = 0
+        while True:
+            if not h.breaker.allow():
+                h.stats["rejected"] += 1
+                raise CircuitOpenError(f"circuit open for {urlsplit(url).hostname}")
+            h.stats["rate_wait"] += h.bucket.acquire()
+            h.stats["requests"] += 1
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                h.stats["errors"] += 1
+                h.breaker.failure()
+                # μετά από read timeout ή reset ένα POST μπορεί να έχει ήδη γίνει
+                retryable = method == "GET" or self._not_sent(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                h.stats["retries"] += 1
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if resp.status_code not in RETRY_STATUS:
+                h.breaker.success()
+                return resp
+            if resp.status_code == 429:
+                h.stats["throttled"] += 1
+                h.breaker.success()     # ο host απαντά· το rate limit δεν είναι βλάβη
+            else:
+                h.breaker.failure()
+            retryable = method == "GET" or resp.status_code in safe_status
+            if not retryable or attempt >= self.max_retries:
+                return resp
+            h.stats["retries"] += 1
+            time.sleep(self._backoff(attempt, resp))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Counters and breaker state per host."""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: dict(h.stats, rate_wait=round(h.stats["rate_wait"], 3), breaker=h.breaker.state)
+                for host, h in hosts.items()}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Process-wide HttpClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    # python http_client.py <url>   → ένα GET μέσα από τον client, με τα stats
+    if len(sys.argv) < 2:
+        print("Usage: python http_client.py <url>")
+        sys.exit(1)
+    r = get(sys.argv[1])
+    print(r.status_code, r.text[:200])
+    print(json.dumps(get_client().stats(), indent=2))
@@ -0,0 +1,238 @@
+# ledger_state.py - Resident in-memory ledger with asynchronous snapshots
+import os
+import json
+import time
+import atexit
+import threading
+
+from chain_store import ChainLog, open_chain, CHAIN_FILE
+
+# ─── CONFIG ────────────────────────────────────────
+LEDGER_FILE       = "ledger.json"
+SNAPSHOT_INTERVAL = float(os.getenv("LEDGER_SNAPSHOT_INTERVAL", 5))    # δευτερόλεπτα
+SNAPSHOT_DIRTY    = int(os.getenv("LEDGER_SNAPSHOT_DIRTY", 1000))      # αλλαγές πριν από άμεσο snapshot
+
+
+def record_transactions(record):
+    """The transfers a chain record carries: a sealed block's ``transactions``, else the record itself."""
+    if isinstance(record, dict) and isinstance(record.get("transactions"), list):
+        return record["transactions"]
+    return [record]
+
+
+def apply_record(balances, record):
+    """
+    Fold one chain record into a balances dict.
+
+    Transfers debit ``from`` by amount + fee and credit ``to``; mined blocks
+    credit ``reward_to_miner`` to ``thr_address``; sealed transfer blocks
+    apply each of their ``transactions``. Anything else (pledges, notes)
+    leaves balances untouched. Returns the addresses that changed.
+    """
+    if not isinstance(record, dict):
+        return ()
+    if isinstance(record.get("transactions"), list):
+        changed = []
+        for tx in record["transactions"]:
+            changed.extend(apply_record(balances, tx))
+        return tuple(changed)
+    if record.get("from") and record.get("to") and "amount" in record:
+        frm, to_ = record["from"], record["to"]
+        amount = float(record.get("amount", 0))
+        fee    = float(record.get("fee", 0) or 0)
+        balances[frm] = round(balances.get(frm, 0.0) - amount - fee, 6)
+        balances[to_] = round(balances.get(to_, 0.0) + amount, 6)
+        return (frm, to_)
+    if record.get("thr_address") and "reward_to_miner" in record:
+        miner = record["thr_address"]
+        balances[miner] = round(balances.get(miner, 0.0) + float(record["reward_to_miner"]), 6)
+        return (miner,)
+    return ()
+
+
+class LedgerEngine:
+    """
+    Owns THR balances in memory and keeps them in step with the chain.
+
+    The engine subscribes to the ChainLog, so every appended transfer or
+    mined block is applied under the engine lock the moment it is written;
+    reads refresh the chain first, picking up records other processes
+    appended. Balances change only through chain records, so every engine
+    replays the same state.
+    A background thread writes ``ledger.snapshot.json`` (balances plus the
+    chain height they cover) every ``interval`` seconds, or sooner once
+    ``dirty_threshold`` changes have piled up, and mirrors the plain
+    ``ledger.json`` for scripts that still read it directly.
+
+    On restart the last snapshot is loaded and the chain is replayed from
+    its height. Without a snapshot the legacy ``ledger.json`` is taken as
+    the state at the current chain tip.
+    """
+
+    def __init__(self, path=LEDGER_FILE, chain=None, interval=SNAPSHOT_INTERVAL,
+                 dirty_threshold=SNAPSHOT_DIRTY):
+        self.path = path
+        self.snapshot_path = os.path.splitext(path)[0] + ".snapshot.json"
+        self.chain = chain if chain is not None else open_chain(CHAIN_FILE)
+        self.interval = interval
+        self.dirty_threshold = dirty_threshold
+
+        self.balances = {}
+        self.height = 0
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty = 0
+        self._wake = threading.Event()
+        self._stopped = False
+
+        since = self._load()
+        self.chain.subscribe(self._on_record, since=since)
+
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(target=self._snapshot_loop, daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # ─── LOAD / REPLAY ─────────────────────────────
+    def _load(self):
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snap = json.load(f)
+            self.balances = snap.get("balances", {})
+            self.height = snap.get("chain_height", 0)
+            return self.height
+        except (FileNotFoundError, ValueError):
+            pass
+        # legacy: το ledger.json αντιστοιχεί στο τρέχον tip του chain
+        try:
+            with open(self.path, "r") as f:
+                self.balances = json.load(f) or {}
+        except (FileNotFoundError, ValueError):
+            self.balances = {}
+        self.height = len(self.chain)
+        return self.height
+
+    def _on_record(self, height, record):
+        with self._lock:
+            if height != self.height:
+                return  # ήδη μέσα στο snapshot
+            changed = apply_record(self.balances, record)
+            self.height = height + 1
+            self._mark_dirty(len(changed))
+
+    def _mark_dirty(self, n):
+        self._dirty += n
+        if self._dirty >= self.dirty_threshold:
+            self._wake.set()
+
+    # ─── READS / WRITES ────────────────────────────
+    # Κάθε μεταβολή υπολοίπου είναι record του chain· το refresh φέρνει ό,τι έγραψαν άλλα processes
+    def balance(self, address):
+        self.chain.refresh()
+        with self._lock:
+            return round(self.balances.get(address, 0.0), 6)
+
+    def can_spend(self, address, total):
+        self.chain.refresh()
+        with self._lock:
+            return self.balances.get(address, 0.0) >= total
+
+    # ─── SNAPSHOTS ─────────────────────────────────
+    def _snapshot_loop(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._dirty:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"❌ Ledger snapshot failed: {e}")
+
+    def flush(self):
+        """Write the snapshot now (atomic replace of both files)."""
+        with self._write_lock:
+            with self._lock:
+                balances = dict(self.balances)
+                height = self.height
+                self._dirty = 0
+            _write_json_atomic(self.snapshot_path, {
+                "chain_height": height,
+                "saved_at":     time.time(),
+                "balances":     balances
+            })
+            _write_json_atomic(self.path, balances)
+
+    def close(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake.set()
+        if self._dirty:
+            self.flush()
+
+
+def _write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+def open_ledger(path=LEDGER_FILE, chain=None):
+    """Shared LedgerEngine per ledger file."""
+    key = os.path.abspath(path)
+    with _ledgers_lock:
+        if key not in _ledgers:
+            _ledgers[key] = LedgerEngine(path, chain)
+        return _ledgers[key]
+
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000), transfers=200_000):
+    """Transfers/sec at different ledger sizes: engine only and through the chain log."""
+    import random
+    import tempfile
+
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            chain = ChainLog(os.path.join(tmp, "chain.json"), compact_every=10 ** 9)
+            engine = LedgerEngine(os.path.join(tmp, "ledger.json"), chain, interval=0)
+            addrs = [f"THR{i:012d}" for i in range(n)]
+            engine.balances = {a: 1000.0 for a in addrs}
+
+            txs = [{"from": random.choice(addrs), "to": random.choice(addrs),
+                    "amount": 0.01, "fee": 0.0015} for _ in range(transfers)]
+            t0 = time.perf_counter()
+            for tx in txs:
+                if engine.can_spend(tx["from"], tx["amount"] + tx["fee"]):
+                    with engine._lock:
+                        apply_record(engine.balances, tx)
+            mem_tps = transfers / (time.perf_counter() - t0)
+
+            sample = txs[:5000]
+            t0 = time.perf_counter()
+            for tx in sample:
+                chain.append(tx)
+            chain_tps = len(sample) / (time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            engine.flush()
+            snap_s = time.perf_counter() - t0
+            chain.close()
+
+        print(f"{n:>9,} addresses: {mem_tps:>10,.0f} tx/s in memory | "
+              f"{chain_tps:>8,.0f} tx/s with chain append+fsync | snapshot {snap_s:.2f}s")
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+    else:
+        engine = open_ledger()
+        print(f"Ledger at chain height {engine.height}: {len(engine.balances)} addresses")
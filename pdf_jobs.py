@@ -0,0 +1,200 @@
+# pdf_jobs.py - Contract PDF job queue on a process pool, idempotent by pledge hash
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ─── CONFIG ────────────────────────────────────────
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+RETRY_AFTER = int(os.getenv("PDF_RETRY_AFTER", 2))    # δευτερόλεπτα, για το 202 του contract route
+TIMINGS     = 500                                     # πόσοι χρόνοι render κρατιούνται για τα stats
+ATTEMPTS    = 2                                       # ένα job που έσπασε το pool (worker πέθανε) ξανατρέχει μία φορά
+# όχι fork: ο server έχει ήδη threads και locks που ένα fork θα αντέγραφε κλειδωμένα
+MP_START    = os.getenv("THRONOS_MP_START", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+def _render(fn, path, args):
+    """Runs in the worker process: render to a temp file, then move it into place."""
+    t0 = time.perf_counter()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fn(tmp, *args)
+    os.replace(tmp, path)   # ποτέ μισό PDF στο path που σερβίρεται
+    return time.perf_counter() - t0
+
+
+class PdfJobs:
+    """
+    Renders contract PDFs off the request path, one job per pledge hash.
+
+    ``submit(key, path, fn, *args)`` queues ``fn(tmp_path, *args)`` on a
+    process pool (ReportLab is CPU bound) unless a job for ``key`` is
+    already queued, running or done, or ``path`` already exists — so a
+    retried submission never renders twice. Failed jobs can be submitted
+    again. ``fn`` must be a module-level function the workers can import.
+
+    If a worker dies (OOM kill, segfault) the pool is broken for good:
+    it is dropped, the next render starts a fresh one, and the jobs it
+    took down are run again, up to ATTEMPTS times each.
+    """
+
+    def __init__(self, workers=PDF_WORKERS):
+        self.workers = workers
+        self.jobs = {}        # key → job
+        self.by_path = {}     # path → key
+        self.times = []       # τελευταίοι χρόνοι render (s)
+        self.counts = {"submitted": 0, "deduplicated": 0, "done": 0, "failed": 0}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(MP_START))
+        return self._pool
+
+    def _drop_pool(self, pool):
+        if self._pool is pool:
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, key, fn, args):
+        """Hand job ``key`` to the pool (lock held); returns ``(future, callback)`` to wire up after the lock."""
+        job = self.jobs[key]
+        job["attempts"] = job.get("attempts", 0) + 1
+        pool = self._executor()
+        try:
+            fut = pool.submit(_render, fn, job["path"], args)
+        except BrokenProcessPool:
+            self._drop_pool(pool)
+            pool = self._executor()
+            fut = pool.submit(_render, fn, job["path"], args)
+        return fut, lambda f: self._finished(key, f, pool, fn, args)
+
+    def submit(self, key, path, fn, *args):
+        """Queue a render for ``key`` (idempotent); returns a copy of the job."""
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None and job["state"] != "failed":
+                self.counts["deduplicated"] += 1
+                return dict(job)
+            job = {"key": key, "path": path, "filename": os.path.basename(path),
+                   "state": "queued", "submitted_at": time.time()}
+            self.jobs[key] = job
+            self.by_path[path] = key
+            if os.path.exists(path):
+                job.update(state="done", finished_at=time.time())
+                self.counts["deduplicated"] += 1
+                return dict(job)
+            self.counts["submitted"] += 1
+            fut, done = self._dispatch(key, fn, args)
+            snapshot = dict(job)
+        fut.add_done_callback(done)
+        return snapshot
+
+    def _finished(self, key, fut, pool, fn, args):
+        retry = None
+        with self._lock:
+            job = self.jobs[key]
+            job["finished_at"] = time.time()
+            try:
+                elapsed = fut.result()
+            except BrokenProcessPool as e:
+                self._drop_pool(pool)   # το επόμενο render ξεκινά νέο pool
+                if job["attempts"] < ATTEMPTS:
+                    retry = self._dispatch(key, fn, args)
+                else:
+                    job.update(state="failed", error=f"worker died: {e}")
+                    self.counts["failed"] += 1
+                    print(f"❌ PDF {job['filename']} failed: worker died")
+            except Exception as e:
+                job.update(state="failed", error=str(e))
+                self.counts["failed"] += 1
+                print(f"❌ PDF {job['filename']} failed: {e}")
+                return
+            else:
+                job.update(state="done", render_s=round(elapsed, 4))
+                self.counts["done"] += 1
+                self.times.append(elapsed)
+                del self.times[:-TIMINGS]
+        if retry:
+            retry[0].add_done_callback(retry[1])
+
+    def status(self, key=None, path=None):
+        """Job for ``key`` (or for the output ``path``), or None."""
+        with self._lock:
+            if key is None:
+                key = self.by_path.get(path)
+            job = self.jobs.get(key)
+            return dict(job) if job else None
+
+    def stats(self):
+        """Queue depth, totals and render times (ms) for /pdf_stats."""
+        with self._lock:
+            pending = sum(j["state"] == "queued" for j in self.jobs.values())
+            times = sorted(self.times)
+            counts = dict(self.counts)
+        pct = lambda q: round(times[min(len(times) - 1, int(q * len(times)))] * 1000, 1) if times else None
+        return dict(counts, queue_depth=pending, workers=self.workers,
+                    render_ms_avg=round(sum(times) / len(times) * 1000, 1) if times else None,
+                    render_ms_p50=pct(0.5), render_ms_p95=pct(0.95))
+
+    def wait(self, timeout=None):
+        """Block until no job is queued (tests, benchmarks, shutdown)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.stats()["queue_depth"]:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.02)
+        return True
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+def get_pdf_jobs():
+    """Process-wide PdfJobs."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = PdfJobs()
+        return _jobs
+
+
+def benchmark(n=200):
+    """n contracts: inline rendering (as in /pledge_submit before) vs the pool, plus a duplicate pass."""
+    import shutil
+    import tempfile
+    from contract_pdf import render_contract
+
+    tmp = tempfile.mkdtemp(prefix="pdf_bench_")
+    try:
+        text = "I pledge to keep the fire of the Thronos chain burning. " * 6
+        t0 = time.perf_counter()
+        for i in range(n):
+            render_contract(os.path.join(tmp, f"inline_{i}.pdf"), f"bc1q{i:038d}", text, f"THR{i}")
+        inline = time.perf_counter() - t0
+
+        jobs = PdfJobs()
+        t0 = time.perf_counter()
+        for i in range(n):
+            jobs.submit(f"h{i}", os.path.join(tmp, f"pool_{i}.pdf"), render_contract, f"bc1q{i:038d}", text, f"THR{i}")
+        enqueue = time.perf_counter() - t0
+        jobs.wait()
+        pooled = time.perf_counter() - t0
+        for i in range(n):
+            jobs.submit(f"h{i}", os.path.join(tmp, f"pool_{i}.pdf"), render_contract, f"bc1q{i:038d}", text, f"THR{i}")
+        st = jobs.stats()
+        print(f"{n} contracts: inline {n / inline:,.0f}/s | pool ({jobs.workers} workers) {n / pooled:,.0f}/s, "
+              f"enqueue {enqueue / n * 1e6:.0f}µs each | render p50 {st['render_ms_p50']}ms p95 {st['render_ms_p95']}ms | "
+              f"{st['deduplicated']} duplicate submits skipped")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+    else:
+        print("Usage: python pdf_jobs.py bench")
@@ -1,21 +1,43 @@
-import requests, time, logging
-from typing import List, Dict
+import os, time, logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from urllib.parse import urlsplit
+from esplora_cache import get_cache
+from http_client import get_client
 
-BASE_URL   = "https://blockstream.info/api"
-MIN_AMOUNT = 0.00001
-PAGE_SIZE  = 25
+BASE_URL      = os.getenv("ESPLORA_BASE_URL", "https://blockstream.info/api")   # π.χ. http://127.0.0.1:3002/api για το esplora_mock
+MIN_AMOUNT    = 0.00001
+PAGE_SIZE     = 25
+TIMEOUT       = 10
+FETCH_WORKERS = int(os.getenv("GATEWAY_WORKERS", 8))   # παράλληλα requests προς το Esplora
+
+# φραγμένο pool για τα lookups· keep-alive, rate limit και retries από τον http_client
+_pool = ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix="btc-fetch")
+
+def _fetch_json(path: str):
+    r = get_client().get(f"{BASE_URL}{path}", timeout=TIMEOUT)
+    r.raise_for_status()
+    return r.json()
+
+def esplora_get(path: str):
+    # confirmed tx από τον δίσκο, listings με TTL, ίδια ταυτόχρονα requests → ένα
+    return get_cache().get(path, _fetch_json)
+
+def cache_stats() -> Dict:
+    # + rate limit / retries / breaker του Esplora host
+    host = urlsplit(BASE_URL).hostname
+    return dict(get_cache().snapshot(), http=get_client().stats().get(host, {}))
 
 def fetch_all_confirmed(btc_address: str) -> List[dict]:
+    # οι σελίδες είναι αλυσίδα (cursor = τελευταίο txid), άρα σειριακά
     all_txs = []
     last_seen = None
 
     while True:
-        url = f"{BASE_URL}/address/{btc_address}/txs/chain"
+        path = f"/address/{btc_address}/txs/chain"
         if last_seen:
-            url += f"/{last_seen}"
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        page = r.json()
+            path += f"/{last_seen}"
+        page = esplora_get(path)
         if not page:
             break
         all_txs.extend(page)
@@ -25,6 +47,28 @@ def fetch_all_confirmed(btc_address: str) -> List[dict]:
 
     return all_txs
 
+def fetch_mempool(btc_address: str) -> List[dict]:
+    return esplora_get(f"/address/{btc_address}/txs/mempool")
+
+def fetch_tx(txid: str) -> dict:
+    return esplora_get(f"/tx/{txid}")
+
+def _payment(tx: dict, btc_address: str, btc_receiver: Optional[str]) -> Optional[Dict]:
+    """First output of ``tx`` paying ``btc_receiver`` (or anyone) at least MIN_AMOUNT."""
+    ts = tx.get("status", {}).get("block_time", int(time.time()))
+    for vout in tx.get("vout", []):
+        addr   = vout.get("scriptpubkey_address")
+        amount = vout.get("value", 0) / 1e8
+        if (btc_receiver is None or addr == btc_receiver) and amount >= MIN_AMOUNT:
+            return {
+                "txid":       tx["txid"],
+                "to":         addr,
+                "from":       btc_address,
+                "amount_btc": amount,
+                "timestamp":  ts
+            }
+    return None
+
 def get_btc_txns(
     btc_address: str,
     btc_receiver: str = None,
@@ -43,48 +87,39 @@ def get_btc_txns(
     logger = logging.getLogger("phantom_gateway")
 
     try:
-        logger.info(f"Fetching confirmed txs for {btc_address}")
-        confirmed = fetch_all_confirmed(btc_address)
-
-        logger.info(f"Fetching mempool txs for {btc_address}")
-        r_memp  = requests.get(f"{BASE_URL}/address/{btc_address}/txs/mempool", timeout=10)
-        r_memp.raise_for_status()
-        raw_txs = confirmed + r_memp.json()
+        # confirmed σελίδες και mempool ταυτόχρονα
+        logger.info(f"Fetching confirmed + mempool txs for {btc_address}")
+        confirmed = _pool.submit(fetch_all_confirmed, btc_address)
+        mempool   = _pool.submit(fetch_mempool, btc_address)
+        raw_txs   = confirmed.result() + mempool.result()
         logger.info(f"Total fetched txs: {len(raw_txs)}")
 
-        txs = []
-        seen = set()
-
+        # το listing φέρνει ήδη τα vout· details μόνο όπου λείπουν
+        unique = {}
         for tx in raw_txs:
             txid = tx.get("txid")
-            if not txid or txid in seen:
-                continue
-            ts = tx.get("status", {}).get("block_time", int(time.time()))
-
-            # fetch details
-            try:
-                r_d = requests.get(f"{BASE_URL}/tx/{txid}", timeout=10)
-                r_d.raise_for_status()
-                info = r_d.json()
-
-                for vout in info.get("vout", []):
-                    addr   = vout.get("scriptpubkey_address")
-                    amount = vout.get("value", 0) / 1e8
-                    if (btc_receiver is None or addr == btc_receiver) and amount >= MIN_AMOUNT:
-                        txs.append({
-                            "txid":       txid,
-                            "to":         addr,
-                            "from":       btc_address,
-                            "amount_btc": amount,
-                            "timestamp":  ts
-                        })
-                        logger.info(f"→ {txid}: {amount:.8f} BTC to {addr}")
-                        seen.add(txid)
-                        break
-
-            except Exception as e:
-                logger.error(f"Error fetching details {txid}: {e}")
+            if txid and txid not in unique:
+                unique[txid] = tx
+        missing = [txid for txid, tx in unique.items() if "vout" not in tx]
+        if missing:
+            logger.info(f"Fetching details for {len(missing)} txs")
+            futures = {txid: _pool.submit(fetch_tx, txid) for txid in missing}
+            for txid, fut in futures.items():
+                try:
+                    info = fut.result()
+                    unique[txid] = dict(info, status=info.get("status") or unique[txid].get("status", {}))
+                except Exception as e:
+                    logger.error(f"Error fetching details {txid}: {e}")
+                    unique[txid] = None
+
+        txs = []
+        for txid, tx in unique.items():
+            if tx is None:
                 continue
+            p = _payment(tx, btc_address, btc_receiver)
+            if p:
+                txs.append(p)
+                logger.info(f"→ {txid}: {p['amount_btc']:.8f} BTC to {p['to']}")
 
         return txs
 
@@ -1,4 +1,5 @@
-import requests, json, time
+import json, time
+import http_client
 
 # -- Halving Logic --
 def get_block_reward(height):
@@ -26,7 +27,7 @@ def send_block():
     }
 
     try:
-        res = requests.post("https://thrchain.up.railway.app/submit_block", json=block)
+        res = http_client.post("https://thrchain.up.railway.app/submit_block", json=block)
         print(f"Block sent (status {res.status_code}):")
         print(json.dumps(block, indent=2))
         print("Response:", res.text)
@@ -4,13 +4,14 @@ import json
 import time
 import uuid
 import hashlib
-import requests
+import http_client
 from PIL import Image
+from storage import get_storage
+from block_builder import link_record
 
 WATCH_DIR = "watch_incoming"
 ENCODED_DIR = "encoded_images"
 TX_LOG = "phantom_logs/phantom_activity.log"
-LEDGER_FILE = "ledger.json"
 
 os.makedirs(WATCH_DIR, exist_ok=True)
 os.makedirs(ENCODED_DIR, exist_ok=True)
@@ -64,14 +65,17 @@ def log_activity(image_name, payload):
     with open(TX_LOG, "a") as f:
         f.write(json.dumps({"image": image_name, "payload": payload}) + "\n")
 
-def update_ledger(sender, amount):
-    ledger = {}
-    if os.path.exists(LEDGER_FILE):
-        with open(LEDGER_FILE, "r") as f:
-            ledger = json.load(f)
-    ledger[sender] = round(ledger.get(sender, 0) + amount, 6)
-    with open(LEDGER_FILE, "w") as f:
-        json.dump(ledger, f, indent=2)
+def update_ledger(sender, amount, payload=None):
+    # reward ως linked record στο chain: κάθε LedgerEngine (κάθε process) το κάνει replay
+    store = get_storage()
+    reward = {
+        "type": "whisper_reward",
+        "thr_address": sender,
+        "reward_to_miner": amount,
+        "tx": (payload or {}).get("tx"),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+    }
+    store.append(reward, prepare=lambda height, rec: link_record(rec, store.tip()))
 
 def watch_and_encode():
     print("👁️ WhisperNode active with SHA256. Watching for incoming images...")
@@ -86,9 +90,9 @@ def watch_and_encode():
                 payload = generate_tx_payload(file, sha256_hash)
                 encode_payload_in_image(input_path, payload, output_path)
                 log_activity(file, payload)
-                update_ledger(payload["sender"], payload["reward_to_miner"])
+                update_ledger(payload["sender"], payload["reward_to_miner"], payload)
                 try:
-                    res = requests.post("https://thrchain.up.railway.app/submit_block", json=payload)
+                    res = http_client.post("https://thrchain.up.railway.app/submit_block", json=payload)
                     print(f"📡 Block submitted → {res.status_code}: {res.text}")
                 except Exception as e:
                     print(f"❌ Failed to submit block: {e}")
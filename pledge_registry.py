@@ -0,0 +1,156 @@
+# pledge_registry.py - Indexed, append-only pledge_chain.json shared by every pledge lookup
+import os
+import threading
+from collections import defaultdict
+
+from chain_store import ChainLog
+
+# ─── CONFIG ────────────────────────────────────────
+PLEDGE_CHAIN = "pledge_chain.json"
+INDEXED      = ("btc_address", "thr_address", "pledge_hash")
+
+
+class PledgeRegistry:
+    """
+    pledge_chain.json with hash indexes on btc_address, thr_address and pledge_hash.
+
+    Pledges are stored through a ChainLog, so the file stays the same JSON
+    array (now the snapshot) and each new pledge is one appended log line.
+    The indexes map a value to the positions of its pledges and follow the
+    log, including pledges appended by other processes, so every lookup
+    and duplicate check is a dict hit instead of a scan of the file.
+    """
+
+    def __init__(self, path=PLEDGE_CHAIN):
+        self.path = path
+        self.log = ChainLog(path)
+        self._index = {field: defaultdict(list) for field in INDEXED}
+        self._lock = threading.RLock()
+        self.log.subscribe(self._on_pledge, since=0)
+
+    def _on_pledge(self, pos, pledge):
+        if not isinstance(pledge, dict):
+            return
+        with self._lock:
+            for field in INDEXED:
+                value = pledge.get(field)
+                if value:
+                    self._index[field][value].append(pos)
+
+    def _positions(self, field, value):
+        self.log.refresh()
+        with self._lock:
+            return list(self._index[field].get(value, ()))
+
+    # ─── LOOKUPS ───────────────────────────────────
+    def find(self, btc_address=None, thr_address=None, pledge_hash=None):
+        """First pledge matching every given field, or None."""
+        wanted = {f: v for f, v in zip(INDEXED, (btc_address, thr_address, pledge_hash)) if v}
+        if not wanted:
+            return None
+        # ξεκινάμε από το πιο επιλεκτικό index
+        field = next(f for f in ("pledge_hash", "thr_address", "btc_address") if f in wanted)
+        for pos in self._positions(field, wanted[field]):
+            pledge = self.log.get(pos)
+            if all(pledge.get(f) == v for f, v in wanted.items()):
+                return pledge
+        return None
+
+    def exists(self, btc_address):
+        return bool(self._positions("btc_address", btc_address))
+
+    def all(self):
+        return self.log.all()
+
+    def __len__(self):
+        return len(self.log)
+
+    # ─── WRITES ────────────────────────────────────
+    def add(self, pledge):
+        """
+        Append a pledge unless its BTC address already pledged.
+
+        The duplicate check runs inside the log's write lock, so two
+        workers racing on the same address cannot both append. Returns
+        ``(pledge, created)`` where ``pledge`` is the stored one.
+        """
+        existing = []
+
+        def check(pos, record):
+            with self._lock:
+                hits = self._index["btc_address"].get(record.get("btc_address"))
+            if hits:
+                existing.append(self.log.get(hits[0]))
+                return None
+            return record
+
+        if self.log.append(pledge, prepare=check) is None:
+            return existing[0], False
+        return pledge, True
+
+    def close(self):
+        self.log.close()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def open_registry(path=PLEDGE_CHAIN):
+    """Shared PledgeRegistry per pledge file."""
+    key = os.path.abspath(path)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = PledgeRegistry(path)
+        return _registries[key]
+
+
+def benchmark(n=1_000_000, lookups=200_000):
+    """Lookups and duplicate-checked adds against ``n`` pledges."""
+    import time
+    import random
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reg = PledgeRegistry(os.path.join(tmp, "pledges.json"))
+        reg.log.compact_every = 10 ** 9
+        t0 = time.perf_counter()
+        reg.log.extend([{"btc_address": f"bc1q{i:038d}", "thr_address": f"THR{i:013d}",
+                         "pledge_hash": f"{i:064x}", "pledge_text": "fire"} for i in range(n)])
+        print(f"appended {n:,} pledges in {time.perf_counter() - t0:.2f}s")
+        reg.log.compact()
+        reg.close()
+        t0 = time.perf_counter()
+        reg = PledgeRegistry(reg.path)
+        print(f"reopened from snapshot and indexed in {time.perf_counter() - t0:.2f}s")
+
+        keys = [random.randrange(n) for _ in range(lookups)]
+        t0 = time.perf_counter()
+        for i in keys:
+            reg.find(btc_address=f"bc1q{i:038d}")
+        by_btc = lookups / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for i in keys:
+            reg.find(btc_address=f"bc1q{i:038d}", thr_address=f"THR{i:013d}")
+        by_pair = lookups / (time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        dupes = sum(not reg.add({"btc_address": f"bc1q{i:038d}"})[1] for i in keys[:10_000])
+        add_s = (time.perf_counter() - t0) / 10_000
+        print(f"find by btc: {by_btc:,.0f}/s | by btc+thr: {by_pair:,.0f}/s | "
+              f"duplicate check: {add_s * 1e6:.1f}µs each ({dupes} rejected)")
+
+        # η παλιά γραμμική αναζήτηση, για σύγκριση
+        pledges = reg.all()
+        t0 = time.perf_counter()
+        for i in keys[:20]:
+            next((p for p in pledges if p["btc_address"] == f"bc1q{i:038d}"), None)
+        print(f"linear scan: {20 / (time.perf_counter() - t0):,.1f}/s")
+        reg.close()
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+    else:
+        reg = open_registry()
+        print(f"{len(reg)} pledges in {reg.path}")
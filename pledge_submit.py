@@ -1,8 +1,11 @@
 import os, json, time, hashlib
-from fpdf import FPDF
 from flask import request, jsonify
 from phantom_gateway_mainnet import get_btc_txns  # δικό σου API
 from dynamic_thr_fee import calculate_dynamic_fee  # Importing dynamic fee calculation
+from storage import get_storage
+from block_builder import link_record
+from pdf_jobs import get_pdf_jobs
+from contract_pdf import render_contract
 
 
 CHAIN_FILE = "phantom_tx_chain.json"
@@ -14,12 +17,9 @@ os.makedirs(CONTRACTS_DIR, exist_ok=True)
 def generate_thr_address():
     return f"THR{int(time.time()*1000)}"
 
-def create_pdf_contract(btc_address, pledge_text, thr_address, filename):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Courier", size=12)
-    pdf.multi_cell(0, 10, f"BTC Address: {btc_address}\n\nPledge:\n{pledge_text}\n\nGenerated THR Address:\n{thr_address}")
-    pdf.output(os.path.join(CONTRACTS_DIR, filename))
+def create_pdf_contract(btc_address, pledge_text, thr_address, filename, pledge_hash=None):
+    # ίδιο template με το server.py, με signed metadata record για τον validator
+    render_contract(os.path.join(CONTRACTS_DIR, filename), btc_address, pledge_text, thr_address, pledge_hash)
 
 def handle_pledge_submission():
     data = request.get_json()
@@ -46,20 +46,19 @@ def handle_pledge_submission():
         "thr_address": thr_address
     }
 
-    # Εγγραφή στο JSON chain
-    if not os.path.exists(CHAIN_FILE):
-        with open(CHAIN_FILE, "w") as f: json.dump([], f)
-    with open(CHAIN_FILE, "r") as f: chain = json.load(f)
-    chain.append(block)
-    with open(CHAIN_FILE, "w") as f: json.dump(chain, f, indent=2)
+    # Εγγραφή στο chain (JSON log ή SQLite, βλ. THRONOS_STORAGE), linked στο tip όπως στο mint_first_blocks
+    store = get_storage()
+    store.append(block, prepare=lambda height, rec: link_record(rec, store.tip()))
 
-    # Δημιουργία PDF
+    # PDF στην ουρά (process pool)· το όνομα επιστρέφεται αμέσως
     pdf_name = f"pledge_{thr_address}.pdf"
-    create_pdf_contract(btc_address, pledge_text, thr_address, pdf_name)
+    job = get_pdf_jobs().submit(pledge_hash, os.path.join(CONTRACTS_DIR, pdf_name), render_contract,
+                                btc_address, pledge_text, thr_address, pledge_hash)
 
     return jsonify({
         "status": "verified",
         "thr_address": thr_address,
         "hash": pledge_hash,
-        "pdf_filename": pdf_name
+        "pdf_filename": pdf_name,
+        "pdf": job["state"]
     })
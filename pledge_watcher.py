@@ -0,0 +1,405 @@
+# pledge_watcher.py - Pending pledges + background BTC payment watcher (no HTTP on request threads)
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from phantom_gateway_mainnet import get_btc_txns, FETCH_WORKERS
+from btc_sync import AddressSync
+from chain_store import _FileLock
+
+# ─── CONFIG ────────────────────────────────────────
+PENDING_FILE   = os.getenv("PLEDGE_PENDING_FILE", "pending_pledges.ndjson")   # journal, μία αλλαγή ανά γραμμή
+WATCH_STATE    = os.getenv("PLEDGE_WATCH_STATE", "pledge_watch_sync.json")     # watermark του receiver
+WATCH_SEEN     = os.getenv("PLEDGE_WATCH_SEEN", "pledge_watch_processed.txt")
+POLL_SECONDS   = float(os.getenv("PLEDGE_POLL_SECONDS", 30))    # κάθε πόσο ξυπνά ο watcher
+RECHECK_AFTER  = float(os.getenv("PLEDGE_RECHECK_SECONDS", 600))  # per-address έλεγχος ανά pending pledge
+MAX_WAIT       = float(os.getenv("PLEDGE_MAX_WAIT", 10))         # όριο για ?wait= στο /pledge_status
+MAX_WAITERS    = int(os.getenv("PLEDGE_MAX_WAITERS", 4))        # ταυτόχρονα long-polls· κάτω από τα worker threads
+VERIFIED_KEEP  = float(os.getenv("PLEDGE_VERIFIED_KEEP", 86400))  # πόσο μένει ένα verified entry στο journal
+TAIL_EVERY     = 1.0                                              # s: ένα long-poll ξαναδιαβάζει το journal
+
+
+def pledge_id(btc_address, pledge_text):
+    """Same value as the pledge_hash the verified pledge gets, so resubmits map to one id."""
+    return hashlib.sha256((btc_address + pledge_text).encode()).hexdigest()
+
+
+def payment_senders(tx, receiver, min_amount):
+    """(sender addresses, BTC paid to ``receiver``) for one Esplora tx."""
+    paid = sum(v.get("value", 0) for v in tx.get("vout", [])
+               if v.get("scriptpubkey_address") == receiver) / 1e8
+    if paid < min_amount:
+        return set(), 0.0
+    senders = {vin.get("prevout", {}).get("scriptpubkey_address") for vin in tx.get("vin", [])}
+    senders.discard(None)
+    return senders, paid
+
+
+class PledgeWatcher:
+    """
+    Accepts pledges without waiting for the explorer and verifies them in the background.
+
+    ``submit`` only records a pending pledge (one line appended to the
+    PENDING_FILE journal, compacted now and then) and wakes the watcher
+    thread. Each tick the watcher:
+
+    * syncs the receiver address incrementally (btc_sync, one request when
+      idle) and matches the senders of new payments against every pending
+      BTC address at once;
+    * for pledges still unmatched, checks the pledger's own history with
+      get_btc_txns — right after submission (payment may predate the
+      watermark) and then every RECHECK_AFTER seconds — on a small pool.
+
+    A paid pledge gets its THR address, is stored with ``store.add_pledge``
+    and leaves the pending file; ``status`` then answers from the store.
+    ``enrich(pledge, amount_btc)`` may add fields before the pledge is
+    stored and ``on_verified(pledge)`` runs after (it should only queue
+    work, e.g. a pdf_jobs render). A pending address that gets a pledge
+    through another path is resolved from the store; such verified
+    entries leave the journal after VERIFIED_KEEP seconds.
+
+    The journal is the state shared by every process on the data dir
+    (gunicorn workers each run a watcher). Changes are appended under a
+    flock on ``<journal>.lock`` after reading what the others appended, so
+    every decision — and ``status``/``compact`` — sees all workers'
+    pledges; a compaction by one process makes the others reload.
+    """
+
+    def __init__(self, store, receiver, min_amount, on_verified=None, enrich=None,
+                 state_path=PENDING_FILE, sync=None, poll_seconds=POLL_SECONDS,
+                 recheck_after=RECHECK_AFTER):
+        self.store = store
+        self.receiver = receiver
+        self.min_amount = min_amount
+        self.on_verified = on_verified
+        self.enrich = enrich
+        self.state_path = state_path
+        self.lock_path = state_path + ".lock"
+        self.sync = sync or AddressSync(WATCH_STATE, WATCH_SEEN)
+        self.poll_seconds = poll_seconds
+        self.recheck_after = recheck_after
+        self.stats = {"ticks": 0, "verified": 0, "address_checks": 0, "errors": 0}
+        self._cond = threading.Condition(threading.RLock())
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_thr = 0
+        self._waiters = threading.BoundedSemaphore(MAX_WAITERS)
+        self._checks = ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix="pledge-check")
+        self._load()
+
+    # ─── STATE ─────────────────────────────────────
+    def _load(self):
+        self._reset()
+        with self._cond, _FileLock(self.lock_path):
+            self._tail(repair=True)
+
+    def _reset(self, inode=None):
+        self.pending = {}     # id → entry
+        self.by_address = {}  # btc_address → id του pending entry
+        self.payments = {}    # sender → BTC στον receiver
+        self._lines = 0
+        self._offset = 0      # bytes του journal που έχουμε ήδη διαβάσει
+        self._inode = inode   # αλλάζει όταν κάποιο process κάνει compact
+
+    def _tail(self, repair=False):
+        """Apply journal lines appended since the last read (by any process); ``self._cond`` held."""
+        try:
+            with open(self.state_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                if st.st_ino != self._inode or st.st_size < self._offset:
+                    self._reset(st.st_ino)   # νέο αρχείο (compact): από την αρχή
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+        end = data.rfind(b"\n") + 1   # μόνο ολόκληρες γραμμές· η μισή περιμένει το επόμενο tail
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except ValueError:
+                continue
+            self._lines += 1
+        self._offset += end
+        if repair and end < len(data):
+            with open(self.state_path, "r+b") as f:
+                f.truncate(self._offset)  # μισογραμμένη γραμμή από crash
+
+    @contextmanager
+    def _shared(self):
+        """Both locks, with every process's changes applied: for read-decide-append sections."""
+        with self._cond, _FileLock(self.lock_path):
+            self._tail(repair=True)
+            yield
+
+    def _apply(self, rec):
+        if "pledge" in rec:
+            self._put(rec["pledge"])
+        elif "drop" in rec:
+            self._drop(rec["drop"])
+        elif "payment" in rec:
+            self.payments[rec["payment"]] = rec["btc"]
+        elif "clear" in rec:
+            self.payments.pop(rec["clear"], None)
+
+    def _put(self, entry):
+        self.pending[entry["id"]] = entry
+        if entry["status"] == "pending":
+            self.by_address[entry["btc_address"]] = entry["id"]
+        elif self.by_address.get(entry["btc_address"]) == entry["id"]:
+            del self.by_address[entry["btc_address"]]
+
+    def _drop(self, pid):
+        entry = self.pending.pop(pid, None)
+        if entry is not None and self.by_address.get(entry["btc_address"]) == pid:
+            del self.by_address[entry["btc_address"]]
+
+    def _journal(self, *records):
+        """Append state changes (inside ``_shared``); rewrites the file once it is mostly superseded lines."""
+        data = "".join(json.dumps(r) + "\n" for r in records).encode()
+        with open(self.state_path, "ab") as f:
+            f.write(data)
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._offset += len(data)
+        self._lines += len(records)
+        if self._lines > 2 * (len(self.pending) + len(self.payments)) + 1000:
+            self._rewrite()
+
+    def compact(self):
+        with self._shared():
+            self._rewrite()
+
+    def _rewrite(self):
+        records = [{"pledge": e} for e in self.pending.values()]
+        records += [{"payment": a, "btc": v} for a, v in self.payments.items()]
+        data = "".join(json.dumps(r) + "\n" for r in records).encode()
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.state_path)
+        self._inode = os.stat(self.state_path).st_ino
+        self._offset = len(data)
+        self._lines = len(records)
+
+    # ─── REQUEST SIDE (no outbound HTTP) ──────────
+    def submit(self, btc_address, pledge_text):
+        """Register a pending pledge (or return the one already pending for this address)."""
+        with self._shared():
+            if btc_address in self.by_address:
+                return dict(self.pending[self.by_address[btc_address]])
+            pid = pledge_id(btc_address, pledge_text)
+            entry = self.pending.get(pid)
+            if entry is None:
+                entry = {
+                    "id":           pid,
+                    "btc_address":  btc_address,
+                    "pledge_text":  pledge_text,
+                    "status":       "pending",
+                    "submitted_at": time.time(),
+                    "checked_at":   None
+                }
+                self._put(entry)
+                self._journal({"pledge": entry})
+            snapshot = dict(entry)
+        self._wake.set()
+        return snapshot
+
+    def credit(self, btc_address, amount_btc):
+        """Treat ``btc_address`` as having paid (e.g. already known on chain); verified next tick."""
+        with self._shared():
+            self._merge_payment(btc_address, amount_btc)
+        self._wake.set()
+
+    def status(self, pid, wait=0):
+        """
+        Current state of pledge ``pid``; with ``wait`` > 0 blocks (up to
+        MAX_WAIT seconds) while it is still pending, for long-polling clients.
+        At most MAX_WAITERS requests block at a time; the rest answer at once.
+        """
+        wait = min(max(wait or 0, 0), MAX_WAIT)
+        waiting = wait > 0 and self._waiters.acquire(blocking=False)
+        deadline = time.monotonic() + (wait if waiting else 0)
+        try:
+            with self._cond:
+                while True:
+                    self._tail()
+                    entry = self.pending.get(pid)
+                    if entry is None or entry["status"] != "pending":
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    # notify έρχεται μόνο από τον watcher αυτού του process
+                    self._cond.wait(min(remaining, TAIL_EVERY))
+                if entry is not None:
+                    return {k: v for k, v in entry.items() if k != "checked_at"}
+        finally:
+            if waiting:
+                self._waiters.release()
+        pledge = self.store.find_pledge(pledge_hash=pid)
+        if pledge is None:
+            return None
+        return {"id": pid, "status": "verified", "btc_address": pledge["btc_address"],
+                "thr_address": pledge["thr_address"], "pledge_hash": pledge["pledge_hash"],
+                "pdf_filename": f"pledge_{pledge['thr_address']}.pdf"}
+
+    # ─── WATCHER ───────────────────────────────────
+    def _merge_payment(self, sender, amount):
+        # με το lock κρατημένο
+        if amount > self.payments.get(sender, 0.0):
+            self.payments[sender] = amount
+            self._journal({"payment": sender, "btc": amount})
+
+    def _check_address(self, btc_address):
+        txns = get_btc_txns(btc_address, self.receiver)
+        return max((tx["amount_btc"] for tx in txns if tx.get("to") == self.receiver), default=0.0)
+
+    def poll(self):
+        """One watcher tick; returns how many pledges became verified."""
+        self.stats["ticks"] += 1
+        self._resolve_known()
+        with self._cond:
+            waiting = set(self.by_address)
+        if not waiting:
+            return 0
+
+        # 1) ένα incremental sync του receiver για όλα τα pending μαζί
+        found = []
+        try:
+            self.sync.sync(self.receiver, lambda tx: found.append(payment_senders(tx, self.receiver, self.min_amount)))
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Pledge watcher: receiver sync failed: {e}")
+        with self._shared():
+            for senders, amount in found:
+                for sender in senders:
+                    self._merge_payment(sender, amount)
+
+        # 2) per-address έλεγχος για όσα δεν βρέθηκαν, παράλληλα
+        now = time.time()
+        with self._cond:
+            due = {e["btc_address"] for e in self.pending.values()
+                   if e["status"] == "pending" and e["btc_address"] not in self.payments
+                   and (e["checked_at"] is None or now - e["checked_at"] >= self.recheck_after)}
+        futures = {addr: self._checks.submit(self._check_address, addr) for addr in due}
+        self.stats["address_checks"] += len(futures)
+        checked = {}
+        for addr, fut in futures.items():
+            try:
+                checked[addr] = fut.result()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️ Pledge watcher: check of {addr} failed: {e}")
+
+        with self._shared():
+            for addr, amount in checked.items():
+                if amount >= self.min_amount:
+                    self._merge_payment(addr, amount)
+            paid = []
+            for entry in self.pending.values():
+                if entry["status"] != "pending":
+                    continue
+                if self.payments.get(entry["btc_address"], 0.0) >= self.min_amount:
+                    paid.append(entry)
+                elif entry["btc_address"] in checked:
+                    entry["checked_at"] = now
+                    self._journal({"pledge": entry})
+            verified = [p for p in map(self._verify, paid) if p]
+            self._cond.notify_all()
+        for pledge in verified:
+            if pledge is not True and self.on_verified:
+                try:
+                    self.on_verified(pledge)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"❌ Pledge watcher: on_verified for {pledge['thr_address']} failed: {e}")
+        return len(verified)
+
+    def _resolve_known(self):
+        """Settle pending addresses that already have a stored pledge; forget old verified entries."""
+        now = time.time()
+        with self._shared():
+            for entry in list(self.pending.values()):
+                if entry["status"] == "pending":
+                    stored = self.store.find_pledge(entry["btc_address"])
+                    if stored is not None:
+                        # verified από άλλο μονοπάτι (pledge_submit.py, άλλος worker)
+                        self._mark_verified(entry, stored)
+                elif now - entry.get("verified_at", now) >= VERIFIED_KEEP:
+                    self._drop(entry["id"])
+                    self._journal({"drop": entry["id"]})
+            self._cond.notify_all()
+
+    def _mark_verified(self, entry, stored):
+        # το entry μένει (ως verified) ώστε το status του id να δείχνει το pledge που υπάρχει
+        self._put(dict(entry, status="verified", verified_at=time.time(), thr_address=stored["thr_address"],
+                       pledge_hash=stored["pledge_hash"], pdf_filename=f"pledge_{stored['thr_address']}.pdf"))
+        self._journal({"pledge": self.pending[entry["id"]]}, {"clear": entry["btc_address"]})
+        self.payments.pop(entry["btc_address"], None)
+
+    def _new_thr_address(self):
+        # THR + ms timestamp, όπως πριν· μοναδικό και όταν επαληθεύονται πολλά στο ίδιο ms
+        self._last_thr = max(int(time.time() * 1000), self._last_thr + 1)
+        return f"THR{self._last_thr}"
+
+    def _verify(self, entry):
+        """
+        pending → verified: THR address + stored pledge. Called with the lock
+        held; returns the new pledge, True if the address had already
+        pledged through another path, or None on failure.
+        """
+        btc_address = entry["btc_address"]
+        pledge = {
+            "btc_address": btc_address,
+            "pledge_text": entry["pledge_text"],
+            "timestamp":   time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
+            "pledge_hash": entry["id"],
+            "thr_address": self._new_thr_address()
+        }
+        try:
+            if self.enrich:
+                self.enrich(pledge, self.payments.get(btc_address, self.min_amount))
+            stored, created = self.store.add_pledge(pledge)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"❌ Pledge watcher: storing pledge for {btc_address} failed: {e}")
+            return None
+        self.payments.pop(btc_address, None)
+        self.stats["verified"] += 1
+        print(f"✅ Pledge {entry['id'][:12]}… verified → {stored['thr_address']}")
+        if created:
+            self._drop(entry["id"])   # από εδώ και πέρα το status έρχεται από το store
+            self._journal({"drop": entry["id"]}, {"clear": btc_address})
+            return stored
+        # η διεύθυνση είχε ήδη pledge (άλλο hash)
+        self._mark_verified(entry, stored)
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"❌ Pledge watcher tick failed: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self):
+        """Run the watcher loop in a daemon thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True, name="pledge-watcher")
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,312 @@
+# price_store.py - Append-only THR/BTC price history: (timestamp, price) float64 pairs, memory-mapped into NumPy
+import os
+import json
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+# ─── CONFIG ────────────────────────────────────────
+PRICE_FILE = os.getenv("PRICE_STORE", "price_history.f64")
+RECORD     = struct.Struct("<dd")                  # timestamp, price — 16 bytes, little-endian
+DTYPE      = np.dtype([("ts", "<f8"), ("price", "<f8")])
+RESOLUTIONS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+CANDLE     = struct.Struct("<8d")                  # start, open, high, low, close, volume, ticks, last_ts
+CANDLE_DTYPE = np.dtype([(f, "<f8") for f in ("start", "open", "high", "low", "close", "volume", "ticks", "last_ts")])
+
+
+def _write_all(fd, data):
+    """os.write until every byte is out (a write may be partial, e.g. on a full disk or a signal)."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class _Records:
+    """
+    Fixed-size records in one append-only file, read through a memory map.
+    Writers hold ``_locked()`` — the thread lock plus a flock on the file,
+    so processes sharing it take turns.
+    """
+
+    def __init__(self, path, record, dtype):
+        self.path = path
+        self.record = record
+        self.dtype = dtype
+        self._fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._map = np.empty(0, dtype)
+        self._lock = threading.Lock()
+        with self._locked():
+            size = os.fstat(self._fd).st_size
+            if size % record.size:
+                os.ftruncate(self._fd, size - size % record.size)   # μισό record από crash
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _view(self):
+        """Records currently in the file (memory-mapped)."""
+        with self._lock:
+            n = os.fstat(self._fd).st_size // self.record.size
+            if n != len(self._map):
+                self._map = np.memmap(self.path, self.dtype, mode="r", shape=(n,)) if n else np.empty(0, self.dtype)
+            return self._map
+
+    def _tail(self):
+        """(count, last record or None), read from the file — call inside ``_locked()``."""
+        n = os.fstat(self._fd).st_size // self.record.size
+        if not n:
+            return 0, None
+        return n, self.record.unpack(os.pread(self._fd, self.record.size, (n - 1) * self.record.size))
+
+    def _slice(self, field, start, end):
+        v = self._view()
+        col = v[field]
+        lo = 0 if start is None else int(np.searchsorted(col, start, side="left"))
+        hi = len(v) if end is None else int(np.searchsorted(col, end, side="left"))
+        return v[lo:hi]
+
+    def __len__(self):
+        return len(self._view())
+
+    def close(self):
+        with self._lock:
+            self._map = np.empty(0, self.dtype)
+            os.close(self._fd)
+
+
+class PriceStore(_Records):
+    """
+    Price ticks as fixed 16-byte records in one append-only file.
+
+    ``append`` is a single ``os.write`` of one record (O_APPEND), whatever
+    the history length. Reads go through a read-only ``np.memmap`` of the
+    file, re-mapped only when the file has grown (here or in another
+    process); a torn last record is ignored until it is complete, and cut
+    off when the file is next opened.
+    Timestamps are kept non-decreasing (a tick older than the last one is
+    stored at the last timestamp), so ``range`` is two ``searchsorted``
+    calls — O(log n) — and returns array views, not copies.
+    """
+
+    def __init__(self, path=PRICE_FILE):
+        super().__init__(path, RECORD, DTYPE)
+
+    def append(self, ts, price):
+        """Append one tick; returns the timestamp actually stored."""
+        with self._locked():
+            _, last = self._tail()
+            if last:
+                ts = max(ts, last[0])    # μονότονο για το searchsorted
+            _write_all(self._fd, RECORD.pack(ts, price))
+        return ts
+
+    def last(self):
+        """(timestamp, price) of the newest tick, or None."""
+        v = self._view()
+        return (float(v["ts"][-1]), float(v["price"][-1])) if len(v) else None
+
+    def range(self, start=None, end=None):
+        """(timestamps, prices) with start <= ts < end, as memory-mapped views."""
+        v = self._slice("ts", start, end)
+        return v["ts"], v["price"]
+
+    def import_json(self, path, field="thr_in_btc"):
+        """
+        Append the ticks of a legacy price_history.json (list of dicts)
+        strictly newer than the store, so re-running it adds nothing; returns how many.
+        """
+        with open(path, "r") as f:
+            history = json.load(f)
+        with self._locked():
+            _, last = self._tail()
+            newest = last[0] if last else float("-inf")
+            points = sorted((float(p["timestamp"]), float(p[field])) for p in history
+                            if isinstance(p, dict) and "timestamp" in p and field in p and float(p["timestamp"]) > newest)
+            _write_all(self._fd, b"".join(RECORD.pack(t, p) for t, p in points))
+        return len(points)
+
+
+class CandleStore(_Records):
+    """
+    OHLC + volume candles of one resolution, one 64-byte record each.
+
+    ``add`` folds a tick into the newest candle with a single ``pwrite``
+    over its record, or appends the next candle — a fixed-size write
+    either way. ``range`` slices by candle start like PriceStore.
+    """
+
+    def __init__(self, path, seconds):
+        super().__init__(path, CANDLE, CANDLE_DTYPE)
+        self.seconds = seconds
+        # O_APPEND αγνοεί το offset του pwrite· δεύτερος fd για την ενημέρωση του τελευταίου candle
+        self._wfd = os.open(path, os.O_RDWR)
+
+    def add(self, ts, price, volume=0.0):
+        with self._locked():
+            self._add(ts, price, volume)
+
+    def _add(self, ts, price, volume=0.0):
+        # read-modify-write του τελευταίου candle: μέσα στο _locked()
+        n, last = self._tail()
+        if last and ts < last[7]:
+            ts = last[7]
+        start = ts - ts % self.seconds
+        if last and start == last[0]:
+            c = (start, last[1], max(last[2], price), min(last[3], price), price,
+                 last[5] + volume, last[6] + 1, ts)
+            os.pwrite(self._wfd, CANDLE.pack(*c), (n - 1) * CANDLE.size)
+        else:
+            _write_all(self._fd, CANDLE.pack(start, price, price, price, price, volume, 1, ts))
+
+    def rebuild(self, ts, prices):
+        """Append candles for ticks (sorted arrays) newer than the last candle — start-up catch-up."""
+        with self._locked():
+            return self._rebuild(ts, prices)
+
+    def _rebuild(self, ts, prices):
+        _, last = self._tail()
+        if last:
+            keep = ts > last[7]
+            ts, prices = ts[keep], prices[keep]
+            # ticks που πέφτουν στο τελευταίο candle: ένας-ένας, ώστε να ενημερωθεί το ίδιο record
+            same = ts < last[0] + self.seconds
+            for t, p in zip(ts[same], prices[same]):
+                self._add(float(t), float(p))
+            ts, prices = ts[~same], prices[~same]
+        if not len(ts):
+            return 0
+        starts = ts - ts % self.seconds
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        out = np.empty(len(first), CANDLE_DTYPE)
+        out["start"] = starts[first]
+        out["open"] = prices[first]
+        out["high"] = np.maximum.reduceat(prices, first)
+        out["low"] = np.minimum.reduceat(prices, first)
+        out["close"] = prices[np.r_[first[1:] - 1, len(prices) - 1]]
+        out["volume"] = 0.0     # οι ticks δεν κρατούν όγκο
+        out["ticks"] = np.diff(np.r_[first, len(prices)])
+        out["last_ts"] = ts[np.r_[first[1:] - 1, len(ts) - 1]]
+        _write_all(self._fd, out.tobytes())
+        return len(out)
+
+    def range(self, start=None, end=None):
+        """Candles whose period overlaps [start, end)."""
+        return self._slice("start", None if start is None else start - start % self.seconds, end)
+
+    def close(self):
+        os.close(self._wfd)
+        super().close()
+
+
+class PriceRollups:
+    """
+    Rolling 1m/5m/1h/1d candles over a PriceStore, one CandleStore file
+    per resolution next to it (``<store>.<res>``). Ticks are folded in as
+    they are added; on open, candles missing for ticks already in the
+    store (first run, or a crash between the two writes) are rebuilt
+    from them, without volume.
+    """
+
+    def __init__(self, prices, resolutions=RESOLUTIONS):
+        self.prices = prices
+        self.stores = {res: CandleStore(f"{prices.path}.{res}", sec) for res, sec in resolutions.items()}
+        ts, px = prices.range()
+        for store in self.stores.values():
+            store.rebuild(ts, px)
+
+    def add(self, ts, price, volume=0.0):
+        for store in self.stores.values():
+            store.add(ts, price, volume)
+
+    def best_resolution(self, start, end, max_rows=500):
+        """Finest resolution that covers [start, end) in at most ``max_rows`` candles."""
+        for res, store in sorted(self.stores.items(), key=lambda kv: kv[1].seconds):
+            if (end - start) / store.seconds <= max_rows:
+                return res
+        return max(self.stores, key=lambda r: self.stores[r].seconds)
+
+    def candles(self, res, start=None, end=None):
+        """Candle records (NumPy structured array) of resolution ``res`` in [start, end)."""
+        return self.stores[res].range(start, end)
+
+
+def benchmark(n=1_000_000, appends=20_000):
+    """Appending ticks and slicing a day out of n points: binary store vs the JSON rewrite it replaces."""
+    import time
+    import shutil
+    import tempfile
+
+    tmp = tempfile.mkdtemp(prefix="price_bench_")
+    try:
+        store = PriceStore(os.path.join(tmp, "p.f64"))
+        t0 = 1.7e9
+        with open(store.path, "ab") as f:
+            np.rec.fromarrays([t0 + np.arange(n) * 60.0, 1e-5 * (1 + np.random.rand(n) / 10)], dtype=DTYPE).tofile(f)
+
+        start = time.perf_counter()
+        for i in range(appends):
+            store.append(t0 + (n + i) * 60.0, 1e-5)
+        append_us = (time.perf_counter() - start) / appends * 1e6
+
+        start = time.perf_counter()
+        for i in range(1000):
+            day = i % 600
+            ts, prices = store.range(t0 + day * 86400, t0 + (day + 1) * 86400)
+        slice_us = (time.perf_counter() - start) / 1000 * 1e6
+
+        # ό,τι έκανε το save_price_history με το cap των 1000 σημείων
+        history = [{"timestamp": t0 + i * 60.0, "thr_in_btc": 1e-5, "update_source": "pledge_transaction"}
+                   for i in range(1000)]
+        start = time.perf_counter()
+        for _ in range(200):
+            with open(os.path.join(tmp, "p.json"), "w") as f:
+                json.dump(history, f, indent=2)
+        json_us = (time.perf_counter() - start) / 200 * 1e6
+
+        start = time.perf_counter()
+        rollups = PriceRollups(store)
+        rebuild_s = time.perf_counter() - start
+        last = store.last()[0]
+        start = time.perf_counter()
+        for i in range(appends):
+            rollups.add(last + i * 7.0, 1e-5, 0.001)
+        rollup_us = (time.perf_counter() - start) / appends * 1e6
+        end = last + appends * 7.0
+        res = rollups.best_resolution(end - 365 * 86400, end)
+        year = rollups.candles(res, end - 365 * 86400, end)
+
+        print(f"{len(store):,} ticks ({os.path.getsize(store.path) / 1e6:.0f} MB): append {append_us:.1f}µs | "
+              f"1-day slice {slice_us:.1f}µs ({len(ts)} points) | JSON rewrite of 1000 points {json_us:,.0f}µs")
+        print(f"rollups: rebuild from ticks {rebuild_s:.2f}s | tick into 4 resolutions {rollup_us:.1f}µs | "
+              f"1 year = {len(year)} {res} candles")
+        for s in rollups.stores.values():
+            s.close()
+        store.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+    # python price_store.py import price_history.json [store]  |  python price_store.py bench
+    if len(sys.argv) >= 3 and sys.argv[1] == "import":
+        store = PriceStore(sys.argv[3] if len(sys.argv) > 3 else PRICE_FILE)
+        print(f"✅ Imported {store.import_json(sys.argv[2])} ticks into {store.path} ({len(store)} total)")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark()
+    else:
+        print("Usage: python price_store.py import <price_history.json> [store] | bench")
@@ -3,19 +3,14 @@ import json
 from datetime import datetime
 from pathlib import Path
 import sys
+from storage import get_storage
+from transfer_pipeline import open_pipeline, TransferRejected, TransferPending
 
 CHAIN_PATH = Path("phantom_tx_chain.json")
 TX_LOG_PATH = Path("send_thr_log.json")
 
 def load_chain():
-    if CHAIN_PATH.exists():
-        with open(CHAIN_PATH, "r") as f:
-            return json.load(f)
-    return []
-
-def save_chain(chain):
-    with open(CHAIN_PATH, "w") as f:
-        json.dump(chain, f, indent=2)
+    return get_storage().chain_all()
 
 def log_transaction(tx):
     logs = []
@@ -26,33 +21,24 @@ def log_transaction(tx):
     with open(TX_LOG_PATH, "w") as f:
         json.dump(logs, f, indent=2)
 
-def get_balance(address, chain):
-    balance = 0.0
-    for block in chain:
-        if block.get("reward_to_address") == address:
-            balance += float(block.get("reward", 0))
-        if block.get("from") == address:
-            balance -= float(block.get("amount", 0))
-    return round(balance, 6)
-
 def send_thr(from_addr, to_addr, amount):
-    chain = load_chain()
-    balance = get_balance(from_addr, chain)
-    if balance < amount:
-        print(f"Insufficient balance. Current: {balance}, Required: {amount}")
-        return
-
-    block = {
-        "type": "transfer",
+    tx = {
         "timestamp": datetime.utcnow().isoformat(),
         "from": from_addr,
         "to": to_addr,
-        "amount": amount,
-        "block_hash": f"THR_TX_{datetime.utcnow().timestamp()}"
+        "amount": amount
     }
-    chain.append(block)
-    save_chain(chain)
-    log_transaction(block)
+
+    # ίδιο μονοπάτι με το /send_token: έλεγχος υπολοίπου από τον LedgerEngine, sealed block με hash
+    try:
+        open_pipeline(get_storage()).transfer(tx)
+    except TransferRejected as e:
+        print(f"❌ {e}: {from_addr} cannot send {amount} THR")
+        return
+    except TransferPending as e:
+        print(f"⏳ {e} — check the wallet history of {from_addr}")
+        return
+    log_transaction(tx)
     print(f"✅ Sent {amount} THR from {from_addr} to {to_addr}.")
 
 if __name__ == "__main__":
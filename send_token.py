@@ -1,22 +1,10 @@
-
-import json, time
+import time
 from flask import request, jsonify
+from storage import get_storage
+from transfer_pipeline import open_pipeline, TransferRejected
 
-LEDGER_FILE = "ledger.json"
-CHAIN_FILE = "phantom_tx_chain.json"
 TX_FEE = 0.0015  # Flat fee per transfer
 
-def load_ledger():
-    try:
-        with open(LEDGER_FILE, "r") as f:
-            return json.load(f)
-    except:
-        return {}
-
-def save_ledger(ledger):
-    with open(LEDGER_FILE, "w") as f:
-        json.dump(ledger, f, indent=2)
-
 def handle_token_send():
     data = request.get_json()
     sender = data.get("from")
@@ -26,18 +14,7 @@ def handle_token_send():
     if not sender or not recipient or amount <= 0:
         return jsonify({"error": "Invalid input"}), 400
 
-    ledger = load_ledger()
-
-    sender_balance = ledger.get(sender, 0)
-    total_required = amount + TX_FEE
-
-    if sender_balance < total_required:
-        return jsonify({"error": "Insufficient balance"}), 403
-
-    # Execute transfer
-    ledger[sender] -= total_required
-    ledger[recipient] = ledger.get(recipient, 0) + amount
-    save_ledger(ledger)
+    store = get_storage()
 
     tx = {
         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
@@ -48,18 +25,15 @@ def handle_token_send():
         "type": "transfer"
     }
 
+    # Execute transfer: το ledger χρεώνεται από την εγγραφή στο chain
     try:
-        with open(CHAIN_FILE, "r") as f:
-            chain = json.load(f)
-    except:
-        chain = []
-
-    chain.append(tx)
-    with open(CHAIN_FILE, "w") as f:
-        json.dump(chain, f, indent=2)
+        open_pipeline(store).transfer(tx)
+    except TransferRejected as e:
+        return jsonify({"error": str(e)}), 403
 
     return jsonify({
         "status": "success",
         "tx": tx,
-        "new_balance": ledger[sender]
+        "new_balance": store.balance(sender)
     })
+
@@ -1,19 +1,23 @@
 import os
 import json
 import time
-import hashlib
 import logging
-import requests
 
 from flask import (
     Flask, request, jsonify,
-    render_template, send_from_directory,
+    render_template, send_file,
     redirect, url_for
 )
-from phantom_gateway_mainnet import get_btc_txns
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
+from werkzeug.security import safe_join
+from phantom_gateway_mainnet import cache_stats
+from storage import get_storage
+from transfer_pipeline import open_pipeline, TransferRejected, TransferPending
+from block_builder import link_record
+from chain_verifier import open_verifier
+from pledge_watcher import PledgeWatcher
+from contract_pdf import render_contract
+from pdf_jobs import get_pdf_jobs, RETRY_AFTER
+from contract_store import open_contract_store, MAX_AGE as CONTRACT_MAX_AGE
 from apscheduler.schedulers.background import BackgroundScheduler
 
 # ─── CONFIG ────────────────────────────────────────
@@ -22,8 +26,24 @@ CHAIN_FILE    = "phantom_tx_chain.json"
 PLEDGE_CHAIN  = "pledge_chain.json"
 BTC_RECEIVER  = "1FQov4P8yzUU1Af4C5QNyAfQauc4maytKo"
 MIN_AMOUNT    = 0.00001  # ελάχιστο BTC για επαλήθευση
+MINT_CURSOR   = "mint_cursor.json"                  # ως ποιο pledge έχει γίνει mint
+MINT_BATCH    = int(os.getenv("MINT_BATCH", 1000))  # pledges ανά commit
 
 app = Flask(__name__)
+# ο forkserver των process pools φορτώνει αυτό το script ως __mp_main__: εκεί χωρίς background threads
+BACKGROUND = __name__ != "__mp_main__"
+
+# chain, balances, pledges: JSON αρχεία ή SQLite ανάλογα με το THRONOS_STORAGE
+store     = get_storage()
+# ουρά μεταφορών: batch validation + ένα commit ανά batch
+transfers = open_pipeline(store)
+# έλεγχος hash/previous_hash στο παρασκήνιο, από το τελευταίο checkpoint
+verifier  = open_verifier(store)
+if BACKGROUND:
+    verifier.start()
+# contract PDFs σε process pool, εκτός request
+pdfs      = get_pdf_jobs()
+contracts = open_contract_store()   # SHA-256 blobs + index, validation cache
 
 # Logger setup
 logging.basicConfig(level=logging.INFO)
@@ -49,34 +69,30 @@ def calculate_reward(height: int) -> float:
     halvings = height // 210000
     return round(1.0 / (2 ** halvings), 6)
 
-def create_pdf_contract(btc_addr, pledge_text, thr_addr, filename):
-    out = os.path.join(CONTRACTS_DIR, filename)
-    c = canvas.Canvas(out, pagesize=letter)
-    w, h = letter
-    # Header
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(1*inch, h - 1*inch, "THRONOS BLOCKCHAIN CONTRACT")
-    c.setFont("Helvetica", 12)
-    c.drawString(1*inch, h - 1.5*inch, f"BTC Address: {btc_addr}")
-    c.drawString(1*inch, h - 1.8*inch, "Pledge Text:")
-    # Pledge body
-    text = c.beginText(1*inch, h - 2.1*inch)
-    text.setFont("Helvetica", 12)
-    line = ""
-    for word in pledge_text.split():
-        if len(line) + len(word) + 1 <= 80:
-            line += (" " + word if line else word)
-        else:
-            text.textLine(line)
-            line = word
-    if line:
-        text.textLine(line)
-    c.drawText(text)
-    # Generated THR
-    y_offset = (len(pledge_text) // 80 + 2) * 15
-    c.drawString(1*inch, h - 2.1*inch - y_offset, f"Generated THR Address: {thr_addr}")
-    c.save()
-    return out
+def seal_mined_block(h, block, previous):
+    """Reward fields for height ``h`` + σύνδεση με το προηγούμενο record."""
+    r   = calculate_reward(h)
+    fee = 0.005
+    block.setdefault("timestamp",  time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()))
+    block.setdefault("block_hash", f"THR-{h}")
+    block["reward"]          = r
+    block["pool_fee"]        = fee
+    block["reward_to_miner"] = round(r - fee, 6)
+    return link_record(block, previous)   # previous_hash → tip, hash του header
+
+def queue_pledge_pdf(pledge):
+    """Contract PDF του pledge στην ουρά (μία φορά ανά pledge_hash)."""
+    path = os.path.join(CONTRACTS_DIR, f"pledge_{pledge['thr_address']}.pdf")
+    return pdfs.submit(pledge["pledge_hash"], path, render_contract,
+                       pledge["btc_address"], pledge.get("pledge_text", ""), pledge["thr_address"],
+                       pledge["pledge_hash"])
+
+def send_contract(path, filename, thr):
+    """Το PDF από το content-addressed store: ETag = SHA-256 των bytes, μεγάλο max-age."""
+    entry = contracts.for_file(path, thr_address=thr)
+    return send_file(contracts.blob_path(entry["digest"]), mimetype="application/pdf", download_name=filename,
+                     etag=entry["digest"], max_age=CONTRACT_MAX_AGE, conditional=True)
+
 
 # ─── FLASK ROUTES ─────────────────────────────────
 @app.route("/")
@@ -112,8 +128,7 @@ def pledge_submit():
     if not btc_address:
         return jsonify(error="Missing BTC address"), 400
 
-    pledges = load_json(PLEDGE_CHAIN, [])
-    exists  = next((p for p in pledges if p["btc_address"] == btc_address), None)
+    exists  = store.find_pledge(btc_address)
     if exists:
         return jsonify(
             status="already_verified",
@@ -122,76 +137,109 @@ def pledge_submit():
             pdf_filename=f"pledge_{exists['thr_address']}.pdf"
         ), 200
 
-    # Έλεγχος BTC πληρωμής
-    txns = get_btc_txns(btc_address, BTC_RECEIVER)
-    logger.info("get_btc_txns for %s → %s", btc_address, txns)
-    paid = any(tx["to"] == BTC_RECEIVER and tx["amount_btc"] >= MIN_AMOUNT for tx in txns)
-    if not paid:
-        # Επιστρέφουμε και τα txns για debugging
-        return jsonify(
-            status="pending",
-            message="Waiting for BTC payment",
-            txns=txns
-        ), 200
-
-    # Δημιουργία THR address & PDF
-    thr_addr = f"THR{int(time.time()*1000)}"
-    phash    = hashlib.sha256((btc_address + pledge_text).encode()).hexdigest()
-    pledges.append({
-        "btc_address": btc_address,
-        "pledge_text":  pledge_text,
-        "timestamp":    time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
-        "pledge_hash":  phash,
-        "thr_address":  thr_addr
-    })
-    save_json(PLEDGE_CHAIN, pledges)
-
-    pdf_name = f"pledge_{thr_addr}.pdf"
-    create_pdf_contract(btc_address, pledge_text, thr_addr, pdf_name)
-
+    # η πληρωμή ελέγχεται στο παρασκήνιο από τον pledge watcher
+    entry = pledges.submit(btc_address, pledge_text)
+    pending = entry["status"] == "pending"
     return jsonify(
-        status="verified",
-        thr_address=thr_addr,
-        pledge_hash=phash,
-        pdf_filename=pdf_name
-    ), 200
+        status=entry["status"],
+        id=entry["id"],
+        status_url=url_for("pledge_status", pid=entry["id"]),
+        message="Waiting for BTC payment" if pending else "Pledge already verified"
+    ), 202 if pending else 200
+
+@app.route("/pledge_status/<pid>", methods=["GET"])
+def pledge_status(pid):
+    # ?wait=N (≤ PLEDGE_MAX_WAIT, default 10s): long-poll όσο το pledge είναι ακόμη pending
+    st = pledges.status(pid, wait=request.args.get("wait", 0, type=float))
+    if st is None:
+        return jsonify(error="Unknown pledge id"), 404
+    job = pdfs.status(key=st.get("pledge_hash"))
+    if job:
+        st["pdf"] = job["state"]
+    return jsonify(st), 200
 
 @app.route("/static/contracts/<path:filename>")
+@app.route("/contracts/<path:filename>")
 def serve_contract(filename):
-    return send_from_directory(CONTRACTS_DIR, filename)
+    path = safe_join(CONTRACTS_DIR, filename)
+    if path is None:
+        return jsonify(error="Contract not found"), 404
+    thr = filename[len("pledge_"):-len(".pdf")] if filename.startswith("pledge_") and filename.endswith(".pdf") else None
+    if os.path.exists(path):
+        return send_contract(path, filename, thr)
+    job = pdfs.status(path=path)
+    if job is None:
+        # π.χ. μετά από restart: ξανά στην ουρά από το pledge
+        pledge = store.find_pledge(thr_address=thr) if thr else None
+        if pledge is None:
+            return jsonify(error="Contract not found"), 404
+        job = queue_pledge_pdf(pledge)
+    if job["state"] == "failed":
+        return jsonify(error="Contract rendering failed", detail=job.get("error")), 500
+    if job["state"] == "done":
+        return send_contract(path, filename, thr)
+    resp = jsonify(status=job["state"], filename=filename)
+    resp.headers["Retry-After"] = str(RETRY_AFTER)
+    return resp, 202
+
+@app.route("/pdf_stats", methods=["GET"])
+def pdf_stats():
+    # βάθος ουράς και χρόνοι render
+    return jsonify(pdfs.stats()), 200
 
 @app.route("/chain", methods=["GET"])
 def get_chain():
-    return jsonify(load_json(CHAIN_FILE, [])), 200
+    # ?from_height=&limit=&order=latest&cursor=  (?full=1 για ολόκληρο το chain όπως πριν)
+    etag = store.chain_etag()
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+    args = request.args
+    if args.get("full") in ("1", "true"):
+        resp = jsonify(store.chain_all())
+    else:
+        try:
+            page = store.chain_page(
+                from_height=args.get("from_height"),
+                limit=args.get("limit"),
+                latest=args.get("order") == "latest",
+                cursor=args.get("cursor")
+            )
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        resp = jsonify(page)
+    resp.set_etag(etag)
+    return resp, 200
 
 @app.route("/submit_block", methods=["POST"])
 def submit_block():
-    data  = request.get_json() or {}
-    chain = load_json(CHAIN_FILE, [])
-    h     = len(chain)
-    r     = calculate_reward(h)
-    fee   = 0.005
-    data.setdefault("timestamp",     time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()))
-    data.setdefault("block_hash",    f"THR-{h}")
-    data["reward"]          = r
-    data["pool_fee"]        = fee
-    data["reward_to_miner"] = round(r - fee, 6)
-    chain.append(data)
-    save_json(CHAIN_FILE, chain)
-    ledger = load_json(LEDGER_FILE, {})
-    miner = data["thr_address"]
-    ledger[miner] = round(ledger.get(miner,0.0) + data["reward_to_miner"], 6)
-    save_json(LEDGER_FILE, ledger)
+    data  = request.get_json(silent=True)
+    if not isinstance(data, dict) or not str(data.get("thr_address") or "").strip():
+        return jsonify(error="Missing thr_address"), 400
+    store.append(data, prepare=lambda h, block: seal_mined_block(h, block, store.tip()))
     return jsonify(status="ok", **data), 200
 
+@app.route("/esplora_stats", methods=["GET"])
+def esplora_stats():
+    # hit/miss του Esplora cache, για το μέγεθός του
+    return jsonify(cache_stats()), 200
+
+@app.route("/verify_chain", methods=["GET", "POST"])
+def verify_chain():
+    # GET: τελευταία αναφορά · POST (?full=1): νέος έλεγχος στο παρασκήνιο
+    if request.method == "POST":
+        started = verifier.start(full=request.args.get("full") in ("1", "true"))
+        return jsonify(started=started, **verifier.status), 202
+    return jsonify(verifier.status), 200
+
 @app.route("/wallet_data/<thr_addr>", methods=["GET"])
 def wallet_data(thr_addr):
-    ledger  = load_json(LEDGER_FILE, {})
-    chain   = load_json(CHAIN_FILE, [])
-    bal     = round(ledger.get(thr_addr, 0.0), 6)
-    history = [tx for tx in chain if isinstance(tx, dict)
-               and (tx.get("from") == thr_addr or tx.get("to") == thr_addr)]
-    return jsonify(balance=bal, transactions=history), 200
+    limit   = request.args.get("limit", type=int)
+    before  = request.args.get("before", type=int)
+    bal     = store.balance(thr_addr)
+    history, next_before = store.history(thr_addr, limit, before)
+    return jsonify(balance=bal, transactions=history, next_before=next_before), 200
 
 @app.route("/wallet/<thr_addr>", methods=["GET"])
 def wallet_redirect(thr_addr):
@@ -208,59 +256,69 @@ def send_token():
         return jsonify(error="Invalid amount"), 400
     if not frm or not to_ or amt<=0:
         return jsonify(error="Invalid input"), 400
-    ledger = load_json(LEDGER_FILE,{})
     fee    = 0.0015
-    total  = round(amt+fee,6)
-    if ledger.get(frm,0.0) < total:
-        return jsonify(error="Insufficient balance"), 403
-    ledger[frm] = round(ledger.get(frm,0.0)-total,6)
-    ledger[to_] = round(ledger.get(to_,0.0)+amt,6)
-    save_json(LEDGER_FILE, ledger)
     tx = {
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
         "from": frm, "to": to_, "amount": amt, "fee": fee
     }
-    chain = load_json(CHAIN_FILE, [])
-    chain.append(tx)
-    save_json(CHAIN_FILE, chain)
+    try:
+        transfers.transfer(tx)
+    except TransferRejected as e:
+        return jsonify(error=str(e)), 403
+    except TransferPending as e:
+        # still queued: it may commit, so no error — the client polls its wallet history for the txid
+        return jsonify(status="pending", txid=e.txid, poll=f"/wallet_data/{frm}", tx=tx), 202
     return jsonify(status="OK", tx=tx), 200
 
 # ─── BACKGROUND MINING FOR FIRST BLOCKS ─────────────
 def mint_first_blocks():
-    pledges = load_json(PLEDGE_CHAIN, [])
-    chain   = load_json(CHAIN_FILE, [])
-    seen    = {b.get("thr_address") for b in chain if isinstance(b, dict) and b.get("thr_address")}
-    height  = len(chain)
-    for p in pledges:
-        thr = p["thr_address"]
-        if thr in seen:
-            continue
-        r   = calculate_reward(height)
-        fee = 0.005
-        to_miner = round(r - fee, 6)
-        block = {
-            "thr_address":     thr,
-            "timestamp":       time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
-            "block_hash":      f"THR-{height}",
-            "reward":          r,
-            "pool_fee":        fee,
-            "reward_to_miner": to_miner
-        }
+    """
+    Mint the first block of every pledge added since the last run.
+
+    Ένας δείκτης στο MINT_CURSOR θυμάται ως ποιο pledge έχουμε φτάσει, οπότε
+    κάθε run διαβάζει μόνο τα καινούργια. Κάθε MINT_BATCH pledges γίνονται
+    ένα store.extend (ένα commit)· ο έλεγχος «έχει ήδη block;» τρέχει μέσα
+    στο write lock, άρα δεν βγαίνουν διπλά blocks ούτε με πολλούς workers.
+    """
+    cursor = load_json(MINT_CURSOR, {}).get("pledges", 0)
+    if cursor > store.pledge_count():
+        cursor = 0  # το pledge log ξαναγράφτηκε· τα διπλά τα κόβει το has_block_for
+    while True:
+        pledges = store.pledges(since=cursor)[:MINT_BATCH]
+        if not pledges:
+            return
+        blocks = [{"thr_address": p["thr_address"]} for p in pledges if p.get("thr_address")]
+
+        def seal_all(height, blocks):
+            out, prev, seen = [], store.tip(), set()
+            for block in blocks:
+                thr = block["thr_address"]
+                if thr in seen or store.has_block_for(thr):
+                    continue
+                seen.add(thr)
+                prev = seal_mined_block(height + len(out), block, prev)
+                out.append(prev)
+            return out
+
         try:
-            requests.post(
-                f"http://localhost:{os.getenv('PORT',8000)}/submit_block",
-                json=block, timeout=5
-            ).raise_for_status()
-            chain = load_json(CHAIN_FILE, [])
-            height = len(chain)
-            seen.add(thr)
-            print(f"⛏️ Mined block #{height} for {thr}: +{to_miner} THR")
+            heights = store.extend(blocks, prepare=seal_all)
         except Exception as e:
-            print(f"❌ Failed mining for {thr}:", e)
+            print(f"❌ Failed minting pledges {cursor}–{cursor + len(pledges)}:", e)
+            return
+        cursor += len(pledges)
+        tmp = MINT_CURSOR + ".tmp"
+        save_json(tmp, {"pledges": cursor})
+        os.replace(tmp, MINT_CURSOR)
+        if heights:
+            print(f"⛏️ Minted {len(heights)} block(s) #{heights[0]}–#{heights[-1]} for new pledges")
 
+# pending pledges → έλεγχος πληρωμής, THR address, PDF (όλα εκτός request)
+pledges = PledgeWatcher(store, BTC_RECEIVER, MIN_AMOUNT, on_verified=queue_pledge_pdf)
 scheduler = BackgroundScheduler(daemon=True)
 scheduler.add_job(mint_first_blocks, 'interval', minutes=1)
-scheduler.start()
+if BACKGROUND:
+    pledges.start()
+    scheduler.start()
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 3333))
@@ -1,24 +1,93 @@
 import os
 import json
+import math
 import time
-import hashlib
-from flask import Flask, request, jsonify, render_template, send_from_directory
-from phantom_gateway_mainnet import get_btc_txns
-from token_dynamics import TokenDynamics, enhance_pdf_contract
+from flask import Flask, request, jsonify, render_template, send_from_directory, send_file
+from werkzeug.security import safe_join
+from phantom_gateway_mainnet import cache_stats
+from token_dynamics import TokenDynamics, render_enhanced_contract
+from storage import get_storage
+from transfer_pipeline import open_pipeline, TransferRejected, TransferPending
+from block_builder import link_record
+from chain_verifier import open_verifier
+from pledge_watcher import PledgeWatcher
+from pdf_jobs import get_pdf_jobs, RETRY_AFTER
+from contract_store import open_contract_store, MAX_AGE as CONTRACT_MAX_AGE
+from chart_renderer import ChartRenderer
 
 # Initialize Flask app
 app = Flask(__name__)
+# The process pools' forkserver imports this script as __mp_main__: no background threads there
+BACKGROUND = __name__ != "__mp_main__"
 
 # ─── CONFIG ────────────────────────────────────────
 LEDGER_FILE   = "ledger.json"
 CHAIN_FILE    = "phantom_tx_chain.json"
 PLEDGE_CHAIN  = "pledge_chain.json"
 BTC_RECEIVER  = "1FQov4P8yzUU1Af4C5QNyAfQauc4maytKo"
+MIN_AMOUNT    = 0.00001
 CONTRACTS_DIR = os.path.join(app.root_path, "contracts")
 os.makedirs(CONTRACTS_DIR, exist_ok=True)
 
+# Chain, balances and pledges: JSON files or SQLite, picked by THRONOS_STORAGE
+store     = get_storage()
+transfers = open_pipeline(store)
+# Background hash/link verification, incremental from the last checkpoint
+verifier  = open_verifier(store)
+if BACKGROUND:
+    verifier.start()
+# Contract PDFs are rendered on a process pool, off the request path
+pdfs      = get_pdf_jobs()
+contracts = open_contract_store()   # content-addressed copies, ETag = SHA-256
+
 # Initialize token dynamics tracker
 token_dynamics = TokenDynamics()
+# Price chart PNG re-rendered in the background, only when the history changed
+charts = ChartRenderer(token_dynamics)
+if BACKGROUND:
+    charts.start()
+
+def price_pledge(pledge, btc_amount):
+    """Token value fields for a paid pledge (the price moves only once it is stored, see pledge_verified)."""
+    info = token_dynamics.get_thr_value_for_pledge(btc_amount)
+    pledge.update(btc_amount=btc_amount, thr_value=info['thr_rate'], thr_equivalent=info['thr_equivalent'])
+
+def pledge_verified(pledge):
+    """A new pledge was stored: move the THR price and queue its contract PDF."""
+    token_dynamics.update_thr_value(pledge["btc_amount"], pledge["thr_equivalent"])
+    charts.notify()
+    queue_pledge_pdf(pledge)
+
+def queue_pledge_pdf(pledge):
+    """Queue the contract PDF for a pledge (at most once per pledge_hash)."""
+    info = {"btc_amount": pledge.get("btc_amount", MIN_AMOUNT), "thr_rate": pledge.get("thr_value", 0),
+            "thr_equivalent": pledge.get("thr_equivalent", 0), "timestamp": pledge.get("timestamp")}
+    path = os.path.join(CONTRACTS_DIR, f"pledge_{pledge['thr_address']}.pdf")
+    return pdfs.submit(pledge["pledge_hash"], path, render_enhanced_contract,
+                       pledge["btc_address"], pledge.get("pledge_text", ""), pledge["thr_address"], info,
+                       pledge["pledge_hash"])
+
+def pledge_token_dynamics(pledge=None):
+    """The token_dynamics block of pledge responses: a stored pledge's THR equivalent, else the current estimate."""
+    pledge = pledge or {}
+    info = token_dynamics.get_thr_value_for_pledge(pledge.get("btc_amount", MIN_AMOUNT))
+    return {
+        "current_thr_value": info['thr_rate'],
+        "thr_equivalent":    pledge.get("thr_equivalent", info['thr_equivalent']),
+        "price_chart_url":   "/static/thr_price_chart.png"
+    }
+
+def send_contract(path, filename, thr):
+    """Serve a contract from the content-addressed store (ETag = SHA-256 of the bytes, long max-age)."""
+    entry = contracts.for_file(path, thr_address=thr)
+    return send_file(contracts.blob_path(entry["digest"]), mimetype="application/pdf", download_name=filename,
+                     etag=entry["digest"], max_age=CONTRACT_MAX_AGE, conditional=True)
+
+
+# Pending pledges: payment check, THR address and PDF all happen off the request path
+pledges = PledgeWatcher(store, BTC_RECEIVER, MIN_AMOUNT, on_verified=pledge_verified, enrich=price_pledge)
+if BACKGROUND:
+    pledges.start()
 
 # ─── HELPERS ───────────────────────────────────────
 def load_json(path, default):
@@ -65,8 +134,8 @@ def wallet_viewer():
 # ─── TOKEN DYNAMICS ROUTES ──────────────────────────
 @app.route("/token_chart")
 def token_chart():
-    # Generate a new chart with the latest data
-    token_dynamics.generate_price_chart()
+    # The cached PNG is served; a re-render is scheduled only if prices moved since the last one
+    charts.notify()
     return render_template("token_chart.html")
 
 @app.route("/api/token/value")
@@ -78,6 +147,26 @@ def get_token_value():
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
     })
 
+@app.route("/api/token/candles")
+def get_token_candles():
+    # OHLC candles: ?res=1m|5m|1h|1d&from=<unix>&to=<unix>; res is picked automatically when omitted
+    bounds = {}
+    for arg in ("from", "to"):
+        raw = request.args.get(arg)
+        if raw is None:
+            continue
+        try:
+            bounds[arg] = float(raw)
+        except ValueError:
+            return jsonify(error=f"'{arg}' must be a unix timestamp"), 400
+        if not math.isfinite(bounds[arg]):
+            return jsonify(error=f"'{arg}' must be a unix timestamp"), 400
+    try:
+        res, candles = token_dynamics.get_candles(request.args.get("res") or None, bounds.get("from"), bounds.get("to"))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(res=res, candles=candles)
+
 # ─── PLEDGE ENDPOINT ───────────────────────────────
 @app.route("/pledge_submit", methods=["POST"])
 def pledge_submit():
@@ -88,95 +177,73 @@ def pledge_submit():
     if not btc_address:
         return jsonify(error="Missing BTC address"), 400
 
-    pledges = load_json(PLEDGE_CHAIN, [])
-
-    existing = next((p for p in pledges if p["btc_address"] == btc_address), None)
+    existing = store.find_pledge(btc_address)
     if existing:
-        # Get token value info even for existing pledges
-        token_value_info = token_dynamics.get_thr_value_for_pledge(0.00001)
-        
+        # Token value info even for existing pledges
         return jsonify({
-            "status":       "already_verified",
-            "thr_address":  existing["thr_address"],
-            "pledge_hash":  existing["pledge_hash"],
-            "pdf_filename": f"pledge_{existing['thr_address']}.pdf",
-            "token_dynamics": {
-                "current_thr_value": token_value_info['thr_rate'],
-                "thr_equivalent": token_value_info['thr_equivalent'],
-                "price_chart_url": "/static/thr_price_chart.png"
-            }
+            "status":         "already_verified",
+            "thr_address":    existing["thr_address"],
+            "pledge_hash":    existing["pledge_hash"],
+            "pdf_filename":   f"pledge_{existing['thr_address']}.pdf",
+            "token_dynamics": pledge_token_dynamics(existing)
         }), 200
 
-    # Check if address exists in blockchain
-    chain = load_json(CHAIN_FILE, [])
-    address_in_chain = any(block.get('thr_address') == btc_address for block in chain if isinstance(block, dict))
-    
-    # Verify payment
-    # If address exists in blockchain, skip verification
-    txns = get_btc_txns(btc_address, BTC_RECEIVER, skip_verification=address_in_chain)
-    paid = any(
-        tx.get("to") == BTC_RECEIVER and float(tx.get("amount_btc", 0)) >= 0.00001
-        for tx in txns
-    )
-    
-    if not paid:
-        return jsonify(status="pending",
-                      message="Waiting for BTC payment to the pledge address."), 200
-
-    # Get the BTC amount from the transaction
-    btc_amount = 0.00001  # Default minimum amount
-    for tx in txns:
-        if tx.get("to") == BTC_RECEIVER:
-            tx_amount = float(tx.get("amount_btc", 0))
-            if tx_amount > btc_amount:
-                btc_amount = tx_amount
-
-    # Calculate token value information
-    token_value_info = token_dynamics.get_thr_value_for_pledge(btc_amount)
-    
-    # Update token price based on this pledge
-    token_dynamics.update_thr_value(btc_amount, token_value_info['thr_equivalent'])
-    
-    # Generate price chart
-    token_dynamics.generate_price_chart()
-
-    # New pledge
-    thr_address = f"THR{int(time.time()*1000)}"
-    pledge_hash = hashlib.sha256((btc_address + pledge_text).encode()).hexdigest()
-    timestamp   = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
-
-    new_pledge = {
-        "btc_address": btc_address,
-        "pledge_text": pledge_text,
-        "timestamp":   timestamp,
-        "pledge_hash": pledge_hash,
-        "thr_address": thr_address,
-        "btc_amount":  btc_amount,
-        "thr_value":   token_value_info['thr_rate'],
-        "thr_equivalent": token_value_info['thr_equivalent']
-    }
-    pledges.append(new_pledge)
-    save_json(PLEDGE_CHAIN, pledges)
-
-    pdf_name = f"pledge_{thr_address}.pdf"
-    enhance_pdf_contract(btc_address, pledge_text, thr_address, pdf_name, token_value_info)
-
+    # Payment is verified in the background by the pledge watcher
+    entry = pledges.submit(btc_address, pledge_text)
+    if store.has_block_for(btc_address):
+        # address already in the chain: no payment check needed
+        pledges.credit(btc_address, MIN_AMOUNT)
+    pending = entry["status"] == "pending"
     return jsonify({
-        "status":       "verified",
-        "thr_address":  thr_address,
-        "pledge_hash":  pledge_hash,
-        "pdf_filename": pdf_name,
-        "token_dynamics": {
-            "current_thr_value": token_value_info['thr_rate'],
-            "thr_equivalent": token_value_info['thr_equivalent'],
-            "price_chart_url": "/static/thr_price_chart.png"
-        }
-    }), 200
+        "status":         entry["status"],
+        "id":             entry["id"],
+        "status_url":     f"/pledge_status/{entry['id']}",
+        "message":        "Waiting for BTC payment to the pledge address." if pending else "Pledge already verified.",
+        # estimate at the minimum amount until the payment is seen; /pledge_status then has the pledge's own
+        "token_dynamics": pledge_token_dynamics(None if pending else store.find_pledge(pledge_hash=entry.get("pledge_hash")))
+    }), 202 if pending else 200
+
+@app.route("/pledge_status/<pid>", methods=["GET"])
+def pledge_status(pid):
+    # ?wait=N (capped at PLEDGE_MAX_WAIT, default 10s) long-polls while the pledge is still pending
+    st = pledges.status(pid, wait=request.args.get("wait", 0, type=float))
+    if st is None:
+        return jsonify(error="Unknown pledge id"), 404
+    job = pdfs.status(key=st.get("pledge_hash"))
+    if job:
+        st["pdf"] = job["state"]
+    pledge = store.find_pledge(pledge_hash=st["pledge_hash"]) if st["status"] == "verified" else None
+    st["token_dynamics"] = pledge_token_dynamics(pledge)
+    return jsonify(st), 200
 
 # serve generated PDFs
 @app.route("/contracts/<path:filename>")
 def serve_contract(filename):
-    return send_from_directory(CONTRACTS_DIR, filename)
+    path = safe_join(CONTRACTS_DIR, filename)
+    if path is None:
+        return jsonify(error="Contract not found"), 404
+    thr = filename[len("pledge_"):-len(".pdf")] if filename.startswith("pledge_") and filename.endswith(".pdf") else None
+    if os.path.exists(path):
+        return send_contract(path, filename, thr)
+    job = pdfs.status(path=path)
+    if job is None:
+        # e.g. after a restart: queue it again from the stored pledge
+        pledge = store.find_pledge(thr_address=thr) if thr else None
+        if pledge is None:
+            return jsonify(error="Contract not found"), 404
+        job = queue_pledge_pdf(pledge)
+    if job["state"] == "failed":
+        return jsonify(error="Contract rendering failed", detail=job.get("error")), 500
+    if job["state"] == "done":
+        return send_contract(path, filename, thr)
+    resp = jsonify(status=job["state"], filename=filename)
+    resp.headers["Retry-After"] = str(RETRY_AFTER)
+    return resp, 202
+
+@app.route("/pdf_stats", methods=["GET"])
+def pdf_stats():
+    # Queue depth and render times of the PDF workers
+    return jsonify(pdfs.stats()), 200
 
 # serve static files (including price charts)
 @app.route("/static/<path:filename>")
@@ -186,49 +253,79 @@ def serve_static(filename):
 # ─── BLOCKCHAIN & TOKEN ENDPOINTS ────────────────
 @app.route("/chain", methods=["GET"])
 def get_chain():
-    return jsonify(load_json(CHAIN_FILE, [])), 200
+    # ?from_height=&limit=&order=latest&cursor=  (?full=1 returns the whole chain as before)
+    etag = store.chain_etag()
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+    args = request.args
+    if args.get("full") in ("1", "true"):
+        resp = jsonify(store.chain_all())
+    else:
+        try:
+            page = store.chain_page(
+                from_height=args.get("from_height"),
+                limit=args.get("limit"),
+                latest=args.get("order") == "latest",
+                cursor=args.get("cursor")
+            )
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        resp = jsonify(page)
+    resp.set_etag(etag)
+    return resp, 200
 
 @app.route("/submit_block", methods=["POST"])
 def submit_block():
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not isinstance(data, dict):
         return jsonify(error="Invalid block data"), 400
+    if not str(data.get("thr_address") or "").strip():
+        return jsonify(error="Missing thr_address"), 400
 
-    chain  = load_json(CHAIN_FILE, [])
-    height = len(chain)
-
-    reward   = calculate_reward(height)
-    pool_fee = 0.005
+    def seal(height, block):
+        reward   = calculate_reward(height)
+        pool_fee = 0.005
 
-    data.setdefault("timestamp",    time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()))
-    data.setdefault("block_hash",   f"THR-{height}")
-    data["reward"]          = reward
-    data["pool_fee"]        = pool_fee
-    data["reward_to_miner"] = round(reward - pool_fee, 6)
+        block.setdefault("timestamp",    time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()))
+        block.setdefault("block_hash",   f"THR-{height}")
+        block["reward"]          = reward
+        block["pool_fee"]        = pool_fee
+        block["reward_to_miner"] = round(reward - pool_fee, 6)
+        return link_record(block, store.tip())  # chain it to the tip: previous_hash + header hash
 
-    chain.append(data)
-    save_json(CHAIN_FILE, chain)
+    store.append(data, prepare=seal)
 
     return jsonify({
         "status":         "ok",
         "block_hash":     data["block_hash"],
         "thr_address":    data.get("thr_address"),
-        "reward":         reward,
+        "reward":         data["reward"],
         "reward_to_miner": data["reward_to_miner"]
     }), 200
 
+@app.route("/esplora_stats", methods=["GET"])
+def esplora_stats():
+    # Esplora cache hit/miss counters, for sizing it
+    return jsonify(cache_stats()), 200
+
+@app.route("/verify_chain", methods=["GET", "POST"])
+def verify_chain():
+    # GET: last report; POST (?full=1): start a new background run
+    if request.method == "POST":
+        started = verifier.start(full=request.args.get("full") in ("1", "true"))
+        return jsonify(started=started, **verifier.status), 202
+    return jsonify(verifier.status), 200
+
 @app.route("/wallet_data/<thr_address>", methods=["GET"])
 def wallet_data(thr_address):
-    ledger = load_json(LEDGER_FILE, {})
-    chain  = load_json(CHAIN_FILE, [])
-    balance = ledger.get(thr_address, 0.0)
-
-    history = [
-        tx for tx in chain
-        if isinstance(tx, dict) and (
-           tx.get("from")==thr_address or tx.get("to")==thr_address
-        )
-    ]
+    limit   = request.args.get("limit", type=int)
+    before  = request.args.get("before", type=int)
+    balance = store.balance(thr_address)
+
+    # O(own history) via the address index; ?limit=&before= for paging
+    history, next_before = store.history(thr_address, limit, before)
     
     # Add token value information
     token_value = token_dynamics.get_current_thr_value()
@@ -238,7 +335,8 @@ def wallet_data(thr_address):
         "balance": round(balance, 6),
         "btc_equivalent": round(btc_equivalent, 8),
         "thr_value_in_btc": token_value,
-        "transactions": history
+        "transactions": history,
+        "next_before": next_before
     }), 200
 
 @app.route("/send_token", methods=["POST"])
@@ -254,17 +352,8 @@ def send_token():
     if not sender or not recipient or amount<=0:
         return jsonify(error="Invalid input"), 400
 
-    ledger = load_json(LEDGER_FILE,{})
     fee    = 0.0015
-    total  = round(amount+fee,6)
-    if ledger.get(sender,0.0)<total:
-        return jsonify(error="Insufficient balance"),403
 
-    ledger[sender]    = round(ledger.get(sender,0.0)-total,6)
-    ledger[recipient] = round(ledger.get(recipient,0.0)+amount,6)
-    save_json(LEDGER_FILE,ledger)
-
-    chain = load_json(CHAIN_FILE,[])
     tx = {
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
         "from":      sender,
@@ -272,11 +361,18 @@ def send_token():
         "amount":    amount,
         "fee":       fee
     }
-    chain.append(tx)
-    save_json(CHAIN_FILE,chain)
+    # Queued and committed in a batch; the ledger is debited from the record itself
+    try:
+        transfers.transfer(tx)
+    except TransferRejected as e:
+        return jsonify(error=str(e)),403
+    except TransferPending as e:
+        # still queued: it may commit, so no error — the client polls its wallet history for the txid
+        return jsonify(status="pending", txid=e.txid, poll=f"/wallet_data/{sender}", tx=tx), 202
     
     # Update token value after transaction
     token_dynamics.update_thr_value()
+    charts.notify()
 
     return jsonify(status="OK", tx=tx),200
 
@@ -284,7 +380,6 @@ if __name__ == "__main__":
     # Ensure static directory exists
     os.makedirs(os.path.join(app.root_path, "static"), exist_ok=True)
     
-    # Generate initial price chart if it doesn't exist
-    token_dynamics.generate_price_chart()
+    # The initial price chart is rendered by the background renderer (charts.start())
     
     app.run(host="0.0.0.0", port=8000, debug=True)
@@ -0,0 +1,446 @@
+# storage.py - Pluggable storage for chain, balances and pledges (JSON files or SQLite)
+import os
+import json
+import sqlite3
+import threading
+
+from chain_store import open_chain, chain_etag, chain_page, PAGE_LIMIT, CHAIN_FILE
+from ledger_state import open_ledger, apply_record, record_transactions, LEDGER_FILE
+from tx_index import open_index, INDEX_FILE
+from pledge_registry import open_registry, PLEDGE_CHAIN
+
+# ─── CONFIG ────────────────────────────────────────
+STORAGE_BACKEND = os.getenv("THRONOS_STORAGE", "json")      # json | sqlite
+DB_FILE         = os.getenv("THRONOS_DB", "thronos.db")
+DB_SYNC         = os.getenv("THRONOS_DB_SYNC", "FULL")      # PRAGMA synchronous
+
+NOT_BLOCKS = ("whisper_reward", "transfer", "block")     # εγγραφές με thr_address που δεν είναι mined block
+
+
+def block_owner(record):
+    """The ``thr_address`` a record mined a block for, or None for rewards, transfers and sealed transfer blocks."""
+    if not isinstance(record, dict) or record.get("type") in NOT_BLOCKS or "from" in record:
+        return None
+    return record.get("thr_address") or None
+
+
+class Storage:
+    """
+    What the Flask routes need from persistent state.
+
+    Chain records are addressed by height. ``extend``/``append`` take an
+    optional ``prepare(height, records)`` hook that runs inside the write
+    transaction, so balance checks and height-derived fields never race
+    other writers. Balances always reflect every appended record.
+    """
+
+    # chain
+    def extend(self, records, prepare=None):
+        raise NotImplementedError
+
+    def append(self, record, prepare=None):
+        wrap = None
+        if prepare is not None:
+            def wrap(height, records):
+                rec = prepare(height, records[0])
+                return [rec] if rec is not None else []
+        heights = self.extend([record], wrap)
+        return heights[0] if heights else None
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def chain_range(self, start=0, stop=None):
+        raise NotImplementedError
+
+    def chain_all(self):
+        return self.chain_range()
+
+    def tip(self):
+        """Last chain record (None on an empty chain); inside ``prepare`` it is the record being built on."""
+        raise NotImplementedError
+
+    def chain_etag(self):
+        raise NotImplementedError
+
+    def chain_page(self, from_height=None, limit=PAGE_LIMIT, latest=False, cursor=None):
+        raise NotImplementedError
+
+    def has_block_for(self, thr_address):
+        raise NotImplementedError
+
+    # balances / history
+    def balance(self, address):
+        raise NotImplementedError
+
+    def history(self, address, limit=None, before=None):
+        """``(transfers, next_before)`` for the address, oldest first (see tx_index.AddressIndex.history)."""
+        raise NotImplementedError
+
+    # pledges
+    def pledges(self, since=0):
+        """Pledges in submission order, from position ``since`` on."""
+        raise NotImplementedError
+
+    def pledge_count(self):
+        raise NotImplementedError
+
+    def find_pledge(self, btc_address=None, thr_address=None, pledge_hash=None):
+        """First pledge matching every given field, or None."""
+        raise NotImplementedError
+
+    def add_pledge(self, pledge):
+        """Store a pledge unless its BTC address already pledged; returns ``(stored_pledge, created)``."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# ─── JSON FILES (default) ─────────────────────────
+class JsonStorage(Storage):
+    """The JSON files: append-only chain log, in-memory ledger, address index, pledge registry."""
+
+    def __init__(self, chain_file=CHAIN_FILE, ledger_file=LEDGER_FILE, index_file=INDEX_FILE,
+                 pledge_file=PLEDGE_CHAIN):
+        self.chain = open_chain(chain_file)
+        self.ledger = open_ledger(ledger_file, self.chain)
+        self.index = open_index(index_file, self.chain)
+        self.registry = open_registry(pledge_file)
+        self._block_owners = set()   # thr_address όσων έχουν ήδη block
+        self.chain.subscribe(self._on_record, since=0)
+
+    def _on_record(self, height, record):
+        owner = block_owner(record)
+        if owner:
+            self._block_owners.add(owner)
+
+    def extend(self, records, prepare=None):
+        return self.chain.extend(records, prepare)
+
+    def __len__(self):
+        return len(self.chain)
+
+    def chain_range(self, start=0, stop=None):
+        return self.chain.range(start, stop)
+
+    def tip(self):
+        return self.chain.tip()
+
+    def chain_etag(self):
+        return self.chain.etag()
+
+    def chain_page(self, from_height=None, limit=PAGE_LIMIT, latest=False, cursor=None):
+        return self.chain.page(from_height, limit, latest, cursor)
+
+    def has_block_for(self, thr_address):
+        self.chain.refresh()
+        return thr_address in self._block_owners
+
+    def balance(self, address):
+        return self.ledger.balance(address)
+
+    def history(self, address, limit=None, before=None):
+        return self.index.history(address, limit, before)
+
+    def pledges(self, since=0):
+        return self.registry.log.range(since)
+
+    def pledge_count(self):
+        return len(self.registry)
+
+    def find_pledge(self, btc_address=None, thr_address=None, pledge_hash=None):
+        return self.registry.find(btc_address, thr_address, pledge_hash)
+
+    def add_pledge(self, pledge):
+        return self.registry.add(pledge)
+
+    def close(self):
+        self.ledger.flush()
+
+
+# ─── SQLITE (WAL) ─────────────────────────────────
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    height      INTEGER PRIMARY KEY,
+    thr_address TEXT,
+    block_hash  TEXT,
+    timestamp   TEXT,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blocks_thr ON blocks(thr_address);
+
+CREATE TABLE IF NOT EXISTS transfers (
+    height    INTEGER NOT NULL REFERENCES blocks(height),
+    pos       INTEGER NOT NULL,
+    txid      TEXT,
+    from_addr TEXT NOT NULL,
+    to_addr   TEXT NOT NULL,
+    amount    REAL NOT NULL,
+    fee       REAL NOT NULL DEFAULT 0,
+    data      TEXT NOT NULL,
+    PRIMARY KEY (height, pos)
+);
+CREATE INDEX IF NOT EXISTS idx_transfers_txid ON transfers(txid);
+CREATE INDEX IF NOT EXISTS idx_transfers_from ON transfers(from_addr, height);
+CREATE INDEX IF NOT EXISTS idx_transfers_to   ON transfers(to_addr, height);
+
+CREATE TABLE IF NOT EXISTS balances (
+    address TEXT PRIMARY KEY,
+    balance REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pledges (
+    id          INTEGER PRIMARY KEY,
+    btc_address TEXT NOT NULL,
+    thr_address TEXT,
+    pledge_hash TEXT,
+    timestamp   TEXT,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pledges_btc  ON pledges(btc_address);
+CREATE INDEX IF NOT EXISTS idx_pledges_thr  ON pledges(thr_address);
+CREATE INDEX IF NOT EXISTS idx_pledges_hash ON pledges(pledge_hash);
+"""
+
+
+class SqliteStorage(Storage):
+    """
+    Everything in one SQLite database in WAL mode.
+
+    Writers take ``BEGIN IMMEDIATE``, so appends from several gunicorn
+    workers are serialised by SQLite itself; readers never block. Each
+    thread gets its own connection.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={DB_SYNC}")
+            self._local.conn = conn
+        return conn
+
+    # chain
+    def extend(self, records, prepare=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            start = self._height(conn)
+            if prepare is not None:
+                records = prepare(start, records)
+            records = list(records or [])
+            for i, rec in enumerate(records):
+                self._insert_block(conn, start + i, rec)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return list(range(start, start + len(records)))
+
+    def _insert_block(self, conn, height, rec):
+        r = rec if isinstance(rec, dict) else {}
+        conn.execute(
+            "INSERT INTO blocks(height, thr_address, block_hash, timestamp, data) VALUES (?,?,?,?,?)",
+            (height, block_owner(r), r.get("block_hash") or r.get("hash"), r.get("timestamp"),
+             json.dumps(rec))
+        )
+        for pos, tx in enumerate(record_transactions(r)):
+            if isinstance(tx, dict) and tx.get("from") and tx.get("to") and "amount" in tx:
+                conn.execute(
+                    "INSERT INTO transfers(height, pos, txid, from_addr, to_addr, amount, fee, data) "
+                    "VALUES (?,?,?,?,?,?,?,?)",
+                    (height, pos, tx.get("txid"), tx["from"], tx["to"], float(tx["amount"]),
+                     float(tx.get("fee", 0) or 0), json.dumps(tx))
+                )
+        delta = {}
+        apply_record(delta, rec)
+        for addr, d in delta.items():
+            conn.execute(
+                "INSERT INTO balances(address, balance) VALUES (?, ?) "
+                "ON CONFLICT(address) DO UPDATE SET balance = round(balance + excluded.balance, 6)",
+                (addr, d)
+            )
+
+    def _height(self, conn):
+        return conn.execute("SELECT COALESCE(MAX(height) + 1, 0) FROM blocks").fetchone()[0]
+
+    def __len__(self):
+        return self._height(self._conn())
+
+    def chain_range(self, start=0, stop=None):
+        sql, args = "SELECT data FROM blocks WHERE height >= ?", [start]
+        if stop is not None:
+            sql += " AND height < ?"
+            args.append(stop)
+        rows = self._conn().execute(sql + " ORDER BY height", args)
+        return [json.loads(d) for (d,) in rows]
+
+    def _tip(self, conn):
+        row = conn.execute("SELECT height, data FROM blocks ORDER BY height DESC LIMIT 1").fetchone()
+        return (row[0] + 1, json.loads(row[1])) if row else (0, None)
+
+    def tip(self):
+        return self._tip(self._conn())[1]
+
+    def chain_etag(self):
+        return chain_etag(*self._tip(self._conn()))
+
+    def chain_page(self, from_height=None, limit=PAGE_LIMIT, latest=False, cursor=None):
+        return chain_page(len(self), self.chain_range, from_height, limit, latest, cursor)
+
+    def has_block_for(self, thr_address):
+        # το data ξαναελέγχεται: βάσεις πριν το block_owner έχουν thr_address και σε rewards
+        rows = self._conn().execute("SELECT data FROM blocks WHERE thr_address = ?", (thr_address,))
+        return any(block_owner(json.loads(d)) for (d,) in rows)
+
+    # balances / history
+    def balance(self, address):
+        row = self._conn().execute("SELECT balance FROM balances WHERE address = ?",
+                                   (address,)).fetchone()
+        return round(row[0], 6) if row else 0.0
+
+    def history(self, address, limit=None, before=None):
+        # το limit μετράει chain records (heights), όπως και στο AddressIndex
+        conn = self._conn()
+        match = "(from_addr = ? OR to_addr = ?)"
+        sql, args = f"SELECT DISTINCT height FROM transfers WHERE {match}", [address, address]
+        if before is not None:
+            sql += " AND height < ?"
+            args.append(before)
+        sql += " ORDER BY height DESC"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit + 1)
+        heights = [h for (h,) in conn.execute(sql, args)]
+        more = bool(limit) and len(heights) > limit
+        heights = heights[:limit] if limit else heights
+        if not heights:
+            return [], None
+        rows = conn.execute(
+            f"SELECT data FROM transfers WHERE {match} AND height BETWEEN ? AND ? ORDER BY height, pos",
+            (address, address, heights[-1], heights[0])
+        )
+        return [json.loads(d) for (d,) in rows], (heights[-1] if more else None)
+
+    # pledges
+    def pledges(self, since=0):
+        rows = self._conn().execute("SELECT data FROM pledges ORDER BY id LIMIT -1 OFFSET ?", (since,))
+        return [json.loads(d) for (d,) in rows]
+
+    def pledge_count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM pledges").fetchone()[0]
+
+    def find_pledge(self, btc_address=None, thr_address=None, pledge_hash=None):
+        return self._find_pledge(self._conn(), btc_address, thr_address, pledge_hash)
+
+    def _find_pledge(self, conn, btc_address=None, thr_address=None, pledge_hash=None):
+        wanted = [(f, v) for f, v in (("btc_address", btc_address), ("thr_address", thr_address),
+                                      ("pledge_hash", pledge_hash)) if v]
+        if not wanted:
+            return None
+        where = " AND ".join(f"{f} = ?" for f, _ in wanted)
+        row = conn.execute(f"SELECT data FROM pledges WHERE {where} ORDER BY id LIMIT 1",
+                           [v for _, v in wanted]).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_pledge(self, pledge):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = self._find_pledge(conn, pledge["btc_address"])
+            if existing is None:
+                self._insert_pledge(conn, pledge)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return (existing, False) if existing is not None else (pledge, True)
+
+    def _insert_pledge(self, conn, pledge):
+        conn.execute(
+            "INSERT INTO pledges(btc_address, thr_address, pledge_hash, timestamp, data) VALUES (?,?,?,?,?)",
+            (pledge["btc_address"], pledge.get("thr_address"), pledge.get("pledge_hash"),
+             pledge.get("timestamp"), json.dumps(pledge))
+        )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """The process-wide backend chosen by THRONOS_STORAGE (json | sqlite)."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "sqlite":
+                _storage = SqliteStorage(DB_FILE)
+            elif STORAGE_BACKEND == "json":
+                _storage = JsonStorage()
+            else:
+                raise ValueError(f"Unknown THRONOS_STORAGE backend: {STORAGE_BACKEND}")
+        return _storage
+
+
+def migrate_json_to_sqlite(db_path=DB_FILE, force=False):
+    """
+    One-shot import of phantom_tx_chain.json (+ log), the ledger and
+    pledge_chain.json into a SQLite database.
+
+    Balances are copied from the ledger as it stands (snapshot + chain
+    replay) rather than re-derived, so off-chain credits survive.
+    """
+    src = JsonStorage()
+    db = SqliteStorage(db_path)
+    conn = db._conn()
+    if len(db) and not force:
+        raise SystemExit(f"{db_path} already has {len(db)} blocks; use --force to import anyway")
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if force:
+            conn.execute("DELETE FROM transfers")
+            conn.execute("DELETE FROM blocks")
+            conn.execute("DELETE FROM balances")
+            conn.execute("DELETE FROM pledges")
+        for h, rec in enumerate(src.chain_all()):
+            db._insert_block(conn, h, rec)
+        conn.execute("DELETE FROM balances")
+        with src.ledger._lock:
+            balances = dict(src.ledger.balances)
+        conn.executemany("INSERT INTO balances(address, balance) VALUES (?, ?)", balances.items())
+        for p in src.pledges():
+            db._insert_pledge(conn, p)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    print(f"✅ Imported {len(db)} blocks, {len(balances)} balances, "
+          f"{len(db.pledges())} pledges into {db_path}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Thronos storage tools")
+    sub = parser.add_subparsers(dest="cmd")
+    m = sub.add_parser("migrate", help="Import the JSON files into SQLite")
+    m.add_argument("--db", default=DB_FILE, help="SQLite database path")
+    m.add_argument("--force", action="store_true", help="Replace existing data in the database")
+    args = parser.parse_args()
+    if args.cmd == "migrate":
+        migrate_json_to_sqlite(args.db, args.force)
+    else:
+        parser.print_help()
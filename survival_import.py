@@ -1,17 +1,16 @@
-import requests, time, json
+import time, json
+import http_client
+from pledge_registry import open_registry
 
 PLEDGE_CHAIN = "pledge_chain.json"
 SUBMIT_URL   = "https://thrchain.up.railway.app/submit_block"
 
 def load_pledges():
-    try:
-        return json.load(open(PLEDGE_CHAIN))
-    except:
-        return []
+    return open_registry(PLEDGE_CHAIN).all()
 
 def get_thr_address(btc_address):
-    pledges = load_pledges()
-    p = next((p for p in pledges if p["btc_address"]==btc_address), None)
+    # index lookup, χωρίς ξαναδιάβασμα του αρχείου
+    p = open_registry(PLEDGE_CHAIN).find(btc_address=btc_address)
     return p["thr_address"] if p else None
 
 def start_worker():
@@ -26,7 +25,7 @@ def start_worker():
             "block_hash":        f"THR-survival-{int(time.time())}"
         }
         try:
-            r = requests.post(SUBMIT_URL, json=payload, timeout=15)
+            r = http_client.post(SUBMIT_URL, json=payload, timeout=15)
             print("⇨", r.status_code, r.json())
         except Exception as e:
             print("✖️", e)
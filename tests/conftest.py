@@ -0,0 +1,18 @@
+# conftest.py - Flat repo layout: make the top-level modules importable from tests/
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def json_store(tmp_path):
+    """JsonStorage on fresh files under tmp_path."""
+    from storage import JsonStorage
+    store = JsonStorage(str(tmp_path / "chain.json"), str(tmp_path / "ledger.json"),
+                        str(tmp_path / "chain.idx"), str(tmp_path / "pledges.json"))
+    store.chain.fsync = False
+    yield store
+    store.close()
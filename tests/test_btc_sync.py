@@ -0,0 +1,60 @@
+# test_btc_sync.py - A poll capped at max_pages keeps a resume cursor instead of skipping pages
+from btc_sync import AddressSync, CHAIN_PAGE
+
+ADDRESS = "bc1qtest"
+
+
+class PagedHistory:
+    """Esplora /address/<a>/txs paging over a confirmed history, newest first."""
+
+    def __init__(self):
+        self.txs = []
+        self.requests = 0
+
+    def add(self, n):
+        height = self.txs[0]["status"]["block_height"] if self.txs else 100
+        for _ in range(n):
+            height += 1
+            self.txs.insert(0, {"txid": f"tx{len(self.txs):05d}",
+                                "status": {"confirmed": True, "block_height": height}})
+
+    def get(self, path):
+        self.requests += 1
+        if path == f"/address/{ADDRESS}/txs":
+            return self.txs[:CHAIN_PAGE]
+        last = path.rsplit("/", 1)[1]
+        i = next(i for i, tx in enumerate(self.txs) if tx["txid"] == last)
+        return self.txs[i + 1:i + 1 + CHAIN_PAGE]
+
+
+def test_capped_poll_resumes_from_cursor(tmp_path):
+    history = PagedHistory()
+    history.add(10)
+    sync = AddressSync(str(tmp_path / "s.json"), str(tmp_path / "p.txt"), max_pages=2)
+    sync._get = history.get
+    seen = []
+    sync.sync(ADDRESS, lambda tx: seen.append(tx["txid"]))
+    assert len(seen) == 10
+
+    history.add(CHAIN_PAGE * 5)          # 5 σελίδες πίσω, 2 ανά poll
+    polls = 0
+    while len(seen) < len(history.txs):
+        polls += 1
+        assert sync.sync(ADDRESS, lambda tx: seen.append(tx["txid"])) > 0
+    assert sorted(seen) == sorted(tx["txid"] for tx in history.txs)
+    assert len(set(seen)) == len(seen)
+    assert polls == 4      # 2 σελίδες, μετά head + 1 σελίδα του gap ανά poll
+    assert sync.sync(ADDRESS, seen.append) == 0      # κλείνει το gap στο παλιό watermark
+    assert sync.watermark(ADDRESS) == {"txid": history.txs[0]["txid"],
+                                       "height": history.txs[0]["status"]["block_height"]}
+
+    # τα gaps επιβιώνουν ένα restart
+    history.add(CHAIN_PAGE * 3)
+    sync.sync(ADDRESS, lambda tx: seen.append(tx["txid"]))
+    assert sync.watermark(ADDRESS)["gaps"]
+    again = AddressSync(str(tmp_path / "s.json"), str(tmp_path / "p.txt"), max_pages=2)
+    again._get = history.get
+    again.sync(ADDRESS, lambda tx: seen.append(tx["txid"]))
+    assert again.sync(ADDRESS, seen.append) == 0
+    assert sorted(seen) == sorted(tx["txid"] for tx in history.txs)
+    assert "gaps" not in again.watermark(ADDRESS)
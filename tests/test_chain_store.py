@@ -0,0 +1,68 @@
+# test_chain_store.py - ChainLog round trips and linked appends under concurrent writers
+import threading
+
+from chain_store import ChainLog
+from block_builder import link_record, record_hash, header_hash
+from chain_verifier import ChainVerifier, _ListChain
+
+
+def test_append_and_reopen(tmp_path):
+    path = str(tmp_path / "chain.json")
+    chain = ChainLog(path, fsync=False)
+    records = [{"thr_address": f"THR{i}", "reward_to_miner": 1.0} for i in range(25)]
+    for rec in records[:10]:
+        chain.append(rec)
+    assert chain.extend(records[10:]) == list(range(10, 25))
+    chain.close()
+
+    again = ChainLog(path, fsync=False)
+    assert again.all() == records
+    assert again.tip() == records[-1]
+    assert again.range(5, 8) == records[5:8]
+
+
+def test_compact_then_reopen(tmp_path):
+    path = str(tmp_path / "chain.json")
+    chain = ChainLog(path, fsync=False)
+    chain.extend([{"n": i} for i in range(10)])
+    chain.compact()
+    chain.append({"n": 10})
+    chain.close()
+    assert ChainLog(path, fsync=False).all() == [{"n": i} for i in range(11)]
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "chain.json")
+    chain = ChainLog(path, fsync=False)
+    chain.extend([{"n": 0}, {"n": 1}])
+    chain.close()
+    with open(path + ".log", "ab") as f:
+        f.write(b'{"h":2,"r":{"n"')     # crash στη μέση μιας εγγραφής
+    again = ChainLog(path, fsync=False)
+    assert again.all() == [{"n": 0}, {"n": 1}]
+    again.append({"n": 2})
+    assert ChainLog(path, fsync=False).all() == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+
+def test_threaded_linked_appends_keep_previous_hash(tmp_path):
+    chain = ChainLog(str(tmp_path / "chain.json"), fsync=False)
+    chain.append(link_record({"genesis": True}, None))
+
+    def writer(w):
+        for i in range(50):
+            chain.append({"writer": w, "i": i}, prepare=lambda h, rec: link_record(rec, chain.tip()))
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    records = chain.all()
+    assert len(records) == 1 + 8 * 50
+    for h in range(1, len(records)):
+        assert records[h]["previous_hash"] == record_hash(records[h - 1])
+        assert records[h]["hash"] == header_hash(records[h])
+    report = ChainVerifier(_ListChain(records), str(tmp_path / "cp.json"), workers=1).verify(full=True)
+    assert report["ok"], report["errors"]
+
@@ -0,0 +1,61 @@
+# test_contract_pdf.py - Rendered contracts read back with PyPDF2 and checked by ContractValidator
+import io
+
+import pytest
+from PyPDF2 import PdfReader
+
+from contract_pdf import (contract_record, read_record, read_record_file, render_contract,
+                          render_token_contract, RECORD_KEY, SIGNATURE_KEY)
+from contract_validator import ContractValidator, parse_contract_text
+from pledge_registry import open_registry
+
+BTC = "bc1qexamplepledger"
+THR = "THR1700000000000"
+INFO = {"btc_amount": 0.001, "thr_rate": 0.0001, "thr_equivalent": 10.0, "timestamp": "2026-01-01 00:00:00 UTC"}
+TEXTS = {
+    "ascii":    "I pledge to keep the fire of the Thronos chain burning (and pay in BTC).",
+    "latin-1":  "Je m'engage à garder le feu de la chaîne Thronos allumé — déjà payé.",
+    "greek":    "Δεσμεύομαι να κρατήσω τη φωτιά της αλυσίδας Thronos αναμμένη.",
+    "cyrillic": "Я обещаю поддерживать огонь цепочки Thronos.",
+}
+
+
+def render(tmp_path, token, text):
+    path = str(tmp_path / "contract.pdf")
+    if token:
+        render_token_contract(path, BTC, text, THR, INFO, "pledgehash")
+    else:
+        render_contract(path, BTC, text, THR, "pledgehash")
+    return path
+
+
+@pytest.mark.parametrize("token", [False, True], ids=["plain", "token"])
+@pytest.mark.parametrize("lang", sorted(TEXTS))
+def test_pypdf2_reads_text_and_record(tmp_path, token, lang):
+    path = render(tmp_path, token, TEXTS[lang])
+    with open(path, "rb") as f:
+        reader = PdfReader(io.BytesIO(f.read()))
+    text = reader.pages[0].extract_text()
+    assert " ".join(text.split()).find(TEXTS[lang]) >= 0
+    if token:
+        fields = parse_contract_text(text)
+        assert (fields["btc_address"], fields["thr_address"]) == (BTC, THR)
+        assert fields["verification_hash"] == contract_record(BTC, THR)["verification_hash"]
+
+    record = contract_record(BTC, THR, "pledgehash")
+    meta = reader.metadata
+    assert read_record({RECORD_KEY: meta[RECORD_KEY], SIGNATURE_KEY: meta.get(SIGNATURE_KEY, "")}, key="") == record
+    assert read_record_file(path, key="") == record     # από το tail, χωρίς parser
+
+
+@pytest.mark.parametrize("lang", ["ascii", "greek"])
+def test_contract_validator_accepts_rendered_contract(tmp_path, lang):
+    pledges = str(tmp_path / "pledges.json")
+    open_registry(pledges).add({"btc_address": BTC, "thr_address": THR, "pledge_hash": "pledgehash",
+                                "pledge_text": TEXTS[lang], "timestamp": "2026-01-01 00:00:00 UTC"})
+    validator = ContractValidator(contract_path=render(tmp_path, True, TEXTS[lang]), pledge_chain_path=pledges,
+                                  ledger_path=str(tmp_path / "ledger.json"),
+                                  chain_file_path=str(tmp_path / "chain.json"),
+                                  store_path=str(tmp_path / "contracts_store"))
+    ok, message = validator.validate_contract()
+    assert ok, message
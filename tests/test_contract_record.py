@@ -0,0 +1,39 @@
+# test_contract_record.py - Signed contract record: HMAC round trip, tampering, reading it back from the PDF
+import json
+
+import pytest
+
+from contract_pdf import (contract_record, sign_record, read_record, read_record_bytes,
+                          read_record_file, render_contract, RECORD_KEY, SIGNATURE_KEY)
+
+KEY = "test-signing-key"
+
+
+def test_sign_and_read_round_trip():
+    record = contract_record("bc1qexample", "THR1", "pledgehash")
+    info = {RECORD_KEY: json.dumps(record), SIGNATURE_KEY: sign_record(record, KEY)}
+    assert read_record(info, KEY) == record
+
+
+def test_tampered_record_or_wrong_key_raises():
+    record = contract_record("bc1qexample", "THR1", "pledgehash")
+    sig = sign_record(record, KEY)
+    forged = dict(record, thr_address="THR2")
+    with pytest.raises(ValueError):
+        read_record({RECORD_KEY: json.dumps(forged), SIGNATURE_KEY: sig}, KEY)
+    with pytest.raises(ValueError):
+        read_record({RECORD_KEY: json.dumps(record), SIGNATURE_KEY: sig}, "other-key")
+    with pytest.raises(ValueError):
+        read_record({RECORD_KEY: json.dumps(record)}, KEY)
+
+
+def test_no_record_reads_as_none():
+    assert read_record({}, KEY) is None
+    assert read_record_bytes(b"%PDF-1.4 no record here", KEY) is None
+
+
+def test_record_survives_in_rendered_pdf(tmp_path):
+    path = str(tmp_path / "c.pdf")
+    render_contract(path, "bc1qexample", "I pledge.", "THR1", "pledgehash")
+    record = read_record_file(path, key="")
+    assert record == contract_record("bc1qexample", "THR1", "pledgehash")
@@ -0,0 +1,33 @@
+# test_contract_store.py - for_file serves the cached digest only while the file is unchanged
+import os
+
+from contract_pdf import render_contract
+from contract_store import ContractStore, digest_bytes
+
+
+def test_for_file_rehashes_a_replaced_file(tmp_path):
+    store = ContractStore(str(tmp_path / "store"))
+    path = str(tmp_path / "pledge_THR1.pdf")
+    render_contract(path, "bc1qexample", "I pledge.", "THR1", "pledgehash")
+    first = store.for_file(path, thr_address="THR1")
+
+    hashed = []
+    put_file = store.put_file
+    store.put_file = lambda *a, **kw: hashed.append(a) or put_file(*a, **kw)
+    assert store.for_file(path, thr_address="THR1")["digest"] == first["digest"]
+    assert hashed == []                         # αμετάβλητο αρχείο: κανένα re-hash
+
+    render_contract(path, "bc1qexample", "I pledge, again and longer.", "THR1", "pledgehash")
+    second = store.for_file(path, thr_address="THR1")
+    with open(path, "rb") as f:
+        assert second["digest"] == digest_bytes(f.read()) != first["digest"]
+
+    # ίδιο μέγεθος, άλλα bytes: το mtime αρκεί
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    data[-10] ^= 1
+    st = os.stat(path)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert store.for_file(path, thr_address="THR1")["digest"] == digest_bytes(bytes(data))
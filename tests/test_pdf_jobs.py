@@ -0,0 +1,27 @@
+# test_pdf_jobs.py - A worker that dies breaks the pool; PdfJobs replaces it and keeps rendering
+import os
+
+from pdf_jobs import PdfJobs
+
+
+def write_file(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def die(path):
+    os._exit(1)
+
+
+def test_broken_pool_is_replaced(tmp_path):
+    jobs = PdfJobs(workers=1)
+    jobs.submit("crash", str(tmp_path / "crash.pdf"), die)
+    assert jobs.wait(60)
+    crashed = jobs.status("crash")
+    assert crashed["state"] == "failed" and crashed["attempts"] == 2
+
+    jobs.submit("ok", str(tmp_path / "ok.pdf"), write_file, "contract")
+    assert jobs.wait(60)
+    assert jobs.status("ok")["state"] == "done"
+    assert (tmp_path / "ok.pdf").read_text() == "contract"
+    jobs._pool.shutdown()
@@ -0,0 +1,46 @@
+# test_pledge_watcher.py - Two watchers (two workers) on one journal see each other's pledges
+import pytest
+
+from btc_sync import AddressSync
+from pledge_watcher import PledgeWatcher
+
+
+@pytest.fixture
+def open_watcher(tmp_path, json_store):
+    watchers = []
+
+    def make():
+        sync = AddressSync(str(tmp_path / "sync.json"), str(tmp_path / "seen.txt"))
+        w = PledgeWatcher(json_store, "bc1qreceiver", 0.00001, state_path=str(tmp_path / "pending.ndjson"), sync=sync)
+        watchers.append(w)
+        return w
+
+    yield make
+    for w in watchers:
+        w.stop()
+
+
+def test_status_and_compact_see_other_workers(open_watcher):
+    a, b = open_watcher(), open_watcher()
+    first = a.submit("bc1qpledger1", "I pledge")
+    assert b.status(first["id"])["status"] == "pending"
+    assert b.submit("bc1qpledger1", "I pledge")["id"] == first["id"]
+
+    b.compact()                         # δεν χάνει το pledge του a
+    second = a.submit("bc1qpledger2", "I pledge too")
+    b.compact()
+    c = open_watcher()
+    assert {c.status(first["id"])["status"], c.status(second["id"])["status"]} == {"pending"}
+    assert set(c.pending) == {first["id"], second["id"]}
+
+
+def test_verified_by_one_worker_leaves_the_others(open_watcher, json_store):
+    a, b = open_watcher(), open_watcher()
+    entry = a.submit("bc1qpaid", "I pledge")
+    a.credit("bc1qpaid", 0.001)
+    with a._shared():
+        a._verify(a.pending[entry["id"]])
+    st = b.status(entry["id"])
+    assert st["status"] == "verified"
+    assert st["thr_address"] == json_store.find_pledge("bc1qpaid")["thr_address"]
+    assert entry["id"] not in b.pending
@@ -0,0 +1,83 @@
+# test_price_store.py - PriceStore round trips and the legacy JSON import
+import json
+import os
+import threading
+
+from price_store import PriceStore, CandleStore, RECORD
+
+
+def test_append_range_reopen(tmp_path):
+    path = str(tmp_path / "p.f64")
+    store = PriceStore(path)
+    for i in range(100):
+        store.append(1000.0 + i, 1e-5 * (1 + i))
+    assert len(store) == 100
+    assert store.last() == (1099.0, 1e-5 * 100)
+    ts, prices = store.range(1010.0, 1020.0)
+    assert list(ts) == [1010.0 + i for i in range(10)]
+    store.close()
+
+    again = PriceStore(path)
+    assert len(again) == 100
+    assert again.last() == (1099.0, 1e-5 * 100)
+
+
+def test_out_of_order_tick_is_clamped(tmp_path):
+    store = PriceStore(str(tmp_path / "p.f64"))
+    store.append(10.0, 1.0)
+    assert store.append(5.0, 2.0) == 10.0
+    ts, _ = store.range()
+    assert list(ts) == [10.0, 10.0]
+
+
+def test_import_json_is_idempotent(tmp_path):
+    legacy = tmp_path / "price_history.json"
+    legacy.write_text(json.dumps([{"timestamp": 1.0, "thr_in_btc": 1.0},
+                                  {"timestamp": 2.0, "thr_in_btc": 2.0},
+                                  {"timestamp": 2.0, "thr_in_btc": 3.0}]))
+    store = PriceStore(str(tmp_path / "p.f64"))
+    assert store.import_json(str(legacy)) == 3
+    assert store.import_json(str(legacy)) == 0
+    assert len(store) == 3
+
+
+def test_torn_tail_is_cut_on_open(tmp_path):
+    path = str(tmp_path / "p.f64")
+    store = PriceStore(path)
+    store.append(1.0, 1.0)
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 7)            # crash στη μέση ενός record
+    again = PriceStore(path)
+    assert os.path.getsize(path) == RECORD.size
+    again.append(2.0, 2.0)
+    assert list(again.range()[0]) == [1.0, 2.0]
+
+
+def test_import_json_survives_partial_writes(tmp_path, monkeypatch):
+    legacy = tmp_path / "price_history.json"
+    legacy.write_text(json.dumps([{"timestamp": float(i), "thr_in_btc": 1.0} for i in range(50)]))
+    store = PriceStore(str(tmp_path / "p.f64"))
+    write = os.write
+    monkeypatch.setattr(os, "write", lambda fd, data: write(fd, bytes(data[:5])))
+    assert store.import_json(str(legacy)) == 50
+    monkeypatch.undo()
+    assert list(store.range()[0]) == [float(i) for i in range(50)]
+
+
+def test_candle_updates_from_two_handles_are_not_lost(tmp_path):
+    path = str(tmp_path / "p.f64.1m")
+    stores = [CandleStore(path, 60), CandleStore(path, 60)]   # σαν δύο processes: δύο fds, δύο locks
+
+    def tick(store):
+        for i in range(300):
+            store.add(120.0 + i * 0.1, 1.0 + i, 0.5)
+
+    threads = [threading.Thread(target=tick, args=(s,)) for s in stores for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    candles = stores[0].range()
+    assert candles["ticks"].sum() == 1200
+    assert candles["volume"].sum() == 600.0
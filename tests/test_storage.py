@@ -0,0 +1,25 @@
+# test_storage.py - has_block_for counts mined blocks only, on both backends
+import pytest
+
+from storage import SqliteStorage
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path, json_store):
+    if request.param == "json":
+        yield json_store
+    else:
+        db = SqliteStorage(str(tmp_path / "thronos.db"))
+        yield db
+        db.close()
+
+
+def test_has_block_for_ignores_rewards_and_transfers(store):
+    store.extend([
+        {"type": "whisper_reward", "thr_address": "THRwhisper", "reward_to_miner": 0.995},
+        {"type": "transfer", "thr_address": "THRsender", "from": "THRsender", "to": "THRx", "amount": 0.0},
+        {"thr_address": "THRminer", "block_hash": "THR-2", "reward_to_miner": 1.0},
+    ])
+    assert store.has_block_for("THRminer")
+    assert not store.has_block_for("THRwhisper")
+    assert not store.has_block_for("THRsender")
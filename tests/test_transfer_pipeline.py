@@ -0,0 +1,52 @@
+# test_transfer_pipeline.py - Concurrent transfers: no overdraft, no double-spend, linked blocks
+import threading
+
+import pytest
+
+from block_builder import TransferRejected, record_hash
+from transfer_pipeline import TransferPipeline, stress
+
+
+def test_concurrent_transfers_from_one_address_never_overdraft(json_store):
+    json_store.extend([{"thr_address": "THRrich", "reward_to_miner": 1.0}])
+    pipeline = TransferPipeline(json_store)
+    outcome = {"ok": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def client(c):
+        futs = [pipeline.submit({"from": "THRrich", "to": f"THR{c}", "amount": 0.1, "fee": 0.0})
+                for _ in range(10)]
+        for f in futs:
+            try:
+                f.result(10)
+                key = "ok"
+            except TransferRejected:
+                key = "rejected"
+            with lock:
+                outcome[key] += 1
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outcome == {"ok": 10, "rejected": 150}
+    assert json_store.balance("THRrich") == 0.0
+    assert round(sum(json_store.balance(f"THR{c}") for c in range(16)), 6) == 1.0
+
+
+def test_identical_transfers_get_distinct_txids(json_store):
+    json_store.extend([{"thr_address": "THRa", "reward_to_miner": 5.0}])
+    pipeline = TransferPipeline(json_store)
+    txs = [{"from": "THRa", "to": "THRb", "amount": 1.0, "timestamp": "same second"} for _ in range(2)]
+    for f in [pipeline.submit(tx) for tx in txs]:
+        f.result(10)
+    assert txs[0]["txid"] != txs[1]["txid"]
+    chain = json_store.chain_all()
+    assert chain[-1]["previous_hash"] == record_hash(chain[-2])
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_stress_no_double_spend(backend):
+    assert stress(backend, clients=8, per_client=60, senders=5)
@@ -1,55 +1,46 @@
 # token_dynamics.py - Implementation for tracking and displaying Thronos token dynamics
 import os
-import json
 import time
-import hashlib
-import matplotlib.pyplot as plt
+import threading
+from matplotlib.figure import Figure    # Agg canvas, χωρίς pyplot: ασφαλές εκτός main thread
 from datetime import datetime
+from price_store import PriceStore, PriceRollups, RESOLUTIONS
+
+# ─── CONFIG ────────────────────────────────────────
+# φάκελος δεδομένων (price history, static/, contracts/)· default ο φάκελος του repo
+DATA_DIR = os.getenv("THRONOS_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+CHART_ROWS = 500    # candles ανά chart / ανά απάντηση του /api/token/candles
 
 class TokenDynamics:
     """System to track and display token value during pledges"""
     
-    def __init__(self, base_dir="/data/chats/xzfmy/workspace/thronosChain/thronosChain-main"):
+    def __init__(self, base_dir=DATA_DIR):
         self.base_dir = base_dir
-        self.price_history_file = os.path.join(base_dir, "price_history.json")
+        self.price_history_file = os.path.join(base_dir, "price_history.json")   # legacy, imported once
         self.initial_thr_value = 0.00001  # 1 THR = 0.00001 BTC initially
-        self.price_history = self.load_price_history()
+        self.prices = self.load_price_history()
+        self.candles = PriceRollups(self.prices)   # 1m/5m/1h/1d OHLC, ενημερώνονται ανά tick
         
     def load_price_history(self):
-        """Load price history from file or create empty history if file doesn't exist"""
-        try:
+        """
+        Open the binary price store; on first use import the legacy JSON
+        history, or seed the initial price point for bootstrapping
+        """
+        prices = PriceStore(os.path.join(self.base_dir, "price_history.f64"))
+        if not len(prices):
             if os.path.exists(self.price_history_file):
-                with open(self.price_history_file, 'r') as f:
-                    return json.load(f)
-            else:
-                # Create initial price point for bootstrapping
-                initial_history = [
-                    {
-                        'timestamp': time.time(),
-                        'thr_in_btc': self.initial_thr_value,
-                        'wbtc_reserves': 1.0,  # Placeholder 
-                        'wthr_reserves': 100000.0  # 1 BTC = 100,000 THR initially
-                    }
-                ]
-                with open(self.price_history_file, 'w') as f:
-                    json.dump(initial_history, f)
-                return initial_history
-        except Exception as e:
-            print(f"Error loading price history: {e}")
-            return []
-            
-    def save_price_history(self):
-        """Save price history to file"""
-        with open(self.price_history_file, 'w') as f:
-            json.dump(self.price_history, f, indent=2)
+                try:
+                    prices.import_json(self.price_history_file)
+                except (ValueError, OSError) as e:
+                    print(f"Error importing price history: {e}")
+            if not len(prices):
+                prices.append(time.time(), self.initial_thr_value)
+        return prices
             
     def get_current_thr_value(self):
         """Get current THR value in BTC"""
-        if not self.price_history:
-            return self.initial_thr_value
-        
-        latest_price = self.price_history[-1]
-        return latest_price.get('thr_in_btc', self.initial_thr_value)
+        last = self.prices.last()
+        return last[1] if last else self.initial_thr_value
     
     def update_thr_value(self, btc_amount=None, thr_equivalent=None):
         """
@@ -69,46 +60,66 @@ class TokenDynamics:
             price_change = random.uniform(-0.03, 0.03) 
             thr_in_btc = last_price * (1 + price_change)
         
-        # Add the new price point
-        self.price_history.append({
-            'timestamp': current_time,
-            'thr_in_btc': thr_in_btc,
-            'update_source': 'pledge_transaction'
-        })
-        
-        # Keep only last 1000 price points to manage file size
-        if len(self.price_history) > 1000:
-            self.price_history = self.price_history[-1000:]
-            
-        self.save_price_history()
+        # One fixed-size record appended (the full history is kept), folded into the candles
+        stored_at = self.prices.append(current_time, thr_in_btc)
+        self.candles.add(stored_at, thr_in_btc, btc_amount if btc_amount is not None else 0.0)
         return thr_in_btc
     
+    def get_candles(self, res=None, start=None, end=None, max_rows=CHART_ROWS):
+        """
+        OHLC candles as (resolution, list of dicts) for [start, end).
+        Without ``res`` the finest resolution that fits ``max_rows`` is used;
+        without ``start`` the last ``max_rows`` periods are returned
+        """
+        end = time.time() if end is None else end
+        if res is None:
+            res = self.candles.best_resolution(start if start is not None else end - 7 * 86400, end, max_rows)
+        if res not in RESOLUTIONS:
+            raise ValueError(f"res must be one of {', '.join(RESOLUTIONS)}")
+        if start is None:
+            start = end - max_rows * RESOLUTIONS[res]
+        c = self.candles.candles(res, start, end)[-max_rows:]
+        return res, [
+            {"t": s, "o": o, "h": h, "l": l, "c": cl, "v": v, "n": int(n)}
+            for s, o, h, l, cl, v, n in zip(c["start"].tolist(), c["open"].tolist(), c["high"].tolist(),
+                                            c["low"].tolist(), c["close"].tolist(), c["volume"].tolist(),
+                                            c["ticks"].tolist())
+        ]
+    
+    def chart_key(self, days=7):
+        """What a chart of the last ``days`` depends on: (newest tick timestamp, window)."""
+        last = self.prices.last()
+        return (last[0] if last else None, days)
+    
     def generate_price_chart(self, days=7, output_file=None):
-        """Generate price chart for the specified days"""
+        """Generate price chart for the specified days (written atomically)"""
         if not output_file:
             output_file = os.path.join(self.base_dir, "static", "thr_price_chart.png")
             os.makedirs(os.path.dirname(output_file), exist_ok=True)
             
-        # Filter price history for the requested time period
+        # Pre-aggregated candles for the requested time period (a few hundred rows, any span)
         now = time.time()
         cutoff = now - (days * 24 * 60 * 60)
-        recent_history = [p for p in self.price_history if p.get('timestamp', 0) > cutoff]
+        candles = self.candles.candles(self.candles.best_resolution(cutoff, now, CHART_ROWS), cutoff)
         
-        if not recent_history:
+        if not len(candles):
             return None
             
-        timestamps = [datetime.fromtimestamp(entry.get('timestamp', 0)) for entry in recent_history]
-        prices = [entry.get('thr_in_btc', 0) for entry in recent_history]
+        timestamps = [datetime.fromtimestamp(t) for t in candles["start"]]
+        prices = candles["close"]
         
-        plt.figure(figsize=(10, 6))
-        plt.plot(timestamps, prices, 'b-')
-        plt.title(f'THR/BTC Price (Last {days} Days)')
-        plt.xlabel('Date')
-        plt.ylabel('THR Price in BTC')
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(output_file)
-        plt.close()
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        ax.plot(timestamps, prices, 'b-')
+        ax.set_title(f'THR/BTC Price (Last {days} Days)')
+        ax.set_xlabel('Date')
+        ax.set_ylabel('THR Price in BTC')
+        ax.grid(True)
+        fig.tight_layout()
+        # temp file + rename: ένα request δεν βλέπει ποτέ μισογραμμένο PNG
+        tmp = f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fig.savefig(tmp, format="png")
+        os.replace(tmp, output_file)
         
         return output_file
     
@@ -127,101 +138,18 @@ class TokenDynamics:
             'timestamp': time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
         }
 
-# Function to enhance the PDF contract generation to include THR value information
-def enhance_pdf_contract(btc_address, pledge_text, thr_address, filename, token_value_info):
-    """Enhanced PDF contract generator that includes token dynamics"""
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.units import inch
-    
-    contracts_dir = "/data/chats/xzfmy/workspace/thronosChain/thronosChain-main/contracts"
+# Enhanced PDF contract: the token-dynamics layout of contract_pdf's cached template
+def enhance_pdf_contract(btc_address, pledge_text, thr_address, filename, token_value_info,
+                         contracts_dir=os.path.join(DATA_DIR, "contracts"), pledge_hash=None):
+    """Enhanced PDF contract generator that includes token dynamics, written to ``contracts_dir/filename``"""
     os.makedirs(contracts_dir, exist_ok=True)
-    pdf_path = os.path.join(contracts_dir, filename)
-    
-    # Create PDF with ReportLab
-    c = canvas.Canvas(pdf_path, pagesize=letter)
-    width, height = letter
-    
-    # Add title and header
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(1*inch, height-1*inch, "THRONOS BLOCKCHAIN CONTRACT")
-    
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, height-1.5*inch, f"Contract ID: {hashlib.sha256(thr_address.encode()).hexdigest()[:12]}")
-    c.drawString(1*inch, height-1.8*inch, f"Date: {time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime())}")
-    
-    # Divider line
-    c.setStrokeColorRGB(0.8, 0.8, 0.8)
-    c.line(1*inch, height-2*inch, width-1*inch, height-2*inch)
-    
-    # Contract information
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, height-2.5*inch, "BTC Address:")
-    c.setFont("Helvetica", 12)
-    c.drawString(1*inch, height-2.8*inch, btc_address)
-    
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, height-3.3*inch, "Pledge Text:")
-    c.setFont("Helvetica", 12)
-    
-    # Handle large pledge texts with wrapping
-    text_object = c.beginText(1*inch, height-3.6*inch)
-    text_object.setFont("Helvetica", 12)
-    
-    # Split text into lines with maximum 80 characters
-    lines = []
-    words = pledge_text.split()
-    current_line = ""
-    
-    for word in words:
-        if len(current_line + " " + word) <= 80:
-            current_line += (" " + word if current_line else word)
-        else:
-            lines.append(current_line)
-            current_line = word
-    
-    if current_line:
-        lines.append(current_line)
-    
-    for line in lines:
-        text_object.textLine(line)
-    
-    c.drawText(text_object)
-    
-    # Divider line
-    y_pos = height-3.6*inch - (len(lines) * 14) - 0.5*inch
-    c.setStrokeColorRGB(0.8, 0.8, 0.8)
-    c.line(1*inch, y_pos, width-1*inch, y_pos)
-    
-    # THR Address section
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, y_pos - 0.4*inch, "Generated THR Address:")
-    c.setFont("Helvetica", 12)
-    c.drawString(1*inch, y_pos - 0.7*inch, thr_address)
-    
-    # Add the token dynamics section - New feature
-    y_pos = y_pos - 1.2*inch
-    c.setStrokeColorRGB(0.8, 0.8, 0.8)
-    c.line(1*inch, y_pos, width-1*inch, y_pos)
-    
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(1*inch, y_pos - 0.4*inch, "Token Dynamics Information:")
-    
-    c.setFont("Helvetica", 10)
-    c.drawString(1*inch, y_pos - 0.7*inch, f"BTC Amount: {token_value_info.get('btc_amount', 'N/A')} BTC")
-    c.drawString(1*inch, y_pos - 0.9*inch, f"Current THR Value: {token_value_info.get('thr_rate', 'N/A')} BTC")
-    c.drawString(1*inch, y_pos - 1.1*inch, f"Equivalent THR: {token_value_info.get('thr_equivalent', 'N/A')} THR")
-    c.drawString(1*inch, y_pos - 1.3*inch, f"Valuation Timestamp: {token_value_info.get('timestamp', 'N/A')}")
-    
-    # Add signature
-    c.setFont("Helvetica-Oblique", 10)
-    c.drawString(1*inch, 1*inch, "This contract is digitally signed and stored on the Thronos blockchain.")
-    c.drawString(1*inch, 0.8*inch, f"Verification Hash: {hashlib.sha256((btc_address + thr_address).encode()).hexdigest()}")
-    
-    # Finalize PDF
-    c.save()
-    
-    return pdf_path
+    return render_enhanced_contract(os.path.join(contracts_dir, filename), btc_address, pledge_text, thr_address,
+                                    token_value_info, pledge_hash)
+
+def render_enhanced_contract(out, btc_address, pledge_text, thr_address, token_value_info, pledge_hash=None):
+    """The enhance_pdf_contract layout from the cached contract template (with its signed record), written to ``out``"""
+    from contract_pdf import render_token_contract
+    return render_token_contract(out, btc_address, pledge_text, thr_address, token_value_info, pledge_hash)
 
 # Demonstration of usage
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+# transfer_pipeline.py - Queued THR transfers, sealed into blocks with one durable commit each
+import os
+import time
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from storage import get_storage
+from ledger_state import record_transactions
+from block_builder import (Mempool, BlockBuilder, TransferRejected, record_hash, header_hash,
+                           merkle_root, BLOCK_MAX_TXS, BLOCK_MAX_LATENCY)
+
+# ─── CONFIG ────────────────────────────────────────
+MAX_BATCH  = BLOCK_MAX_TXS       # BLOCK_MAX_TXS / BLOCK_MAX_LATENCY_MS στο block_builder.py
+MAX_WAIT   = BLOCK_MAX_LATENCY
+TX_TIMEOUT = 10
+
+
+class TransferPending(Exception):
+    """The transfer is queued but not committed within the timeout; it may still land (``txid`` to poll)."""
+
+    def __init__(self, txid):
+        super().__init__(f"Transfer {txid} still pending")
+        self.txid = txid
+
+
+class TransferPipeline:
+    """
+    Serialises THR transfers through the mempool and commits them as blocks.
+
+    HTTP handlers call ``submit(tx)`` and wait on the returned Future. The
+    block builder drains the mempool in FIFO order, so transfers from the
+    same sender are validated in the order they arrived, and seals each
+    batch into one hashed block inside the storage write transaction
+    (chain append lock + file lock for JSON, ``BEGIN IMMEDIATE`` for
+    SQLite). Balances are debited from the committed block, so a sender
+    can never spend the same balance twice.
+    """
+
+    def __init__(self, store=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.store = store if store is not None else get_storage()
+        self.mempool = Mempool()
+        self.builder = BlockBuilder(self.store, self.mempool, max_batch, max_wait)
+        self.stats = self.builder.stats
+
+    def submit(self, tx):
+        """Queue a ``{"from", "to", "amount", "fee", ...}`` record; the Future resolves to it once committed."""
+        return self.mempool.add(tx)     # το Mempool.add βάζει nonce + txid (μία φορά)
+
+    def transfer(self, tx, timeout=TX_TIMEOUT):
+        """
+        Submit and wait. Raises TransferRejected if validation fails, or
+        TransferPending if the block has not committed within ``timeout``.
+        """
+        fut = self.submit(tx)
+        try:
+            return fut.result(timeout)
+        except FutureTimeout:
+            raise TransferPending(tx["txid"]) from None
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def open_pipeline(store=None):
+    """Shared TransferPipeline per storage backend."""
+    store = store if store is not None else get_storage()
+    with _pipelines_lock:
+        if id(store) not in _pipelines:
+            _pipelines[id(store)] = TransferPipeline(store)
+        return _pipelines[id(store)]
+
+
+def stress(backend="json", clients=32, per_client=500, senders=20):
+    """
+    Concurrent clients hammering a few hot senders with transfers worth more
+    than their balance. Checks that no balance goes negative, that accepted
+    transfers match the chain and that THR is conserved minus fees.
+    """
+    import random
+    import tempfile
+    from storage import JsonStorage, SqliteStorage
+
+    fee = 0.0015
+    with tempfile.TemporaryDirectory() as tmp:
+        if backend == "sqlite":
+            store = SqliteStorage(os.path.join(tmp, "thronos.db"))
+        else:
+            p = lambda name: os.path.join(tmp, name)
+            store = JsonStorage(p("chain.json"), p("ledger.json"), p("chain.idx"), p("pledges.json"))
+            store.chain.compact_every = 10 ** 9
+        addrs = [f"THR{i:06d}" for i in range(senders)]
+        store.extend([{"thr_address": a, "reward_to_miner": 1.0} for a in addrs])
+        minted = len(addrs) * 1.0
+        pipeline = TransferPipeline(store)
+
+        results = {"ok": 0, "rejected": 0}
+        lock = threading.Lock()
+
+        def client():
+            ok = rej = 0
+            futs = []
+            for _ in range(per_client):
+                frm, to_ = random.sample(addrs, 2)
+                futs.append(pipeline.submit({"from": frm, "to": to_, "amount": 0.05, "fee": fee}))
+            for f in futs:
+                try:
+                    f.result(TX_TIMEOUT)
+                    ok += 1
+                except TransferRejected:
+                    rej += 1
+            with lock:
+                results["ok"] += ok
+                results["rejected"] += rej
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+
+        chain = store.chain_all()
+        transfers = [tx for r in chain for tx in record_transactions(r) if "from" in tx]
+        linked = all(
+            b["previous_hash"] == record_hash(chain[h - 1]) and b["hash"] == header_hash(b)
+            and b["merkle_root"] == merkle_root([tx["txid"] for tx in b["transactions"]])
+            for h, b in enumerate(chain) if h and b.get("type") == "block"
+        )
+        balances = {a: store.balance(a) for a in addrs}
+        total = round(sum(balances.values()), 6)
+        expected = round(minted - len(transfers) * fee, 6)
+        negative = [a for a, b in balances.items() if b < 0]
+        n = clients * per_client
+        print(f"[{backend}] {n} transfers from {clients} clients in {elapsed:.2f}s → {n / elapsed:,.0f} tx/s "
+              f"({pipeline.stats['blocks']} blocks)")
+        print(f"accepted {results['ok']}, rejected {results['rejected']}, on chain {len(transfers)}")
+        print(f"negative balances: {len(negative)}, supply {total} (expected {expected}), blocks linked: {linked}")
+        ok = not negative and linked and len(transfers) == results["ok"] and abs(total - expected) < 1e-4
+        print("✅ no double-spends" if ok else "❌ invariant violated")
+        store.close()
+        return ok
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "stress":
+        sys.exit(0 if stress(sys.argv[2] if len(sys.argv) > 2 else "json") else 1)
+    print("Usage: python transfer_pipeline.py stress [json|sqlite]")
@@ -0,0 +1,175 @@
+# tx_index.py - Persistent address → chain height index for wallet lookups
+import os
+import json
+import bisect
+import threading
+from collections import defaultdict
+
+from chain_store import open_chain, CHAIN_FILE, _FileLock
+from ledger_state import record_transactions
+
+# ─── CONFIG ────────────────────────────────────────
+INDEX_FILE = "phantom_tx_chain.idx"
+
+
+def record_addresses(record):
+    """Addresses a chain record shows up under in a wallet history (sender / recipient of its transfers)."""
+    addrs = []
+    for tx in record_transactions(record):
+        if not isinstance(tx, dict):
+            continue
+        for key in ("from", "to"):
+            a = tx.get(key)
+            if a and a not in addrs:
+                addrs.append(a)
+    return addrs
+
+
+def address_transactions(records, address):
+    """Flatten chain records into the transfers ``address`` took part in."""
+    return [tx for rec in records for tx in record_transactions(rec)
+            if isinstance(tx, dict) and address in (tx.get("from"), tx.get("to"))]
+
+
+class AddressIndex:
+    """
+    Secondary index from THR address to the heights of its chain records.
+
+    Kept in memory as one sorted list of heights per address and persisted
+    as an append-only file with one ``[height, [addresses]]`` line per
+    indexed record. The index follows the ChainLog, so every appended
+    block or transfer is indexed as it is written; on startup only records
+    past the last indexed height are scanned. ``rebuild()`` recreates it
+    from the chain.
+
+    The file is shared by every process on the chain (gunicorn workers,
+    scripts). A line is appended under a flock on ``<index>.lock``, after
+    reading what the others appended, and only if no process wrote that
+    height yet — so each record is indexed once, not once per process.
+    """
+
+    def __init__(self, path=INDEX_FILE, chain=None):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.chain = chain if chain is not None else open_chain(CHAIN_FILE)
+        self.height = 0
+        self._heights = defaultdict(list)
+        self._offset = 0                 # bytes του αρχείου που έχουμε ήδη διαβάσει
+        self._lock = threading.RLock()
+
+        with self._lock, _FileLock(self.lock_path):
+            self._tail(repair=True)
+        if self.height > len(self.chain):
+            self.rebuild()  # το chain αντικαταστάθηκε από κάτι μικρότερο
+        self.chain.subscribe(self._on_record, since=self.height)
+
+    def _reset(self):
+        self._heights = defaultdict(list)
+        self.height = 0
+        self._offset = 0
+
+    def _tail(self, repair=False):
+        """Apply index lines appended since the last read (by any process); call with both locks held."""
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < self._offset:
+                    self._reset()   # άλλο process έκανε rebuild
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._reset()
+            return
+        pos = 0
+        while pos < len(data):
+            end = data.find(b"\n", pos)
+            if end < 0:
+                break
+            try:
+                h, addrs = json.loads(data[pos:end])
+            except ValueError:
+                break
+            if h >= self.height:
+                for a in addrs:
+                    self._heights[a].append(h)
+                self.height = h + 1
+            pos = end + 1
+        self._offset += pos
+        if repair and pos < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(self._offset)  # μισογραμμένη γραμμή από crash
+
+    def _on_record(self, height, record):
+        with self._lock:
+            if height != self.height:
+                return
+            addrs = record_addresses(record)
+            if not addrs:
+                self.height = height + 1
+                return
+            with _FileLock(self.lock_path):
+                self._tail()
+                if self.height > height:
+                    return  # το έγραψε ήδη άλλο process
+                line = (json.dumps([height, addrs]) + "\n").encode()
+                with open(self.path, "ab") as f:
+                    f.write(line)
+                self._offset += len(line)
+            for a in addrs:
+                self._heights[a].append(height)
+            self.height = height + 1
+
+    def rebuild(self):
+        """Drop the index file and re-index the whole chain."""
+        with self._lock, _FileLock(self.lock_path):
+            open(self.path, "w").close()
+            self._reset()
+        # ό,τι γραφτεί στο μεταξύ το πιάνει το replay (τρέχει μέσα στο lock του chain)
+        self.chain.replay(self._on_record, since=0)
+
+    def count(self, address):
+        with self._lock:
+            return len(self._heights.get(address, ()))
+
+    def page(self, address, limit=None, before=None):
+        """
+        Heights of ``address``'s records, oldest first.
+
+        ``before`` restricts to heights below it and ``limit`` keeps only the
+        newest ``limit`` of those. Returns ``(heights, next_before)`` where
+        ``next_before`` is the cursor for the next older page, or None.
+        """
+        with self._lock:
+            heights = self._heights.get(address, [])
+            end = len(heights) if before is None else bisect.bisect_left(heights, before)
+            start = 0 if not limit else max(0, end - limit)
+            page = heights[start:end]
+        return page, (page[0] if start > 0 else None)
+
+    def history(self, address, limit=None, before=None):
+        """
+        Transfers of ``address`` plus the next-page cursor. ``limit`` counts
+        chain records, so a block contributes all of its matching transfers.
+        """
+        heights, next_before = self.page(address, limit, before)
+        return address_transactions(self.chain.get_many(heights), address), next_before
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def open_index(path=INDEX_FILE, chain=None):
+    """Shared AddressIndex per index file."""
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = AddressIndex(path, chain)
+        return _indexes[key]
+
+
+if __name__ == "__main__":
+    import sys
+    # python tx_index.py rebuild
+    index = open_index()
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebuild":
+        index.rebuild()
+    print(f"Indexed {index.height} chain records, {len(index._heights)} addresses")
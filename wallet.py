@@ -1,31 +1,17 @@
 
-import json
 from flask import jsonify
+from storage import get_storage
 
-LEDGER_FILE = "ledger.json"
-CHAIN_FILE = "phantom_tx_chain.json"
-
-def handle_wallet_view(thr_address):
+def handle_wallet_view(thr_address, limit=None, before=None):
     # Υπόλοιπο
-    try:
-        with open(LEDGER_FILE, "r") as f:
-            ledger = json.load(f)
-    except:
-        ledger = {}
-
-    balance = ledger.get(thr_address, 0)
-
-    # Συναλλαγές
-    try:
-        with open(CHAIN_FILE, "r") as f:
-            chain = json.load(f)
-    except:
-        chain = []
+    store = get_storage()
+    balance = store.balance(thr_address)
 
-    txs = [tx for tx in chain if isinstance(tx, dict) and (
-        tx.get("from") == thr_address or tx.get("to") == thr_address)]
+    # Συναλλαγές (από το address index, όχι σάρωση όλου του chain)
+    txs, next_before = store.history(thr_address, limit, before)
 
     return jsonify({
         "balance": round(balance, 6),
-        "transactions": txs
+        "transactions": txs,
+        "next_before": next_before
     })